@@ -0,0 +1,223 @@
+import os
+import glob
+import sqlite3
+import threading
+import numpy as np
+
+# Times a read restarts because another process compacted away the generation it was about to map
+READ_RETRIES = 5
+
+
+class ArrayStore:
+    # Fixed-shape rows appended to one raw file (<path>.<generation>.bin) that readers memory-map,
+    # indexed by key in <path>.sqlite. Rows are only ever appended: a re-put key points at a new row and the
+    # old one stays as garbage until compact(). Every append runs inside an sqlite write transaction, which
+    # also serializes writers across processes; readers see the committed row count, never a torn row.
+    def __init__(self, path, shape, dtype, readonly=False):
+        self.path = path
+        self.shape = tuple(int(n) for n in shape)
+        self.dtype = np.dtype(dtype)
+        self.readonly = readonly
+        self.row_bytes = int(np.prod(self.shape)) * self.dtype.itemsize
+        self.lock = threading.RLock()
+        self._mmap = None
+        self._mapped = (None, 0)
+        db_path = path + ".sqlite"
+        if readonly:
+            self.db = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True, check_same_thread=False, isolation_level=None)
+        else:
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+            self.db = sqlite3.connect(db_path, check_same_thread=False, isolation_level=None)
+            self.db.execute("PRAGMA journal_mode=WAL")
+            self.db.execute("PRAGMA synchronous=NORMAL")
+            self.db.execute("CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value TEXT NOT NULL)")
+            self.db.execute("CREATE TABLE IF NOT EXISTS rows (key TEXT PRIMARY KEY, row INTEGER NOT NULL)")
+            self.db.execute("BEGIN IMMEDIATE")
+            self.db.execute("INSERT OR IGNORE INTO meta VALUES ('dtype', ?)", (self.dtype.str,))
+            self.db.execute("INSERT OR IGNORE INTO meta VALUES ('shape', ?)", (",".join(map(str, self.shape)),))
+            self.db.execute("INSERT OR IGNORE INTO meta VALUES ('count', '0')")
+            self.db.execute("INSERT OR IGNORE INTO meta VALUES ('generation', '0')")
+            self.db.execute("COMMIT")
+        meta = self._meta()
+        if meta["dtype"] != self.dtype.str or meta["shape"] != ",".join(map(str, self.shape)):
+            raise ValueError(f"{path} holds {meta['dtype']} rows of shape ({meta['shape']}), "
+                             f"expected {self.dtype.str} rows of shape {self.shape}")
+
+    @classmethod
+    def open(cls, path, readonly=True):
+        # Existing store, with the dtype and row shape it was created with
+        db = sqlite3.connect(f"file:{path}.sqlite?mode=ro", uri=True)
+        try:
+            meta = dict(db.execute("SELECT name, value FROM meta"))
+        finally:
+            db.close()
+        shape = tuple(int(n) for n in meta["shape"].split(",") if n)
+        return cls(path, shape, meta["dtype"], readonly=readonly)
+
+    def _meta(self):
+        return dict(self.db.execute("SELECT name, value FROM meta"))
+
+    def _data_path(self, generation):
+        return f"{self.path}.{generation}.bin"
+
+    def _state(self):
+        meta = self._meta()
+        return int(meta["generation"]), int(meta["count"])
+
+    def _array(self, generation, count):
+        # Memory map of the first `count` committed rows; remapped only when the store has grown or been compacted
+        if count == 0:
+            return np.empty((0,) + self.shape, dtype=self.dtype)
+        if self._mapped != (generation, count):
+            self._mmap = np.memmap(self._data_path(generation), dtype=self.dtype, mode="r", shape=(count,) + self.shape)
+            self._mapped = (generation, count)
+        return self._mmap
+
+    def __len__(self):
+        with self.lock:
+            return self.db.execute("SELECT COUNT(*) FROM rows").fetchone()[0]
+
+    def __contains__(self, key):
+        with self.lock:
+            return self.db.execute("SELECT 1 FROM rows WHERE key = ?", (key,)).fetchone() is not None
+
+    def keys(self):
+        with self.lock:
+            return [row[0] for row in self.db.execute("SELECT key FROM rows ORDER BY row")]
+
+    def get(self, key):
+        rows, found = self.get_many([key])
+        return rows[0] if found else None
+
+    def _read(self, query):
+        # Runs query() in a read transaction, then maps the generation it saw. Another process may compact
+        # twice in between and delete that file; the read then simply starts over on the new generation.
+        with self.lock:
+            for attempt in range(READ_RETRIES):
+                self.db.execute("BEGIN")
+                try:
+                    generation, count = self._state()
+                    result = query()
+                finally:
+                    self.db.execute("COMMIT")
+                try:
+                    return self._array(generation, count), result
+                except FileNotFoundError:
+                    if attempt == READ_RETRIES - 1:
+                        raise
+
+    def get_many(self, keys):
+        # (array of the rows that exist, their keys in the same order); the array is a copy, safe to keep
+        keys = list(dict.fromkeys(keys))
+
+        def rows_of():
+            row_of = {}
+            for i in range(0, len(keys), 500):
+                chunk = keys[i:i + 500]
+                row_of.update(self.db.execute(
+                    f"SELECT key, row FROM rows WHERE key IN ({','.join('?' * len(chunk))})", chunk
+                ))
+            return row_of
+
+        with self.lock:
+            array, row_of = self._read(rows_of)
+            found = [key for key in keys if key in row_of]
+            if not found:
+                return np.empty((0,) + self.shape, dtype=self.dtype), []
+            return np.asarray(array[[row_of[key] for key in found]]), found
+
+    def snapshot(self):
+        # (keys, read-only memmap of their rows) in row order, without copying the vectors
+        with self.lock:
+            array, pairs = self._read(lambda: self.db.execute("SELECT key, row FROM rows ORDER BY row").fetchall())
+            rows = [row for _, row in pairs]
+            if rows == list(range(len(array))):
+                return [key for key, _ in pairs], array
+            # Garbage rows from re-puts: only the live rows are gathered (a copy until the next compact())
+            return [key for key, _ in pairs], np.asarray(array[rows])
+
+    def put(self, key, array):
+        self.put_many([key], [array])
+
+    def put_many(self, keys, arrays):
+        if self.readonly:
+            raise PermissionError(f"{self.path} is open read-only")
+        keys = list(keys)
+        arrays = np.ascontiguousarray(arrays, dtype=self.dtype).reshape((len(keys),) + self.shape)
+        if not keys:
+            return
+        # Last write wins for keys repeated within the batch
+        last = {key: i for i, key in enumerate(keys)}
+        if len(last) < len(keys):
+            keys, arrays = list(last), arrays[list(last.values())]
+        with self.lock:
+            self.db.execute("BEGIN IMMEDIATE")
+            try:
+                generation, count = self._state()
+                with open(self._data_path(generation), "ab") as f:
+                    # Drop a partial tail left by a writer that died before committing
+                    f.truncate(count * self.row_bytes)
+                    f.write(arrays.tobytes())
+                self.db.executemany(
+                    "INSERT OR REPLACE INTO rows (key, row) VALUES (?, ?)",
+                    [(key, count + i) for i, key in enumerate(keys)],
+                )
+                self.db.execute("UPDATE meta SET value = ? WHERE name = 'count'", (str(count + len(keys)),))
+                self.db.execute("COMMIT")
+            except BaseException:
+                self.db.execute("ROLLBACK")
+                raise
+
+    def delete(self, keys):
+        if self.readonly:
+            raise PermissionError(f"{self.path} is open read-only")
+        with self.lock:
+            self.db.executemany("DELETE FROM rows WHERE key = ?", [(key,) for key in keys])
+
+    def revision(self):
+        # Changes whenever any process puts rows or compacts: a cheap "is there anything new" check
+        with self.lock:
+            return self._state()
+
+    def garbage(self):
+        # Rows no key points at any more
+        with self.lock:
+            return self._state()[1] - len(self)
+
+    def compact(self):
+        # Rewrite the live rows into the next generation's file; readers still mapping the old file keep working
+        if self.readonly:
+            raise PermissionError(f"{self.path} is open read-only")
+        with self.lock:
+            self.db.execute("BEGIN IMMEDIATE")
+            try:
+                generation, count = self._state()
+                pairs = self.db.execute("SELECT key, row FROM rows ORDER BY row").fetchall()
+                array = self._array(generation, count)
+                with open(self._data_path(generation + 1), "wb") as f:
+                    for i in range(0, len(pairs), 4096):
+                        f.write(np.ascontiguousarray(array[[row for _, row in pairs[i:i + 4096]]]).tobytes())
+                self.db.execute("DELETE FROM rows")
+                self.db.executemany("INSERT INTO rows (key, row) VALUES (?, ?)", [(key, i) for i, (key, _) in enumerate(pairs)])
+                self.db.execute("UPDATE meta SET value = ? WHERE name = 'count'", (str(len(pairs)),))
+                self.db.execute("UPDATE meta SET value = ? WHERE name = 'generation'", (str(generation + 1),))
+                self.db.execute("COMMIT")
+            except BaseException:
+                self.db.execute("ROLLBACK")
+                raise
+            self._mmap, self._mapped = None, (None, 0)
+            # The previous generation stays for readers that looked up rows just before the swap; readers that
+            # saw an even older one retry (see _read). Windows refuses to delete a file that is still mapped:
+            # it is removed by a later compact() instead.
+            for old in glob.glob(glob.escape(self.path) + ".*.bin"):
+                try:
+                    if int(old[len(self.path) + 1:-len(".bin")]) < generation:
+                        os.remove(old)
+                except (ValueError, OSError):
+                    pass
+            return count - len(pairs)
+
+    def close(self):
+        with self.lock:
+            self._mmap, self._mapped = None, (None, 0)
+            self.db.close()
@@ -1,92 +1,370 @@
 import os
-import imghdr
-import io
-import cairosvg
-import pillow_avif
-from PIL import Image, ImageOps
+import json
+import hashlib
+import tempfile
+from PIL import Image
 import numpy as np
-import networkx as nx
-import networkx.algorithms.components.connected as nx_conn
 from tqdm import tqdm
-from transformers import AutoProcessor, AutoModel
-import community as community_louvain
 import hnswlib
-import torch
-import igraph as ig
-import leidenalg
+from filelock import FileLock
 import csv
+from collections import Counter, deque
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from logo_index import LogoIndex, INDEX_PATH
+from embedding_backends import as_backend
+from workspace import atomic_output
+from array_store import ArrayStore
+from image_ingest import MissingDecoder, decode_image, pad_to_square, to_pixels, content_key, pixel_store, PIXEL_SIZE
 
-def is_avif(path):
+EMBEDDING_CACHE_PATH = "embedding_cache.npz"
+EMBEDDING_STORE_DIR = os.getenv("EMBEDDING_STORE_DIR", "embedding_store")
+REFERENCE_CLUSTERS_PATH = "clusters.csv"
+HASH_STORE_PATH = os.getenv("LOGO_HASH_STORE", "logo_pixels/hashes")
+SUPPORTED_EXTS = ['.jpg', '.jpeg', '.png', '.webp', '.svg', '.gif', '.avif', '.bmp', '.ico', '.img']
+
+# "cosine" L2-normalizes embeddings so hnswlib's inner-product distance is 1 - cosine similarity
+METRIC_SPACES = {"l2": "l2", "cosine": "ip"}
+DEFAULT_THRESHOLDS = {"l2": 0.92, "cosine": 0.9}
+
+def decode_logo(data, path):
     try:
-        with open(path, "rb") as f:
-            return b"ftypavif" in f.read(32)
-    except:
-        return False
+        return decode_image(data)
+    except MissingDecoder as e:
+        print(f"⚠️ Skipping {path}: {e}")
+    except ValueError as e:
+        print(f"❌ Skipping unreadable file: {path} — Reason: {e}")
+    return None
 
 def load_image(path):
-    ext = os.path.splitext(path)[1].lower()
     try:
-        if ext == '.svg':
-            png_data = cairosvg.svg2png(url=path)
-            return Image.open(io.BytesIO(png_data)).convert("RGB")
-        elif ext in ['.jpg', '.jpeg', '.png', '.webp', '.avif']:
-            return Image.open(path).convert("RGB")
-        elif ext == '.img':
-            if is_avif(path):
-                try:
-                    return Image.open(path).convert("RGB")
-                except Exception as e:
-                    print(f"⚠️ Skipping unreadable AVIF: {path} — {e}")
-                    return None
-            else:
-                real_ext = imghdr.what(path)
-                if real_ext in ['jpeg', 'png', 'webp']:
-                    return Image.open(path).convert("RGB")
-                else:
-                    print(f"⚠️ Skipping unknown .img: {path} (detected: {real_ext})")
-                    return None
-        else:
-            print(f"⚠️ Skipping unsupported extension: {path}")
-            return None
-    except Exception as e:
+        with open(path, "rb") as f:
+            return decode_logo(f.read(), path)
+    except OSError as e:
         print(f"❌ Skipping unreadable file: {path} — Reason: {e}")
         return None
 
-def pad_to_square(image, fill=(255, 255, 255)):
-    w, h = image.size
-    max_dim = max(w, h)
-    delta_w = max_dim - w
-    delta_h = max_dim - h
-    padding = (delta_w // 2, delta_h // 2, delta_w - delta_w // 2, delta_h - delta_h // 2)
-    return ImageOps.expand(image, padding, fill=fill)
+def load_pixels(paths, store=None):
+    # Padded PIXEL_SIZE pixels per path (None if unreadable): from the ingest store when present,
+    # otherwise decoded now and added to the store so the next run doesn't decode them again
+    blobs = []
+    for path in paths:
+        try:
+            with open(path, "rb") as f:
+                blobs.append(f.read())
+        except OSError as e:
+            print(f"❌ Skipping unreadable file: {path} — Reason: {e}")
+            blobs.append(None)
+    keys = [content_key(data) if data is not None else None for data in blobs]
+    stored = {}
+    if store is not None:
+        rows, found = store.get_many([key for key in keys if key])
+        stored = dict(zip(found, rows))
+    pixels = []
+    new_keys, new_pixels = [], []
+    for path, data, key in zip(paths, blobs, keys):
+        # Identical files (shared logos) are decoded once
+        if data is not None and key not in stored:
+            img = decode_logo(data, path)
+            stored[key] = None if img is None else to_pixels(img)
+            if img is not None:
+                new_keys.append(key)
+                new_pixels.append(stored[key])
+        pixels.append(stored.get(key))
+    if store is not None and not store.readonly and new_keys:
+        store.put_many(new_keys, new_pixels)
+    return pixels
+
+def file_sha256(path):
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+def dct_matrix(n):
+    k = np.arange(n)[:, None]
+    x = np.arange(n)[None, :]
+    m = np.cos(np.pi * (2 * x + 1) * k / (2 * n)) * np.sqrt(2 / n)
+    m[0] /= np.sqrt(2)
+    return m
+
+def phash(image, hash_size=8, highfreq_factor=4):
+    n = hash_size * highfreq_factor
+    pixels = np.asarray(image.convert("L").resize((n, n), Image.Resampling.LANCZOS), dtype=np.float64)
+    dct = dct_matrix(n)
+    low = (dct @ pixels @ dct.T)[:hash_size, :hash_size]
+    bits = (low > np.median(low)).ravel()
+    return int("".join("1" if b else "0" for b in bits), 2)
+
+def dhash(image, hash_size=8):
+    pixels = np.asarray(image.convert("L").resize((hash_size + 1, hash_size), Image.Resampling.LANCZOS), dtype=np.int16)
+    bits = (pixels[:, 1:] > pixels[:, :-1]).ravel()
+    return int("".join("1" if b else "0" for b in bits), 2)
+
+def perceptual_hash(path):
+    img = load_image(path)
+    if img is None:
+        return None
+    img = pad_to_square(img)
+    return phash(img), dhash(img)
+
+def hash_logo(path):
+    return file_sha256(path), perceptual_hash(path)
+
+@lru_cache(maxsize=1)
+def hash_store(path=HASH_STORE_PATH):
+    # uint64 (pHash, dHash) rows keyed by the sha256 of the logo file, like the ingest pixel store
+    return ArrayStore(path, (2,), np.uint64)
+
+def load_hashes(image_paths, num_workers=4, store=None):
+    # (sha256, (pHash, dHash) or None) per path; only logos missing from the store are decoded and hashed
+    digests = [file_sha256(p) for p in image_paths]
+    perceptual = {}
+    if store is not None:
+        rows, found = store.get_many(digests)
+        perceptual = {key: (int(p), int(d)) for key, (p, d) in zip(found, rows)}
+    # Identical files (shared logos) are hashed once
+    missing = {digest: path for path, digest in zip(image_paths, digests) if digest not in perceptual}
+    if num_workers > 0 and len(missing) > 1:
+        with ThreadPoolExecutor(max_workers=num_workers) as executor:
+            computed = list(executor.map(perceptual_hash, missing.values()))
+    else:
+        computed = [perceptual_hash(p) for p in missing.values()]
+    perceptual.update(zip(missing, computed))
+    new = [(digest, hashes) for digest, hashes in zip(missing, computed) if hashes is not None]
+    if store is not None and not store.readonly and new:
+        store.put_many([digest for digest, _ in new], np.array([hashes for _, hashes in new], dtype=np.uint64))
+    return [(digest, perceptual[digest]) for digest in digests]
+
+def group_duplicate_logos(image_paths, domains, num_workers=4, store=None):
+    # Byte-identical files, or files whose pHash and dHash both match, share one representative
+    hashes = load_hashes(image_paths, num_workers=num_workers, store=store)
 
-def extract_features_with_padding(image_paths, domains, device, processor, model, batch_size=32):
+    parent = list(range(len(image_paths)))
+
+    def find(i):
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    first_seen = {}
+    for i, (digest, perceptual) in enumerate(hashes):
+        for key in (("sha256", digest), ("perceptual", perceptual)):
+            if key[1] is None:
+                continue
+            j = first_seen.setdefault(key, i)
+            if j != i:
+                parent[find(i)] = find(j)
+
+    groups = {}
+    for i in range(len(image_paths)):
+        groups.setdefault(find(i), []).append(i)
+
+    rep_paths = []
+    rep_domains = []
+    duplicate_groups = {}
+    for root, members in groups.items():
+        rep_paths.append(image_paths[root])
+        rep_domains.append(domains[root])
+        duplicate_groups[domains[root]] = [domains[i] for i in members]
+    print(f"🧬 Hash prefilter: {len(image_paths)} logos -> {len(rep_paths)} unique")
+    return rep_paths, rep_domains, duplicate_groups
+
+def expand_duplicate_embeddings(embeddings, domains, duplicate_groups):
+    rows = []
+    all_domains = []
+    for i, domain in enumerate(domains):
+        for member in duplicate_groups.get(domain, [domain]):
+            rows.append(i)
+            all_domains.append(member)
+    return embeddings[rows], all_domains
+
+def expand_duplicate_clusters(domain_clusters, duplicate_groups):
+    expanded = {}
+    clustered = set()
+    for cluster_id, members in domain_clusters.items():
+        expanded[cluster_id] = [d for rep in members for d in duplicate_groups.get(rep, [rep])]
+        clustered.update(members)
+    # Duplicates of a logo with no similar neighbours still form a cluster of their own
+    next_id = max(expanded, default=-1) + 1
+    for rep, members in duplicate_groups.items():
+        if rep not in clustered and len(members) > 1:
+            expanded[next_id] = list(members)
+            next_id += 1
+    return expanded
+
+def prepare_batch(paths, domains, processor, store=None):
+    batch_imgs = []
+    batch_domains = []
+    for pixels, domain in zip(load_pixels(paths, store), domains):
+        if pixels is None:
+            continue
+        batch_imgs.append(pixels)
+        batch_domains.append(domain)
+    if not batch_imgs:
+        return None, batch_domains
+    return processor(images=batch_imgs, return_tensors="pt"), batch_domains
+
+def iter_prepared_batches(image_paths, domains, processor, batch_size=32, num_workers=4, prefetch=4, store=None):
+    starts = range(0, len(image_paths), batch_size)
+    if num_workers <= 0:
+        for i in starts:
+            yield prepare_batch(image_paths[i:i+batch_size], domains[i:i+batch_size], processor, store)
+        return
+
+    # Decode, pad and preprocess upcoming batches on a worker pool while the caller runs the model
+    starts = iter(starts)
+    pending = deque()
+    with ThreadPoolExecutor(max_workers=num_workers) as executor:
+        def submit_next():
+            i = next(starts, None)
+            if i is not None:
+                pending.append(executor.submit(prepare_batch, image_paths[i:i+batch_size], domains[i:i+batch_size], processor, store))
+
+        try:
+            for _ in range(max(1, prefetch)):
+                submit_next()
+            while pending:
+                batch = pending.popleft().result()
+                submit_next()
+                yield batch
+        finally:
+            for future in pending:
+                future.cancel()
+
+def extract_features_with_padding(image_paths, domains, device, processor, model, batch_size=32, num_workers=4, prefetch=4, progress=True, store=None):
     all_embeddings = []
     valid_domains = []
-    with torch.inference_mode():
-        for i in tqdm(range(0, len(image_paths), batch_size), desc="Extracting features"):
-            batch_imgs = []
-            batch_domains = []
-            for p, domain in zip(image_paths[i:i+batch_size], domains[i:i+batch_size]):
-                img = load_image(p)
-                if img is None:
-                    continue
-                img = pad_to_square(img)
-                batch_imgs.append(img)
-                batch_domains.append(domain)
-            if not batch_imgs:
-                continue
-            inputs = processor(images=batch_imgs, return_tensors="pt").to(device)
-            outputs = model(**inputs).last_hidden_state.mean(dim=1)
-            all_embeddings.append(outputs.cpu().numpy())
-            valid_domains.extend(batch_domains)
+    backend = as_backend(model, device)
+    batches = iter_prepared_batches(image_paths, domains, processor, batch_size=batch_size, num_workers=num_workers, prefetch=prefetch, store=store)
+    total = (len(image_paths) + batch_size - 1) // batch_size
+    for inputs, batch_domains in tqdm(batches, total=total, desc="Extracting features", disable=not progress):
+        if inputs is None:
+            continue
+        all_embeddings.append(backend(inputs["pixel_values"]))
+        valid_domains.extend(batch_domains)
     if not all_embeddings:
         return np.array([]), []
     return np.vstack(all_embeddings), valid_domains
 
-def build_hnsw_index(embeddings, ef=100, ef_construction=200, M=64, save_path=None):
+def embed_image_bytes(data, filename, device, processor, model, metric="l2"):
+    ext = os.path.splitext(filename or "")[1].lower()
+    if ext not in SUPPORTED_EXTS:
+        ext = ".img"
+    with tempfile.NamedTemporaryFile(suffix=ext, delete=False) as f:
+        f.write(data)
+        path = f.name
+    try:
+        embeddings, valid = extract_features_with_padding([path], ["upload"], device, processor, model, num_workers=0, progress=False)
+    finally:
+        os.remove(path)
+    if not valid:
+        return None
+    if metric == "cosine":
+        embeddings = normalize_embeddings(embeddings)
+    return embeddings[0]
+
+def embedding_config_fingerprint(processor, model):
+    # Anything that changes the pixels fed to the model or the pooled output must be part of the key
+    config = {
+        "model": getattr(model.config, "_name_or_path", type(model).__name__),
+        "size": getattr(processor, "size", None),
+        "do_center_crop": getattr(processor, "do_center_crop", None),
+        "do_resize": getattr(processor, "do_resize", None),
+        "image_mean": getattr(processor, "image_mean", None),
+        "image_std": getattr(processor, "image_std", None),
+        "pixels": f"square-white-{PIXEL_SIZE}-bicubic",
+        "pooling": "mean",
+    }
+    backend = getattr(model, "backend_name", "torch")
+    if backend != "torch":
+        config["backend"] = backend
+    return hashlib.sha256(json.dumps(config, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+def logo_cache_key(path, fingerprint):
+    # Formats are detected from the bytes, so the extension doesn't matter
+    h = hashlib.sha256(fingerprint.encode("utf-8"))
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+def load_embedding_cache(cache_path):
+    if not cache_path or not os.path.exists(cache_path):
+        return {}
+    try:
+        with np.load(cache_path) as data:
+            return dict(zip(data["keys"].tolist(), data["embeddings"]))
+    except Exception as e:
+        print(f"⚠️ Ignoring unreadable embedding cache {cache_path}: {e}")
+        return {}
+
+def save_embedding_cache(cache, cache_path):
+    # Concurrent jobs each add their own misses: merge into what is on disk now, under a lock, so none are lost
+    if not cache:
+        return
+    with FileLock(cache_path + ".lock"):
+        merged = load_embedding_cache(cache_path)
+        merged.update(cache)
+        keys = list(merged)
+        with atomic_output(cache_path, "wb") as f:
+            np.savez(f, keys=np.array(keys), embeddings=np.vstack([merged[k] for k in keys]))
+
+def extract_features_cached(image_paths, domains, device, processor, model, batch_size=32, cache_path=EMBEDDING_CACHE_PATH, num_workers=4, prefetch=4, store=None):
+    fingerprint = embedding_config_fingerprint(processor, model)
+    cache = load_embedding_cache(cache_path)
+    keys = [logo_cache_key(p, fingerprint) for p in image_paths]
+    misses = [i for i, key in enumerate(keys) if key not in cache]
+    print(f"🗄️ Embedding cache: {len(keys) - len(misses)} hits, {len(misses)} misses")
+
+    if misses:
+        new_embeddings, new_domains = extract_features_with_padding(
+            [image_paths[i] for i in misses], [domains[i] for i in misses],
+            device, processor, model, batch_size=batch_size, num_workers=num_workers, prefetch=prefetch, store=store
+        )
+        key_by_domain = {domains[i]: keys[i] for i in misses}
+        for domain, embedding in zip(new_domains, new_embeddings):
+            cache[key_by_domain[domain]] = embedding
+        if cache_path and new_domains:
+            save_embedding_cache(cache, cache_path)
+
+    rows = []
+    valid_domains = []
+    for key, domain in zip(keys, domains):
+        if key in cache:
+            rows.append(cache[key])
+            valid_domains.append(domain)
+    if not rows:
+        return np.array([]), []
+    return np.vstack(rows), valid_domains
+
+def open_embedding_store(processor, model, dim, readonly=False, root=EMBEDDING_STORE_DIR):
+    # Raw float32 vectors by domain that every worker memory-maps; one store per embedding config so models never mix
+    fingerprint = embedding_config_fingerprint(processor, model)
+    return ArrayStore(os.path.join(root, fingerprint[:16]), (dim,), np.float32, readonly=readonly)
+
+def store_embeddings(store, domains, embeddings):
+    # Appends only new or changed vectors, compacting once dead rows outnumber live ones
+    embeddings = np.asarray(embeddings, dtype=np.float32)
+    rows, found = store.get_many(domains)
+    current = dict(zip(found, rows))
+    changed = [i for i, domain in enumerate(domains) if domain not in current or not np.array_equal(current[domain], embeddings[i])]
+    if changed:
+        store.put_many([domains[i] for i in changed], embeddings[changed])
+    if store.garbage() > len(store):
+        store.compact()
+    return len(changed)
+
+def normalize_embeddings(embeddings):
+    embeddings = np.asarray(embeddings, dtype=np.float32)
+    norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+    return embeddings / np.maximum(norms, 1e-12)
+
+def build_hnsw_index(embeddings, ef=100, ef_construction=200, M=64, save_path=None, space='l2'):
     dim = embeddings.shape[1]
-    index = hnswlib.Index(space='l2', dim=dim)
+    index = hnswlib.Index(space=space, dim=dim)
     index.init_index(max_elements=len(embeddings), ef_construction=ef_construction, M=M)
     index.add_items(embeddings)
     index.set_ef(ef)
@@ -94,41 +372,65 @@ def build_hnsw_index(embeddings, ef=100, ef_construction=200, M=64, save_path=No
         index.save_index(save_path)
     return index
 
+def update_logo_index(embeddings, domains, index=None, index_path=INDEX_PATH, space='l2'):
+    if index is None:
+        index = LogoIndex.load_or_create(index_path, dim=embeddings.shape[1], space=space)
+    elif index.space != space:
+        raise ValueError(f"Index uses space '{index.space}' but '{space}' was requested")
+    index.upsert(domains, embeddings)
+    if index_path:
+        index.save(index_path)
+    return index
+
 def build_similarity_graph(index, embeddings, k=10, threshold=0.75):
     labels, distances = index.knn_query(embeddings, k=k)
-    G = nx.Graph()
-    for i in range(len(embeddings)):
-        for j, neighbor in enumerate(labels[i]):
-            if i != neighbor:
-                similarity = 1 - distances[i][j]
-                if similarity >= threshold:
-                    G.add_edge(i, neighbor, weight=similarity)
-    return G
+    return build_similarity_graph_from_knn(labels, distances, threshold=threshold)
 
-def graph_to_igraph(G_nx):
-    mapping = {node: idx for idx, node in enumerate(G_nx.nodes())}
-    reverse_mapping = {idx: node for node, idx in mapping.items()}
-    edges = [(mapping[u], mapping[v]) for u, v in G_nx.edges()]
-    G_ig = ig.Graph(edges=edges, directed=False)
-    return G_ig, reverse_mapping
+def build_similarity_graph_from_knn(labels, distances, threshold=0.75):
+    labels = np.asarray(labels, dtype=np.int64)
+    similarity = 1 - np.asarray(distances, dtype=np.float32)
+    rows = np.repeat(np.arange(len(labels), dtype=np.int64), labels.shape[1])
+    cols = labels.ravel()
+    weights = similarity.ravel()
+    keep = (rows != cols) & (weights >= threshold)
+    rows, cols, weights = rows[keep], cols[keep], weights[keep]
 
-def cluster_with_leiden(G_nx):
-    G_ig, reverse_map = graph_to_igraph(G_nx)
-    partition = leidenalg.find_partition(G_ig, leidenalg.ModularityVertexPartition)
+    # (i, j) and (j, i) are the same undirected edge: keep one copy with the highest similarity
+    lo = np.minimum(rows, cols)
+    hi = np.maximum(rows, cols)
+    order = np.lexsort((-weights, hi, lo))
+    lo, hi, weights = lo[order], hi[order], weights[order]
+    first = np.ones(len(lo), dtype=bool)
+    first[1:] = (lo[1:] != lo[:-1]) | (hi[1:] != hi[:-1])
+    lo, hi, weights = lo[first], hi[first], weights[first]
+
+    # Only logos with at least one edge become vertices; "logo" keeps the row index into the embeddings
+    import igraph as ig
+    logos, inverse = np.unique(np.concatenate([lo, hi]), return_inverse=True)
+    edges = inverse.reshape(2, -1).T
+    G = ig.Graph(n=len(logos), edges=edges, directed=False)
+    G.vs["logo"] = logos.tolist()
+    G.es["weight"] = weights.tolist()
+    return G
+
+def cluster_with_leiden(G, weights=None, seed=None):
+    import leidenalg
+    partition = leidenalg.find_partition(G, leidenalg.ModularityVertexPartition, weights=weights, seed=seed)
+    logos = G.vs["logo"]
     clusters = {}
     for cluster_id, nodes in enumerate(partition):
-        clusters[cluster_id] = [reverse_map[n] for n in nodes]
+        clusters[cluster_id] = [logos[n] for n in nodes]
     return clusters
 
 def split_clusters(G):
-    components = list(nx_conn.connected_components(G))
+    logos = G.vs["logo"]
     final_clusters = []
     unique_logos = []
-    for comp in components:
+    for comp in G.connected_components():
         if len(comp) > 1:
-            final_clusters.append(list(comp))
+            final_clusters.append([logos[n] for n in comp])
         else:
-            unique_logos.append(list(comp)[0])
+            unique_logos.append(logos[comp[0]])
     return final_clusters, unique_logos
 
 def cluster_indices_to_domains(cluster_dict, valid_domains):
@@ -137,8 +439,63 @@ def cluster_indices_to_domains(cluster_dict, valid_domains):
         cluster_domains[cluster_id] = [valid_domains[i] for i in logo_indices]
     return cluster_domains
 
+def load_clusters_csv(path=REFERENCE_CLUSTERS_PATH):
+    clusters = {}
+    with open(path, newline="", encoding="utf-8") as f:
+        for row in csv.DictReader(f):
+            clusters.setdefault(row["cluster_id"], []).append(row["domain"])
+    return clusters
+
+def cluster_agreement(clusters, reference, domains=None):
+    # Pairwise agreement: a pair of domains "agrees" when both clusterings put it in the same cluster
+    def labels_for(cluster_dict):
+        return {d: cid for cid, members in cluster_dict.items() for d in members if domains is None or d in domains}
+
+    if domains is not None:
+        domains = set(domains)
+    labels = labels_for(clusters)
+    reference_labels = labels_for(reference)
+
+    def same_cluster_pairs(counts):
+        return sum(n * (n - 1) // 2 for n in counts.values())
+
+    pairs = same_cluster_pairs(Counter(labels.values()))
+    reference_pairs = same_cluster_pairs(Counter(reference_labels.values()))
+    shared = Counter((labels[d], reference_labels[d]) for d in labels if d in reference_labels)
+    both = same_cluster_pairs(shared)
+
+    precision = both / pairs if pairs else 1.0
+    recall = both / reference_pairs if reference_pairs else 1.0
+    f1 = 2 * precision * recall / (precision + recall) if precision + recall else 0.0
+    return {"pairs": pairs, "reference_pairs": reference_pairs, "shared_pairs": both,
+            "precision": precision, "recall": recall, "f1": f1}
+
+def compare_with_reference(domain_clusters, domains, reference_path=REFERENCE_CLUSTERS_PATH):
+    agreement = cluster_agreement(domain_clusters, load_clusters_csv(reference_path), domains=domains)
+    print(f"📏 Agreement with {reference_path}: precision={agreement['precision']:.3f} "
+          f"recall={agreement['recall']:.3f} f1={agreement['f1']:.3f}")
+    return agreement
+
+def threshold_sweep(embeddings, domains, metric="l2", thresholds=None, k=3, reference_path=REFERENCE_CLUSTERS_PATH, seed=0):
+    # Agreement with the reference clustering for each candidate threshold; the kNN graph is queried once
+    embeddings = normalize_embeddings(embeddings) if metric == "cosine" else np.asarray(embeddings, dtype=np.float32)
+    if thresholds is None:
+        thresholds = np.round(np.arange(0.5, 1.0, 0.02), 2).tolist() + [0.99, 0.995, 0.999]
+    reference = load_clusters_csv(reference_path)
+    index = build_hnsw_index(embeddings, space=METRIC_SPACES[metric])
+    labels, distances = index.knn_query(embeddings, k=min(k, len(embeddings)))
+    results = []
+    for threshold in thresholds:
+        G = build_similarity_graph_from_knn(labels, distances, threshold=threshold)
+        clusters = cluster_indices_to_domains(cluster_with_leiden(G, seed=seed), domains)
+        agreement = cluster_agreement(clusters, reference, domains=domains)
+        print(f"📏 {metric} threshold={threshold}: precision={agreement['precision']:.3f} "
+              f"recall={agreement['recall']:.3f} f1={agreement['f1']:.3f}")
+        results.append((threshold, agreement))
+    return results
+
 def get_logo_paths(folder, domain_names):
-    supported_exts = ['.jpg', '.jpeg', '.png', '.webp', '.svg', '.img']
+    supported_exts = SUPPORTED_EXTS
     logo_paths = []
     valid_domains = []
     all_files = set(os.listdir(folder))
@@ -165,7 +522,8 @@ def get_logo_paths(folder, domain_names):
 #                 writer.writerow([cluster_id, domains[idx]])
 #     print(f"✅ Clusters saved to {output_file}")
 
-def clustering(device, processor, model, domains):
+def clustering(device, processor, model, domains, cache_path=EMBEDDING_CACHE_PATH, index=None, index_path=INDEX_PATH,
+               metric="l2", threshold=None, k=3, dedupe=False, embedding_store=None):
     domains = list(dict.fromkeys(domains))
     print("🔍 Domains passed in:", domains)
     print("📂 Files in 'logos/' folder:", os.listdir("logos"))
@@ -173,9 +531,30 @@ def clustering(device, processor, model, domains):
     if not logo_paths:
         print("❌ No matching logo files found.")
         return {}
-    embeddings, valid_domains = extract_features_with_padding(logo_paths, valid_domains, device, processor, model, batch_size=32)
-    index = build_hnsw_index(embeddings, save_path="hnsw_index.bin")
-    G = build_similarity_graph(index, embeddings, k=3, threshold=0.92)
+    duplicate_groups = None
+    if dedupe:
+        logo_paths, valid_domains, duplicate_groups = group_duplicate_logos(logo_paths, valid_domains, store=hash_store())
+    embeddings, valid_domains = extract_features_cached(logo_paths, valid_domains, device, processor, model, batch_size=32, cache_path=cache_path, store=pixel_store())
+    if not valid_domains:
+        print("❌ No readable logos to cluster.")
+        return {}
+    index_embeddings, index_domains = embeddings, valid_domains
+    if duplicate_groups:
+        index_embeddings, index_domains = expand_duplicate_embeddings(embeddings, valid_domains, duplicate_groups)
+    if embedding_store is None:
+        embedding_store = open_embedding_store(processor, model, embeddings.shape[1])
+    changed = store_embeddings(embedding_store, index_domains, index_embeddings)
+    print(f"💾 Embedding store: {changed} new or changed vectors, {len(embedding_store)} domains")
+    if metric == "cosine":
+        embeddings = normalize_embeddings(embeddings)
+        index_embeddings = normalize_embeddings(index_embeddings)
+    if threshold is None:
+        threshold = DEFAULT_THRESHOLDS[metric]
+    index = update_logo_index(index_embeddings, index_domains, index=index, index_path=index_path, space=METRIC_SPACES[metric])
+    labels, distances = index.knn_positions(embeddings, valid_domains, k=k)
+    G = build_similarity_graph_from_knn(labels, distances, threshold=threshold)
     clusters_dict = cluster_with_leiden(G)
     domain_clusters = cluster_indices_to_domains(clusters_dict, valid_domains)
+    if duplicate_groups:
+        domain_clusters = expand_duplicate_clusters(domain_clusters, duplicate_groups)
     return domain_clusters
@@ -0,0 +1,183 @@
+import time
+import asyncio
+import threading
+from contextlib import contextmanager, asynccontextmanager
+from collections import defaultdict
+
+
+class HostState:
+    def __init__(self):
+        self.active = 0
+        self.next_start = 0.0
+        self.failures = 0
+
+
+class Slot:
+    # Handed to the caller while it holds a slot; call failed() for soft failures (empty page, bad status)
+    def __init__(self, host):
+        self.host = host
+        self.ok = True
+        self.cancelled = False
+
+    def failed(self):
+        self.ok = False
+
+
+class AdaptiveScheduler:
+    # AIMD concurrency window shared by all hosts, plus per-host politeness (concurrency cap, spacing, backoff).
+    # The window grows by ~1 per window's worth of fast successes and is cut by `decrease` on errors/slow responses.
+    def __init__(self, initial_window=5, min_window=1, max_window=20, target_latency=5.0,
+                 increase=1.0, decrease=0.5, decrease_cooldown=1.0,
+                 per_host_limit=2, min_host_interval=0.5, host_backoff=2.0, max_host_backoff=60.0):
+        self._window = float(initial_window)
+        self.min_window = min_window
+        self.max_window = max_window
+        self.target_latency = target_latency
+        self.increase = increase
+        self.decrease = decrease
+        self.decrease_cooldown = decrease_cooldown
+        self.per_host_limit = per_host_limit
+        self.min_host_interval = min_host_interval
+        self.host_backoff = host_backoff
+        self.max_host_backoff = max_host_backoff
+        self.active = 0
+        self.hosts = defaultdict(HostState)
+        self.last_decrease = 0.0
+        self.successes = 0
+        self.errors = 0
+
+    @property
+    def window(self):
+        return int(self._window)
+
+    def stats(self):
+        return {
+            "window": self.window,
+            "active": self.active,
+            "successes": self.successes,
+            "errors": self.errors,
+            "backing_off": sum(1 for h in self.hosts.values() if h.failures),
+        }
+
+    def _try_admit(self, host):
+        # 0 = admitted, None = wait for a release, seconds = wait for the host's next start time
+        now = time.monotonic()
+        state = self.hosts[host]
+        if self.active >= self.window or state.active >= self.per_host_limit:
+            return None
+        if now < state.next_start:
+            return state.next_start - now
+        self.active += 1
+        state.active += 1
+        state.next_start = now + self.min_host_interval
+        return 0
+
+    def _record(self, host, latency, ok, cancelled=False):
+        now = time.monotonic()
+        state = self.hosts[host]
+        self.active -= 1
+        state.active -= 1
+        if cancelled:
+            # e.g. the loser of a race: says nothing about the host, only frees the slot
+            pass
+        elif ok:
+            self.successes += 1
+            state.failures = 0
+        else:
+            self.errors += 1
+            state.failures += 1
+            backoff = min(self.host_backoff * 2 ** (state.failures - 1), self.max_host_backoff)
+            state.next_start = max(state.next_start, now + backoff)
+
+        if cancelled:
+            pass
+        elif ok and latency <= self.target_latency:
+            self._window = min(self.max_window, self._window + self.increase / max(self._window, 1))
+        elif now - self.last_decrease >= self.decrease_cooldown:
+            # One cut per cooldown so a burst of failures from the same wave doesn't collapse the window
+            self._window = max(self.min_window, self._window * self.decrease)
+            self.last_decrease = now
+
+        if state.active == 0 and not state.failures and state.next_start <= now:
+            del self.hosts[host]
+
+
+class AsyncHostScheduler(AdaptiveScheduler):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._cond = None
+        self._loop = None
+
+    def _condition(self):
+        # asyncio primitives belong to one loop; a scheduler reused across asyncio.run() calls keeps
+        # its window and host state but gets a fresh condition for the new loop
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            self._cond = asyncio.Condition()
+            self._loop = loop
+        return self._cond
+
+    @asynccontextmanager
+    async def slot(self, host):
+        cond = self._condition()
+        async with cond:
+            while (wait := self._try_admit(host)) != 0:
+                try:
+                    await asyncio.wait_for(cond.wait(), timeout=wait)
+                except asyncio.TimeoutError:
+                    pass
+        slot = Slot(host)
+        start = time.monotonic()
+        try:
+            yield slot
+        except asyncio.CancelledError:
+            slot.cancelled = True
+            raise
+        except BaseException:
+            slot.failed()
+            raise
+        finally:
+            async with cond:
+                self._record(host, time.monotonic() - start, slot.ok, slot.cancelled)
+                cond.notify_all()
+
+
+class ReadWriteLock:
+    # Any number of readers at once, or one writer alone. A waiting writer holds back new readers so a steady
+    # stream of reads can't starve it; neither side is re-entrant
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._readers = 0
+        self._writer = False
+        self._waiting_writers = 0
+
+    @contextmanager
+    def read(self):
+        with self._cond:
+            while self._writer or self._waiting_writers:
+                self._cond.wait()
+            self._readers += 1
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._readers -= 1
+                if not self._readers:
+                    self._cond.notify_all()
+
+    @contextmanager
+    def write(self):
+        with self._cond:
+            self._waiting_writers += 1
+            try:
+                while self._writer or self._readers:
+                    self._cond.wait()
+            finally:
+                self._waiting_writers -= 1
+            self._writer = True
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._writer = False
+                self._cond.notify_all()
@@ -0,0 +1,180 @@
+import os
+import copy
+import numpy as np
+
+# torch is imported inside the backends so importing this module stays cheap
+
+BACKENDS = ["torch", "torch-int8", "onnx", "onnx-int8"]
+ONNX_DIR = "onnx_models"
+
+
+class TorchBackend:
+    backend_name = "torch"
+
+    def __init__(self, model, device):
+        self.model = model
+        self.device = device
+        self.config = model.config
+
+    def __call__(self, pixel_values):
+        import torch
+        with torch.inference_mode():
+            outputs = self.model(pixel_values=pixel_values.to(self.device)).last_hidden_state.mean(dim=1)
+        return outputs.cpu().numpy()
+
+
+class QuantizedTorchBackend(TorchBackend):
+    # Dynamic int8 quantization of the Linear layers (attention + MLP), CPU only
+    backend_name = "torch-int8"
+
+    def __init__(self, model):
+        import torch
+        quantized = torch.ao.quantization.quantize_dynamic(copy.deepcopy(model).cpu().eval(), {torch.nn.Linear}, dtype=torch.qint8)
+        super().__init__(quantized, torch.device("cpu"))
+
+
+class OnnxBackend:
+    backend_name = "onnx"
+
+    def __init__(self, model_path, config, num_threads=None, backend_name=None):
+        try:
+            import onnxruntime as ort
+        except ImportError as e:
+            raise ImportError("The onnx backends need onnxruntime: pip install onnxruntime") from e
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if num_threads:
+            options.intra_op_num_threads = num_threads
+        self.session = ort.InferenceSession(model_path, options, providers=["CPUExecutionProvider"])
+        self.config = config
+        if backend_name:
+            self.backend_name = backend_name
+
+    def __call__(self, pixel_values):
+        if hasattr(pixel_values, "cpu"):
+            pixel_values = pixel_values.cpu().numpy()
+        return self.session.run(["embedding"], {"pixel_values": pixel_values.astype(np.float32)})[0]
+
+
+def export_onnx(model, path, image_size=224, opset=17):
+    import torch
+
+    class MeanPooledEncoder(torch.nn.Module):
+        def __init__(self, model):
+            super().__init__()
+            self.model = model
+
+        def forward(self, pixel_values):
+            return self.model(pixel_values=pixel_values).last_hidden_state.mean(dim=1)
+
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    encoder = MeanPooledEncoder(copy.deepcopy(model).cpu().eval())
+    dummy = torch.zeros(1, 3, image_size, image_size)
+    tmp_path = path + ".tmp"
+    torch.onnx.export(
+        encoder, (dummy,), tmp_path,
+        input_names=["pixel_values"], output_names=["embedding"],
+        dynamic_axes={"pixel_values": {0: "batch"}, "embedding": {0: "batch"}},
+        opset_version=opset, dynamo=False,
+    )
+    os.replace(tmp_path, path)
+    print(f"✅ Exported ONNX model: {path}")
+    return path
+
+
+def quantize_onnx(src_path, dst_path):
+    from onnxruntime.quantization import quantize_dynamic, QuantType
+    tmp_path = dst_path + ".tmp"
+    quantize_dynamic(src_path, tmp_path, weight_type=QuantType.QInt8)
+    os.replace(tmp_path, dst_path)
+    print(f"✅ Quantized ONNX model: {dst_path}")
+    return dst_path
+
+
+def onnx_paths(model, onnx_dir=ONNX_DIR):
+    name = getattr(model.config, "_name_or_path", "model").replace("/", "--") or "model"
+    base = os.path.join(onnx_dir, name)
+    return base + ".onnx", base + "-int8.onnx"
+
+
+def get_backend(name, model, device, onnx_dir=ONNX_DIR, num_threads=None):
+    if name == "torch":
+        return TorchBackend(model, device)
+    if name == "torch-int8":
+        return QuantizedTorchBackend(model)
+    if name in ("onnx", "onnx-int8"):
+        fp32_path, int8_path = onnx_paths(model, onnx_dir)
+        if not os.path.exists(fp32_path):
+            export_onnx(model, fp32_path)
+        path = fp32_path
+        if name == "onnx-int8":
+            if not os.path.exists(int8_path):
+                quantize_onnx(fp32_path, int8_path)
+            path = int8_path
+        return OnnxBackend(path, model.config, num_threads=num_threads, backend_name=name)
+    raise ValueError(f"Unknown embedding backend '{name}', expected one of {BACKENDS}")
+
+
+def as_backend(model, device):
+    # Plain Hugging Face models are wrapped in the eager torch backend
+    return model if hasattr(model, "backend_name") else TorchBackend(model, device)
+
+
+def compare_backends(baseline, candidate, image_paths, domains, processor, metric="cosine", threshold=None, k=3):
+    # Parity report: per-logo cosine drift and cluster agreement of `candidate` against `baseline`
+    import clustering
+
+    base_embeddings, base_domains = clustering.extract_features_with_padding(image_paths, domains, None, processor, baseline)
+    cand_embeddings, cand_domains = clustering.extract_features_with_padding(image_paths, domains, None, processor, candidate)
+    assert base_domains == cand_domains
+
+    a = clustering.normalize_embeddings(base_embeddings)
+    b = clustering.normalize_embeddings(cand_embeddings)
+    drift = 1 - np.sum(a * b, axis=1)
+
+    if threshold is None:
+        threshold = clustering.DEFAULT_THRESHOLDS[metric]
+    space = clustering.METRIC_SPACES[metric]
+
+    def cluster(embeddings):
+        if metric == "cosine":
+            embeddings = clustering.normalize_embeddings(embeddings)
+        index = clustering.build_hnsw_index(embeddings, space=space)
+        G = clustering.build_similarity_graph(index, embeddings, k=k, threshold=threshold)
+        clusters = clustering.cluster_with_leiden(G, seed=0)
+        return clustering.cluster_indices_to_domains(clusters, base_domains)
+
+    agreement = clustering.cluster_agreement(cluster(cand_embeddings), cluster(base_embeddings))
+    report = {
+        "baseline": getattr(baseline, "backend_name", "torch"),
+        "candidate": getattr(candidate, "backend_name", "torch"),
+        "logos": len(base_domains),
+        "cosine_drift_mean": float(drift.mean()),
+        "cosine_drift_p99": float(np.percentile(drift, 99)),
+        "cosine_drift_max": float(drift.max()),
+        "cluster_agreement": agreement,
+    }
+    print(f"📏 {report['candidate']} vs {report['baseline']} on {report['logos']} logos: "
+          f"drift mean={report['cosine_drift_mean']:.5f} p99={report['cosine_drift_p99']:.5f} max={report['cosine_drift_max']:.5f}, "
+          f"cluster f1={agreement['f1']:.3f}")
+    return report
+
+
+if __name__ == "__main__":
+    import sys
+    import torch
+    from transformers import AutoProcessor, AutoModel
+    from clustering import get_logo_paths
+
+    name = sys.argv[1] if len(sys.argv) > 1 else "onnx-int8"
+    limit = int(sys.argv[2]) if len(sys.argv) > 2 else 500
+
+    processor = AutoProcessor.from_pretrained("facebook/dinov2-base")
+    processor.size = {"height": 224, "width": 224}
+    processor.do_center_crop = False
+    model = AutoModel.from_pretrained("facebook/dinov2-base").eval()
+
+    domains = sorted(os.path.splitext(f)[0] for f in os.listdir("logos"))[:limit]
+    paths, domains = get_logo_paths("logos", domains)
+    cpu = torch.device("cpu")
+    compare_backends(TorchBackend(model, cpu), get_backend(name, model, cpu), paths, domains, processor)
@@ -0,0 +1,274 @@
+import os
+import sys
+import time
+import numpy as np
+import hnswlib
+
+# Defaults for CompactIndex.build: project to COMPACT_DIM, keep int8 codes, re-rank 4x the requested k
+COMPACT_DIM = int(os.getenv("COMPACT_DIM", "128"))
+COMPACT_DTYPE = os.getenv("COMPACT_DTYPE", "int8")
+COMPACT_RERANK_FACTOR = int(os.getenv("COMPACT_RERANK_FACTOR", "4"))
+DEFAULT_CONFIGS = ["none-float16", "none-int8", "pca256-int8", "pca128-int8", "random128-int8", "pca128-hnsw16"]
+HNSW_LINK_BYTES = 4
+
+
+def normalize(vectors):
+    vectors = np.asarray(vectors, dtype=np.float32)
+    return vectors / np.maximum(np.linalg.norm(vectors, axis=-1, keepdims=True), 1e-12)
+
+
+def pairwise_distances(queries, vectors, metric="l2"):
+    # Same conventions as hnswlib: squared L2, or 1 - dot product for (normalized) cosine
+    queries = np.asarray(queries, dtype=np.float32)
+    vectors = np.asarray(vectors, dtype=np.float32)
+    if metric == "cosine":
+        return 1 - queries @ vectors.T
+    return np.maximum((queries ** 2).sum(1)[:, None] - 2 * queries @ vectors.T + (vectors ** 2).sum(1)[None, :], 0)
+
+
+def exact_knn(queries, vectors, k, metric="l2", chunk=1024, decode=None):
+    # Brute-force (labels, distances); `decode` turns a slice of stored codes back into float32 rows
+    k = min(k, len(vectors))
+    labels = np.empty((len(queries), k), dtype=np.int64)
+    distances = np.empty((len(queries), k), dtype=np.float32)
+    rows = vectors if decode is None else None
+    for i in range(0, len(queries), chunk):
+        if decode is None:
+            d = pairwise_distances(queries[i:i + chunk], rows, metric)
+        else:
+            d = np.hstack([pairwise_distances(queries[i:i + chunk], decode(vectors[j:j + 65536]), metric)
+                           for j in range(0, len(vectors), 65536)])
+        top = np.argpartition(d, k - 1, axis=1)[:, :k]
+        top_d = np.take_along_axis(d, top, axis=1)
+        order = np.argsort(top_d, axis=1)
+        labels[i:i + chunk] = np.take_along_axis(top, order, axis=1)
+        distances[i:i + chunk] = np.take_along_axis(top_d, order, axis=1)
+    return labels, distances
+
+
+class Projection:
+    # x -> (x - mean) @ components: PCA, or a seeded Gaussian random projection (Johnson-Lindenstrauss).
+    # "none" keeps the vectors as they are (components is None), so it costs neither a matmul nor memory.
+    def __init__(self, mean, components, method, dim=None):
+        self.mean = mean
+        self.components = components
+        self.method = method
+        self.dim = components.shape[1] if components is not None else dim
+
+    @property
+    def nbytes(self):
+        return 0 if self.components is None else self.components.nbytes + self.mean.nbytes
+
+    @classmethod
+    def fit(cls, vectors, dim, method="pca", metric="l2", sample=20000, seed=0):
+        vectors = np.asarray(vectors, dtype=np.float32)
+        rng = np.random.default_rng(seed)
+        if method == "none" or dim >= vectors.shape[1]:
+            return cls(None, None, "none", dim=vectors.shape[1])
+        if method == "random":
+            components = (rng.standard_normal((vectors.shape[1], dim)) / np.sqrt(dim)).astype(np.float32)
+            return cls(np.zeros(vectors.shape[1], dtype=np.float32), components, method)
+        if method != "pca":
+            raise ValueError(f"Unknown projection '{method}', expected pca, random or none")
+        rows = vectors[rng.choice(len(vectors), min(sample, len(vectors)), replace=False)]
+        if metric == "cosine":
+            rows = normalize(rows)
+        # Centering keeps L2 distances; for cosine the projected vectors are re-normalized, so stay uncentered
+        mean = rows.mean(0) if metric == "l2" else np.zeros(vectors.shape[1], dtype=np.float32)
+        _, _, vt = np.linalg.svd(rows - mean, full_matrices=False)
+        return cls(mean.astype(np.float32), vt[:dim].T.astype(np.float32), method)
+
+    def apply(self, vectors, metric="l2"):
+        if self.components is None:
+            return np.asarray(vectors, dtype=np.float32)
+        projected = (np.asarray(vectors, dtype=np.float32) - self.mean) @ self.components
+        return normalize(projected) if metric == "cosine" else projected
+
+    def apply_all(self, vectors, metric="l2", chunk=65536):
+        # Projection of every stored vector, a chunk at a time: for cosine only one chunk is normalized at once
+        if metric != "cosine":
+            return np.ascontiguousarray(self.apply(vectors, metric))
+        return np.vstack([self.apply(normalize(vectors[i:i + chunk]), metric) for i in range(0, len(vectors), chunk)])
+
+
+class Quantizer:
+    # Per-dimension scalar quantization: float16 casts, int8 maps each dimension's [min, max] onto 256 levels
+    def __init__(self, dtype, low=None, scale=None):
+        if dtype not in ("float32", "float16", "int8"):
+            raise ValueError(f"Unknown dtype '{dtype}', expected float32, float16 or int8")
+        self.dtype = dtype
+        self.low = low
+        self.scale = scale
+
+    @classmethod
+    def fit(cls, vectors, dtype):
+        if dtype != "int8":
+            return cls(dtype)
+        low = vectors.min(0)
+        scale = np.maximum(vectors.max(0) - low, 1e-12) / 255
+        return cls(dtype, low.astype(np.float32), scale.astype(np.float32))
+
+    def encode(self, vectors):
+        if self.dtype != "int8":
+            return np.asarray(vectors, dtype=self.dtype)
+        return (np.clip(np.round((vectors - self.low) / self.scale), 0, 255) - 128).astype(np.int8)
+
+    @property
+    def nbytes(self):
+        return 0 if self.low is None else self.low.nbytes + self.scale.nbytes
+
+    def decode(self, codes):
+        if self.dtype != "int8":
+            return np.asarray(codes, dtype=np.float32)
+        return (codes.astype(np.float32) + 128) * self.scale + self.low
+
+
+class CompactIndex:
+    # Candidates from projected, quantized vectors; the final top-k is re-ranked with the full vectors
+    # (e.g. the embedding store's memory map, so they stay on disk; for cosine only the gathered candidate
+    # rows are normalized). hnswlib only stores float32, so quantized
+    # codes are searched with a flat scan and M > 0 builds an HNSW graph over the float32 projection instead.
+    def __init__(self, domains, full, projection, quantizer, codes=None, hnsw=None, metric="l2", M=0):
+        self.domains = list(domains)
+        self.positions = {domain: i for i, domain in enumerate(self.domains)}
+        self.full = full
+        self.projection = projection
+        self.quantizer = quantizer
+        self.codes = codes
+        self.hnsw = hnsw
+        self.metric = metric
+        self.M = M
+
+    @classmethod
+    def build(cls, vectors, domains, metric="l2", dim=COMPACT_DIM, method="pca", dtype=COMPACT_DTYPE, M=0,
+              ef=100, ef_construction=200, seed=0):
+        full = vectors
+        if M and dtype != "float32":
+            raise ValueError("HNSW candidates need float32 codes")
+        projection = Projection.fit(full, dim, method, metric=metric, seed=seed)
+        projected = projection.apply_all(full, metric)
+        if M:
+            hnsw = hnswlib.Index(space="ip" if metric == "cosine" else "l2", dim=projection.dim)
+            hnsw.init_index(max_elements=len(projected), ef_construction=ef_construction, M=M, random_seed=seed)
+            hnsw.add_items(projected, np.arange(len(projected)))
+            hnsw.set_ef(ef)
+            return cls(domains, full, projection, Quantizer("float32"), hnsw=hnsw, metric=metric, M=M)
+        quantizer = Quantizer.fit(projected, dtype)
+        return cls(domains, full, projection, quantizer, codes=quantizer.encode(projected), metric=metric)
+
+    def __len__(self):
+        return len(self.domains)
+
+    def memory_bytes(self):
+        # What has to stay in RAM; the full vectors used for re-ranking are read from disk
+        if self.hnsw is not None:
+            # float32 vector + 2*M level-0 links + label and link-count header, per element
+            return len(self) * (self.projection.dim * 4 + 2 * self.M * HNSW_LINK_BYTES + 12) + self.projection.nbytes
+        return self.codes.nbytes + self.projection.nbytes + self.quantizer.nbytes
+
+    def knn(self, queries, k=10, rerank=True, rerank_factor=COMPACT_RERANK_FACTOR):
+        queries = np.asarray(queries, dtype=np.float32).reshape(-1, self.full.shape[1])
+        if self.metric == "cosine":
+            queries = normalize(queries)
+        k = min(k, len(self))
+        candidates = min(k * rerank_factor if rerank else k, len(self))
+        projected = self.projection.apply(queries, self.metric)
+        if self.hnsw is not None:
+            labels, distances = self.hnsw.knn_query(projected, k=candidates)
+            labels = labels.astype(np.int64)
+        else:
+            labels, distances = exact_knn(projected, self.codes, candidates, self.metric, decode=self.quantizer.decode)
+        if not rerank:
+            return labels, distances
+
+        # Exact distances on the full vectors of each query's candidates, gathered once for the whole batch
+        rows, inverse = np.unique(labels, return_inverse=True)
+        full_rows = np.asarray(self.full[rows], dtype=np.float32)
+        if self.metric == "cosine":
+            full_rows = normalize(full_rows)
+        inverse = inverse.reshape(labels.shape)
+        out_labels = np.empty((len(queries), k), dtype=np.int64)
+        out_distances = np.empty((len(queries), k), dtype=np.float32)
+        for i, query in enumerate(queries):
+            d = pairwise_distances(query[None], full_rows[inverse[i]], self.metric)[0]
+            order = np.argsort(d)[:k]
+            out_labels[i] = labels[i][order]
+            out_distances[i] = d[order]
+        return out_labels, out_distances
+
+    def similar(self, embedding, k=10, exclude=None):
+        # Same result shape as LogoIndex.similar
+        labels, distances = self.knn(embedding, k=k + (1 if exclude else 0))
+        results = []
+        for label, distance in zip(labels[0], distances[0]):
+            domain = self.domains[label]
+            if domain == exclude:
+                continue
+            results.append({"domain": domain, "score": float(1 - distance)})
+        return results[:k]
+
+
+def parse_config(name):
+    # "pca128-int8", "random64-float16", "none-int8", "pca128-hnsw16"
+    projection, storage = name.split("-")
+    method = projection.rstrip("0123456789")
+    dim = int(projection[len(method):] or 0) or sys.maxsize
+    if storage.startswith("hnsw"):
+        return {"method": method, "dim": dim, "dtype": "float32", "M": int(storage[4:])}
+    return {"method": method, "dim": dim, "dtype": storage, "M": 0}
+
+
+def evaluate(vectors, domains, configs=DEFAULT_CONFIGS, metric="l2", k=10, queries=500, cluster_k=3, threshold=None,
+             baseline_M=64, seed=0):
+    # recall@k against exact search on the full vectors, and cluster agreement against clustering the full vectors
+    import clustering
+
+    full = normalize(vectors) if metric == "cosine" else np.asarray(vectors, dtype=np.float32)
+    threshold = clustering.DEFAULT_THRESHOLDS[metric] if threshold is None else threshold
+    sample = np.random.default_rng(seed).choice(len(full), min(queries, len(full)), replace=False)
+    _, truth = exact_knn(full[sample], full, k, metric)
+
+    def cluster(labels, distances):
+        G = clustering.build_similarity_graph_from_knn(labels, distances, threshold=threshold)
+        return clustering.cluster_indices_to_domains(clustering.cluster_with_leiden(G, seed=seed), domains)
+
+    def recall(labels):
+        # A neighbour counts if it is as close as the true k-th one, so duplicate logos (ties) aren't misses;
+        # the tolerance is relative because float32 squared-L2 distances are only exact to ~1e-6 of their size
+        hits = [(pairwise_distances(full[q][None], full[row], metric)[0] <= kth + 1e-5 * max(1.0, abs(kth))).sum()
+                for q, row, kth in zip(sample, labels, truth[:, -1])]
+        return float(np.mean(hits)) / truth.shape[1]
+
+    baseline = cluster(*exact_knn(full, full, cluster_k, metric))
+    baseline_bytes = full.shape[1] * 4 + 2 * baseline_M * HNSW_LINK_BYTES + 12
+    print(f"📏 Baseline: {len(full)} x {full.shape[1]} float32 + HNSW M={baseline_M}: ~{baseline_bytes} bytes per logo")
+
+    report = []
+    for name in configs:
+        config = parse_config(name)
+        index = CompactIndex.build(vectors, domains, metric=metric, seed=seed, **config)
+        row = {"config": name, "bytes_per_logo": index.memory_bytes() / len(index)}
+        for rerank in (False, True):
+            start = time.perf_counter()
+            labels, _ = index.knn(full[sample], k=k, rerank=rerank)
+            row["recall_rerank" if rerank else "recall"] = recall(labels)
+            row["ms_per_query_rerank" if rerank else "ms_per_query"] = (time.perf_counter() - start) * 1000 / len(sample)
+        row["cluster_agreement"] = clustering.cluster_agreement(cluster(*index.knn(full, k=cluster_k)), baseline)
+        row["compression"] = baseline_bytes / row["bytes_per_logo"]
+        report.append(row)
+        print(f"📏 {name}: {row['bytes_per_logo']:.0f} B/logo ({row['compression']:.1f}x smaller), "
+              f"recall@{k}={row['recall']:.3f}, with re-rank={row['recall_rerank']:.3f} "
+              f"({row['ms_per_query_rerank']:.2f} ms/query), cluster f1={row['cluster_agreement']['f1']:.3f}")
+    return report
+
+
+# python embedding_compaction.py <embedding_store/...> [limit] [l2|cosine] [pca128-int8,pca128-hnsw16,...]
+if __name__ == "__main__":
+    from array_store import ArrayStore
+
+    store = ArrayStore.open(sys.argv[1])
+    limit = int(sys.argv[2]) if len(sys.argv) > 2 else 10000
+    metric = sys.argv[3] if len(sys.argv) > 3 else "l2"
+    configs = sys.argv[4].split(",") if len(sys.argv) > 4 else DEFAULT_CONFIGS
+    domains, vectors = store.snapshot()
+    evaluate(np.asarray(vectors[:limit], dtype=np.float32), domains[:limit], configs, metric=metric)
@@ -0,0 +1,86 @@
+import os
+import sys
+import time
+from logo_extractor import find_logos_in_html, find_logos_in_html_bs4, HTML_PARSER
+
+PARSERS = ["bs4", "html.parser", "lxml"]
+MODES = ["full", "head"]
+
+
+def load_corpus(source=None, limit=None):
+    # (base_url, html) pairs from a folder of <domain>.html files, or from the page cache
+    pages = []
+    if source and os.path.isdir(source):
+        for file in sorted(os.listdir(source)):
+            if file.endswith(".html"):
+                with open(os.path.join(source, file), "r", encoding="utf-8", errors="replace") as f:
+                    pages.append((f"https://{file[:-len('.html')].lower()}", f.read()))
+    else:
+        from page_cache import PageCache
+        with (PageCache(source) if source else PageCache()) as cache:
+            pages = [(f"https://{domain}", html) for domain, html in cache.iter_pages(cache.domains())]
+    return pages[:limit]
+
+
+def extract(pages, parser, mode="full"):
+    if parser == "bs4":
+        return [find_logos_in_html_bs4(html, base_url) for base_url, html in pages]
+    return [find_logos_in_html(html, base_url, parser=parser, mode=mode) for base_url, html in pages]
+
+
+def parity_check(pages, parser=HTML_PARSER):
+    # Every page must rank exactly like the bs4 reference
+    expected = extract(pages, "bs4")
+    got = extract(pages, parser)
+    mismatches = [
+        {"url": base_url, "expected": e, "got": g}
+        for (base_url, _), e, g in zip(pages, expected, got) if e != g
+    ]
+    status = "✅" if not mismatches else "❌"
+    print(f"{status} {parser}: {len(pages) - len(mismatches)}/{len(pages)} pages rank identically to bs4")
+    return mismatches
+
+
+def top_choice_agreement(pages, parser=HTML_PARSER, mode="head"):
+    # Early-terminating modes are not exact; report how often they still pick the same logo
+    full = extract(pages, parser, "full")
+    partial = extract(pages, parser, mode)
+    same = sum(1 for f, p in zip(full, partial) if f[:1] == p[:1])
+    print(f"🎯 {parser}/{mode}: same top candidate as a full parse on {same}/{len(pages)} pages")
+    return same / len(pages)
+
+
+def benchmark(pages, parsers=PARSERS, modes=MODES):
+    total_mb = sum(len(html) for _, html in pages) / 1e6
+    report = {}
+    for parser in parsers:
+        for mode in (["full"] if parser == "bs4" else modes):
+            label = parser if mode == "full" else f"{parser}/{mode}"
+            start = time.perf_counter()
+            extract(pages, parser, mode)
+            elapsed = time.perf_counter() - start
+            report[label] = {"seconds": elapsed, "pages_per_s": len(pages) / elapsed, "mb_per_s": total_mb / elapsed}
+            print(f"⏱️ {label}: {elapsed:.2f}s, {len(pages) / elapsed:.0f} pages/s, {total_mb / elapsed:.1f} MB/s")
+    return report
+
+
+# python extractor_benchmark.py [html_dir | page_cache_dir] [limit]
+def main():
+    source = sys.argv[1] if len(sys.argv) > 1 else None
+    limit = int(sys.argv[2]) if len(sys.argv) > 2 else None
+    pages = load_corpus(source, limit)
+    if not pages:
+        print("⚠️ No pages to benchmark")
+        return 1
+    print(f"📄 {len(pages)} pages, {sum(len(html) for _, html in pages) / 1e6:.1f} MB")
+    benchmark(pages)
+    mismatches = parity_check(pages, "html.parser")
+    parity_check(pages, "lxml")
+    top_choice_agreement(pages, "html.parser", "head")
+    for mismatch in mismatches[:10]:
+        print(f"   {mismatch['url']}: expected {mismatch['expected'][:3]}, got {mismatch['got'][:3]}")
+    return 1 if mismatches else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,53 +1,104 @@
-import requests
 import os
-import mimetypes
+import sys
 import json
 import base64
+import asyncio
+import importlib.util
+import httpx
 from urllib.parse import urlparse
-from concurrent.futures import ThreadPoolExecutor
-from playwright_logo_fallback import download_playwright_fallback, get_country_from_domain
+from playwright_logo_fallback import BrowserPool, FallbackQueue, get_country_from_domain
+from image_ingest import save_logo, sniff_format
+from concurrency import AsyncHostScheduler
 
 FLARESOLVERR_URL = "http://localhost:8191/v1"
+MAX_DOWNLOAD_CONCURRENCY = int(os.getenv("MAX_DOWNLOAD_CONCURRENCY", "10"))
+# Prefix variants of one logo URL fetched at the same time; the first image wins
+PREFIX_RACE_WIDTH = int(os.getenv("PREFIX_RACE_WIDTH", "2"))
+FLARESOLVERR_CONCURRENCY = 5
+DOWNLOAD_TIMEOUT = 10
 output_dir = "logos"
-os.makedirs(output_dir, exist_ok=True)
-
-# Load input
-with open("logos_image_paths.json", "r", encoding="utf-8") as f:
-    json_input = json.load(f)
 
 prefixes = ["https://", "http://", "https://www.", "http://www."]
+HEADERS = {
+    "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/122.0.0.0 Safari/537.36"
+}
+
+# Adaptive window over one run's direct downloads, at most 2 in flight per logo host. One per run: asyncio
+# primitives belong to a single event loop, and runs without a DownloadService each bring their own.
+def make_download_scheduler():
+    return AsyncHostScheduler(
+        initial_window=5, max_window=MAX_DOWNLOAD_CONCURRENCY, target_latency=DOWNLOAD_TIMEOUT,
+        per_host_limit=2, host_backoff=1.0,
+    )
+
+# Logo-path lists are a JSON array or JSON Lines (one entry per line, as streamed by extraction)
+def load_logo_paths(path):
+    with open(path, "r", encoding="utf-8") as f:
+        if path.endswith(".jsonl"):
+            return [json.loads(line) for line in f if line.strip()]
+        return json.load(f)
 
 # Track already downloaded files
-already_downloaded = {os.path.splitext(f)[0].lower() for f in os.listdir(output_dir)}
+def downloaded_domains():
+    os.makedirs(output_dir, exist_ok=True)
+    return {os.path.splitext(f)[0].lower() for f in os.listdir(output_dir)}
 
-def get_extension(url, content_type):
-    ext_from_url = os.path.splitext(url)[-1]
-    if ext_from_url and len(ext_from_url) <= 5:
-        return ext_from_url
-    ext_from_type = mimetypes.guess_extension(content_type)
-    return ext_from_type or ".img"
+# One pooled client per run: keep-alive, HTTP/2 when the h2 package is installed
+def make_client():
+    return httpx.AsyncClient(
+        http2=importlib.util.find_spec("h2") is not None,
+        headers=HEADERS,
+        timeout=DOWNLOAD_TIMEOUT,
+        follow_redirects=True,
+        limits=httpx.Limits(max_connections=100, max_keepalive_connections=20, keepalive_expiry=30),
+    )
 
-def download_direct_image(url: str, domain: str) -> bool:
-    try:
-        headers = {
-            "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/122.0.0.0 Safari/537.36"
-        }
-        resp = requests.get(url, headers=headers, stream=True, timeout=10)
-        if resp.status_code == 200:
-            file_path = os.path.join(output_dir, f"{domain}.png")
-            with open(file_path, "wb") as f:
-                for chunk in resp.iter_content(1024):
-                    f.write(chunk)
-            print(f"✅ Direct image: {file_path}")
-            return True
-    except Exception as e:
-        print(f"❌ Direct download error: {e}")
-    return False
+def is_definitive(status):
+    # A 4xx (other than timeout/rate limit), or a 200 whose body isn't an image; None is a failed request
+    return status is not None and (status == 200 or (400 <= status < 500 and status not in (408, 429)))
 
-def download_image(url, domain):
-    if "logo.clearbit.com" in url:
-        return download_direct_image(url, domain)
+async def fetch_image(client, url, scheduler, statuses=None):
+    # Returns the body if it is an image (by magic bytes, whatever the headers say), None otherwise.
+    # Failures append their HTTP status (None for timeouts and connection errors) to `statuses`.
+    statuses = statuses if statuses is not None else []
+    async with scheduler.slot(urlparse(url).netloc) as slot:
+        try:
+            resp = await client.get(url)
+        except httpx.HTTPError as e:
+            print(f"❌ Direct download error for {url}: {e!r}")
+            slot.failed()
+            statuses.append(None)
+            return None
+        if resp.status_code == 429 or resp.status_code >= 500:
+            slot.failed()
+        if resp.status_code != 200 or sniff_format(resp.content) is None:
+            statuses.append(resp.status_code)
+            return None
+        return resp.content
 
+async def race_prefixes(client, raw_url, scheduler, statuses=None):
+    # Bounded race over the prefix variants; the first one that returns an image wins
+    gate = asyncio.Semaphore(PREFIX_RACE_WIDTH)
+
+    async def attempt(url):
+        async with gate:
+            result = await fetch_image(client, url, scheduler, statuses)
+            return None if result is None else (url, result)
+
+    tasks = [asyncio.create_task(attempt(prefix + raw_url.lstrip("/"))) for prefix in prefixes]
+    try:
+        for next_done in asyncio.as_completed(tasks):
+            result = await next_done
+            if result is not None:
+                return result
+        return None
+    finally:
+        for task in tasks:
+            task.cancel()
+
+async def download_flaresolverr(client, url, domain, gate, statuses=None):
+    # Failures append the target's HTTP status to `statuses`, or None if FlareSolverr itself failed or is down
+    statuses = statuses if statuses is not None else []
     payload = {
         "cmd": "request.get",
         "url": url,
@@ -56,42 +107,150 @@ def download_image(url, domain):
     }
 
     try:
-        resp = requests.post(FLARESOLVERR_URL, json=payload, timeout=30)
+        async with gate:
+            resp = await client.post(FLARESOLVERR_URL, json=payload, timeout=30)
         data = resp.json()
         if data.get("status") == "ok":
-            content_type = data["solution"].get("headers", {}).get("Content-Type", "")
             body = data["solution"].get("response")
 
-            if body and "image" in content_type:
-                ext = get_extension(url, content_type)
-                file_path = os.path.join(output_dir, f"{domain}{ext}")
-                with open(file_path, "wb") as f:
-                    f.write(base64.b64decode(body))
-                print(f"✅ FlareSolverr: {file_path}")
-                return True
+            if body:
+                file_path = await asyncio.to_thread(save_logo, base64.b64decode(body), domain, output_dir)
+                if file_path:
+                    print(f"✅ FlareSolverr: {file_path}")
+                    return True
+            statuses.append(data["solution"].get("status"))
+            return False
         else:
             print(f"❌ FlareSolverr error: {data.get('message')}")
     except Exception as e:
         print(f"❌ FlareSolverr exception: {e}")
+    statuses.append(None)
+    return False
 
-    print(f"🔁 Falling back to Playwright for: {url}")
-    country = get_country_from_domain(urlparse(url).netloc)
-    return download_playwright_fallback(url, domain, output_dir, country)
-
-def process_entry(entry):
+async def process_entry(client, entry, already_downloaded, gates, outcomes=None):
     domain = entry.get("domain")
     raw_url = entry.get("logo_url")
 
     if not domain or not raw_url or domain.lower() in already_downloaded:
-        return
+        return False
+    if outcomes and outcomes.is_blocked(domain, "download"):
+        print(f"⏭️ Skipping {domain}: download failed recently")
+        return False
 
     print(f"\n🔍 Processing: {domain}")
+    # Only a failure every attempt agrees on (4xx, not an image) is remembered; timeouts, 5xx or
+    # FlareSolverr being down leave no record, so the next run tries again
+    statuses = []
+    # 1. Plain GET on the pooled client
+    result = await race_prefixes(client, raw_url, gates["direct"], statuses)
+    # Decoding/validation runs off the event loop
+    file_path = result and await asyncio.to_thread(save_logo, result[1], domain, output_dir)
+    if file_path:
+        print(f"✅ Direct image: {file_path}")
+        if outcomes:
+            outcomes.record_success(domain, "download")
+        return True
+    if "logo.clearbit.com" in raw_url:
+        if outcomes and statuses and all(map(is_definitive, statuses)):
+            outcomes.record_failure(domain, "download", "clearbit image unavailable")
+        return False
+
+    # 2. FlareSolverr for bot-protected hosts, 3. Playwright with proxies
     for prefix in prefixes:
         full_url = prefix + raw_url.lstrip("/")
-        if download_image(full_url, domain):
-            return
+        ok = await download_flaresolverr(client, full_url, domain, gates["flaresolverr"], statuses)
+        if not ok:
+            print(f"🔁 Falling back to Playwright for: {full_url}")
+            country = get_country_from_domain(urlparse(full_url).netloc)
+            ok = await gates["playwright"].submit(full_url, domain, output_dir, country)
+            if ok is None:
+                # No proxy or browser available: nothing definitive was learned
+                statuses.append(None)
+        if ok:
+            if outcomes:
+                outcomes.record_success(domain, "download")
+            return True
     print(f"❌ All attempts failed for: {domain}")
+    if outcomes and all(map(is_definitive, statuses)):
+        codes = ", ".join(sorted({str(status) for status in statuses}))
+        outcomes.record_failure(domain, "download", f"every prefix failed for {raw_url} (HTTP {codes})")
+    return False
+
+# `entries` may be a (sync) generator: each entry is queued as soon as it is produced
+async def download_entries_async(entries, workers=MAX_DOWNLOAD_CONCURRENCY * 2, outcomes=None, fallback=None):
+    if fallback is None:
+        # No shared DownloadService: a browser pool for this run only, launched only if some entry reaches Playwright
+        async with BrowserPool() as pool, FallbackQueue(pool) as fallback:
+            return await download_entries_async(entries, workers, outcomes, fallback)
+
+    already_downloaded = downloaded_domains()
+    queue = asyncio.Queue(maxsize=workers * 2)
+    downloaded = 0
+
+    async with make_client() as client:
+        gates = {
+            "direct": make_download_scheduler(),
+            "flaresolverr": asyncio.Semaphore(FLARESOLVERR_CONCURRENCY),
+            "playwright": fallback,
+        }
+        async def worker():
+            nonlocal downloaded
+            while (entry := await queue.get()) is not None:
+                try:
+                    ok = await process_entry(client, entry, already_downloaded, gates, outcomes)
+                    downloaded += bool(ok)
+                except Exception as e:
+                    print(f"❌ Download failed for {entry.get('domain')}: {e}")
+
+        tasks = [asyncio.create_task(worker()) for _ in range(workers)]
+        iterator = iter(entries)
+        # Pull from the producer off the event loop, it may be parsing pages
+        while (entry := await asyncio.to_thread(next, iterator, None)) is not None:
+            await queue.put(entry)
+        for _ in tasks:
+            await queue.put(None)
+        await asyncio.gather(*tasks)
+
+    print(f"📊 Download scheduler: {gates['direct'].stats()}")
+    return downloaded
+
+class DownloadService:
+    # One BrowserPool and FallbackQueue on the API's event loop, shared by every download run until shutdown
+    def __init__(self):
+        self.pool = None
+        self.fallback = None
+        self.loop = None
+
+    @property
+    def running(self):
+        return self.fallback is not None
+
+    async def start(self):
+        # Browsers are still only launched once some entry reaches the Playwright step
+        self.loop = asyncio.get_running_loop()
+        self.pool = BrowserPool()
+        self.fallback = FallbackQueue(self.pool)
+        print("🚀 Shared download pool ready")
+
+    async def close(self):
+        if self.fallback is not None:
+            fallback, self.fallback = self.fallback, None
+            await fallback.close()
+        if self.pool is not None:
+            await self.pool.close()
+
+    async def download(self, entries, outcomes=None):
+        return await download_entries_async(entries, outcomes=outcomes, fallback=self.fallback)
+
+    def download_from_thread(self, entries, outcomes=None):
+        # For synchronous callers running outside the service's event loop
+        return asyncio.run_coroutine_threadsafe(self.download(entries, outcomes), self.loop).result()
+
+def download_entries(entries, outcomes=None, service=None):
+    if service is not None and service.running:
+        return service.download_from_thread(entries, outcomes)
+    return asyncio.run(download_entries_async(entries, outcomes=outcomes))
 
-# Run in parallel
-with ThreadPoolExecutor(max_workers=5) as executor:
-    executor.map(process_entry, json_input)
\ No newline at end of file
+# python flaresolverr_logo_download.py [logo_paths_file]
+if __name__ == "__main__":
+    download_entries(load_logo_paths(sys.argv[1] if len(sys.argv) > 1 else "logos_image_paths.json"))
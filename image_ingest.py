@@ -0,0 +1,159 @@
+import os
+import io
+import sys
+import hashlib
+import numpy as np
+from functools import lru_cache
+from PIL import Image, ImageOps
+from array_store import ArrayStore
+from workspace import atomic_write_bytes
+
+# The processor is locked to PIXEL_SIZE x PIXEL_SIZE, so logos are padded and resized to exactly that once, at ingest
+PIXEL_SIZE = 224
+PIXEL_STORE_PATH = os.getenv("LOGO_PIXEL_STORE", "logo_pixels/pixels")
+LOGO_EXTS = {
+    "png": ".png", "jpeg": ".jpg", "gif": ".gif", "webp": ".webp",
+    "avif": ".avif", "bmp": ".bmp", "ico": ".ico", "svg": ".svg",
+}
+# Extensions older downloads may have used for the same domain
+STALE_EXTS = set(LOGO_EXTS.values()) | {".jpeg", ".img"}
+
+
+class MissingDecoder(Exception):
+    # The format is fine but its decoder isn't installed here (e.g. cairo for SVG)
+    pass
+
+
+def sniff_format(data):
+    # Magic bytes decide the format, never the URL or the Content-Type header
+    head = data[:32]
+    if head.startswith(b"\x89PNG\r\n\x1a\n"):
+        return "png"
+    if head.startswith(b"\xff\xd8\xff"):
+        return "jpeg"
+    if head[:6] in (b"GIF87a", b"GIF89a"):
+        return "gif"
+    if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        return "webp"
+    if head[4:8] == b"ftyp" and (b"avif" in head[8:32] or b"avis" in head[8:32]):
+        return "avif"
+    if head.startswith(b"BM"):
+        return "bmp"
+    if head.startswith(b"\x00\x00\x01\x00"):
+        return "ico"
+    text = data[:4096].lstrip(b"\xef\xbb\xbf \t\r\n").lower()
+    if text.startswith(b"<svg") or (text[:5] in (b"<?xml", b"<!--", b"<!doc") and b"<svg" in text and b"<html" not in text):
+        return "svg"
+    return None
+
+
+def decode_image(data, fmt=None):
+    # RGB image; ValueError if the bytes aren't a usable image
+    fmt = fmt or sniff_format(data)
+    if fmt is None:
+        raise ValueError("not an image")
+    if fmt == "svg":
+        try:
+            import cairosvg
+        except (ImportError, OSError) as e:
+            raise MissingDecoder(f"can't rasterize SVG here ({str(e).splitlines()[0]})") from e
+        try:
+            data = cairosvg.svg2png(bytestring=data)
+        except Exception as e:
+            raise ValueError(f"unrenderable SVG: {e}") from e
+    elif fmt == "avif":
+        try:
+            # Registers the AVIF decoder with Pillow
+            import pillow_avif  # noqa: F401
+        except ImportError as e:
+            # Recent Pillow builds decode AVIF without the plugin
+            Image.init()
+            if "AVIF" not in Image.OPEN:
+                raise MissingDecoder(f"can't decode AVIF here ({e})") from e
+    try:
+        image = Image.open(io.BytesIO(data))
+        image.load()
+    except (OSError, SyntaxError, ValueError, Image.DecompressionBombError) as e:
+        raise ValueError(f"corrupt {fmt}: {e}") from e
+    if image.width < 2 or image.height < 2:
+        raise ValueError(f"{image.width}x{image.height} {fmt} is too small to be a logo")
+    return image.convert("RGB")
+
+
+def pad_to_square(image, fill=(255, 255, 255)):
+    w, h = image.size
+    max_dim = max(w, h)
+    delta_w = max_dim - w
+    delta_h = max_dim - h
+    padding = (delta_w // 2, delta_h // 2, delta_w - delta_w // 2, delta_h - delta_h // 2)
+    return ImageOps.expand(image, padding, fill=fill)
+
+
+def to_pixels(image, size=PIXEL_SIZE):
+    # White-padded square, resized with the same filter the processor would use
+    return np.asarray(pad_to_square(image).resize((size, size), Image.BICUBIC), dtype=np.uint8)
+
+
+def content_key(data):
+    return hashlib.sha256(data).hexdigest()
+
+
+@lru_cache(maxsize=1)
+def pixel_store(path=PIXEL_STORE_PATH):
+    # uint8 (PIXEL_SIZE, PIXEL_SIZE, 3) rows keyed by the sha256 of the logo file
+    return ArrayStore(path, (PIXEL_SIZE, PIXEL_SIZE, 3), np.uint8)
+
+
+def save_logo(data, domain, output_dir="logos", store=None):
+    # Validate and decode a downloaded logo once, save it under its real extension and store its pixels.
+    # Returns the saved path, or None if the bytes aren't a usable image (callers then try their next source).
+    fmt = sniff_format(data)
+    pixels = None
+    try:
+        pixels = to_pixels(decode_image(data, fmt))
+    except MissingDecoder as e:
+        print(f"⚠️ Saving {domain} without pixels: {e}")
+    except ValueError as e:
+        print(f"🗑️ Rejected logo for {domain}: {e}")
+        return None
+
+    path = os.path.join(output_dir, domain + LOGO_EXTS[fmt])
+    atomic_write_bytes(path, data)
+    for ext in STALE_EXTS - {LOGO_EXTS[fmt]}:
+        stale = os.path.join(output_dir, domain + ext)
+        if os.path.exists(stale):
+            os.remove(stale)
+    if pixels is not None:
+        (store if store is not None else pixel_store()).put(content_key(data), pixels)
+    return path
+
+
+def ingest_folder(folder="logos", store=None):
+    # One-off pass over logos saved before ingest existed: fix extensions, fill the pixel store, drop corrupt files
+    store = store if store is not None else pixel_store()
+    fixed = rejected = 0
+    for file in sorted(os.listdir(folder)):
+        path = os.path.join(folder, file)
+        domain, ext = os.path.splitext(file)
+        if not os.path.isfile(path) or ext.lower() not in STALE_EXTS:
+            continue
+        with open(path, "rb") as f:
+            data = f.read()
+        fmt = sniff_format(data)
+        if fmt and LOGO_EXTS[fmt] == ext.lower() and content_key(data) in store:
+            continue
+        saved = save_logo(data, domain, folder, store)
+        if saved is None:
+            os.remove(path)
+            rejected += 1
+        elif saved != path:
+            if os.path.exists(path):
+                os.remove(path)
+            fixed += 1
+    print(f"✅ Ingested {folder}: {fixed} extensions fixed, {rejected} corrupt files removed, {len(store)} logos in the pixel store")
+    return fixed, rejected
+
+
+# python image_ingest.py [logos_dir]
+if __name__ == "__main__":
+    ingest_folder(sys.argv[1] if len(sys.argv) > 1 else "logos")
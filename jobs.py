@@ -0,0 +1,95 @@
+import time
+import uuid
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+PIPELINE_STAGES = ["scrape", "extract", "download", "fallback", "cluster"]
+
+
+class QueueFullError(Exception):
+    pass
+
+
+class JobManager:
+    # Runs pipeline jobs on a bounded thread pool and keeps their status, per-stage progress and result
+    def __init__(self, max_workers=1, max_queued=20, max_finished=500):
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="job")
+        self.max_queued = max_queued
+        self.max_finished = max_finished
+        self.jobs = {}
+        self.lock = threading.Lock()
+
+    def submit(self, fn, *args, stages=PIPELINE_STAGES, **kwargs):
+        with self.lock:
+            queued = sum(1 for job in self.jobs.values() if job["status"] == "queued")
+            if queued >= self.max_queued:
+                raise QueueFullError(f"{queued} jobs already queued")
+            self._prune()
+            job_id = uuid.uuid4().hex
+            job = {
+                "id": job_id,
+                "status": "queued",
+                "stage": None,
+                "stages": {stage: {"status": "pending"} for stage in stages},
+                "created_at": time.time(),
+                "started_at": None,
+                "finished_at": None,
+                "error": None,
+                "result": None,
+            }
+            self.jobs[job_id] = job
+
+        def progress(stage, status="running", **details):
+            with self.lock:
+                job["stage"] = stage
+                job["stages"][stage] = {"status": status, "updated_at": time.time(), **details}
+
+        def run():
+            with self.lock:
+                job["status"] = "running"
+                job["started_at"] = time.time()
+            try:
+                result = fn(*args, progress=progress, **kwargs)
+                with self.lock:
+                    job["result"] = result
+                    job["status"] = "done"
+            except Exception as e:
+                print(f"❌ Job {job_id} failed: {e}")
+                with self.lock:
+                    job["error"] = str(e)
+                    job["status"] = "failed"
+                    if job["stage"]:
+                        job["stages"][job["stage"]]["status"] = "failed"
+            finally:
+                with self.lock:
+                    job["finished_at"] = time.time()
+
+        self.executor.submit(run)
+        return job_id
+
+    def _prune(self):
+        finished = [job for job in self.jobs.values() if job["finished_at"] is not None]
+        if len(finished) < self.max_finished:
+            return
+        finished.sort(key=lambda job: job["finished_at"])
+        for job in finished[:len(finished) - self.max_finished + 1]:
+            del self.jobs[job["id"]]
+
+    def status(self, job_id):
+        with self.lock:
+            job = self.jobs.get(job_id)
+            if job is None:
+                return None
+            view = {k: v for k, v in job.items() if k != "result"}
+            view["stages"] = {stage: dict(info) for stage, info in job["stages"].items()}
+            return view
+
+    def result(self, job_id):
+        with self.lock:
+            job = self.jobs.get(job_id)
+            if job is None:
+                return None
+            return {"id": job_id, "status": job["status"], "error": job["error"], "result": job["result"]}
+
+    def shutdown(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,200 @@
+import os
+import json
+import time
+import asyncio
+import threading
+import httpx
+from filelock import FileLock
+from io import BytesIO
+from datetime import datetime, timezone
+from PIL import Image
+from dotenv import load_dotenv
+from workspace import atomic_write_text
+
+load_dotenv()
+LOGODEV_API_KEY = os.getenv("LOGODEV_API_KEY")
+LOGODEV_DAILY_QUOTA = int(os.getenv("LOGODEV_DAILY_QUOTA", "5000"))
+LOGODEV_QUOTA_FILE = os.getenv("LOGODEV_QUOTA_FILE", "logodev_quota.json")
+LOGO_API_CONCURRENCY = int(os.getenv("LOGO_API_CONCURRENCY", "10"))
+LOGO_API_TIMEOUT = 10
+# Logo.dev answers 202 while it generates a logo: re-poll that domain alone, backing off, until the deadline
+POLL_INITIAL_DELAY = 15
+POLL_MAX_DELAY = 120
+POLL_DEADLINE = float(os.getenv("LOGODEV_POLL_DEADLINE", "300"))
+
+
+class DailyQuota:
+    # Requests spent today (UTC), persisted so separate jobs and restarts share one budget.
+    # Every check re-reads the file under a file lock: other jobs and API workers spend from it too.
+    def __init__(self, path=LOGODEV_QUOTA_FILE, limit=LOGODEV_DAILY_QUOTA):
+        self.path = path
+        self.limit = limit
+        self.lock = threading.Lock()
+        self.file_lock = FileLock(path + ".lock")
+        self.day = None
+        self.used = 0
+
+    def _today(self):
+        return datetime.now(timezone.utc).strftime("%Y-%m-%d")
+
+    def _load(self):
+        today = self._today()
+        self.day, self.used = today, 0
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            if data.get("day") == today:
+                self.used = int(data.get("used", 0))
+        except (OSError, ValueError):
+            pass
+
+    def _save(self):
+        atomic_write_text(self.path, json.dumps({"day": self.day, "used": self.used}))
+
+    def remaining(self):
+        with self.lock, self.file_lock:
+            self._load()
+            return max(self.limit - self.used, 0)
+
+    def acquire(self):
+        # False once today's budget is spent: the request would only be rejected
+        with self.lock, self.file_lock:
+            self._load()
+            if self.used >= self.limit:
+                return False
+            self.used += 1
+            self._save()
+            return True
+
+    def exhaust(self):
+        # The server said we're over (429) even if our count disagrees
+        with self.lock, self.file_lock:
+            self._load()
+            self.used = self.limit
+            self._save()
+
+
+def is_valid_image(content):
+    try:
+        img = Image.open(BytesIO(content))
+        return img.width > 1 and img.height > 1
+    except Exception:
+        return False
+
+
+async def get_logo_logodev(client, domain, quota):
+    if not LOGODEV_API_KEY:
+        return None, None
+    if not quota.acquire():
+        print(f"🪫 Logo.dev daily quota used up, skipping {domain}")
+        return None, 429
+    url = f"https://img.logo.dev/{domain}?token={LOGODEV_API_KEY}&fallback=404"
+    try:
+        response = await client.get(url)
+        if response.status_code == 200 and response.headers.get("Content-Type", "").startswith("image"):
+            return url, 200
+        elif response.status_code == 202:
+            print(f"🕒 Logo.dev is processing {domain} (202)")
+            return None, 202
+        elif response.status_code == 404:
+            print(f"🚫 Logo.dev: No logo for {domain} (404)")
+            return None, 404
+        elif response.status_code == 429:
+            print("🪫 Logo.dev rate limit reached (429)")
+            quota.exhaust()
+            return None, 429
+        else:
+            print(f"🟥 Logo.dev failed for {domain} (status {response.status_code})")
+            return None, response.status_code
+    except httpx.HTTPError as e:
+        print(f"⚠️ Logo.dev request error for {domain}: {e!r}")
+        return None, None
+
+
+async def get_logo_clearbit(client, domain):
+    url = f"https://logo.clearbit.com/{domain}"
+    try:
+        response = await client.get(url)
+        if response.status_code == 200 and response.headers.get("Content-Type", "").startswith("image"):
+            if is_valid_image(response.content):
+                return url, 200
+            print(f"🟥 Clearbit returned invalid image for {domain}")
+            return None, 200
+        print(f"🟥 Clearbit failed for {domain} (status {response.status_code})")
+        return None, response.status_code
+    except httpx.HTTPError as e:
+        print(f"⚠️ Clearbit error for {domain}: {e!r}")
+        return None, None
+
+
+def record_outcome(outcomes, domain, provider, url, status):
+    # Only definitive answers are remembered: a logo, a 404, or an image that isn't usable
+    if outcomes is None:
+        return
+    if url:
+        outcomes.record_success(domain, provider)
+    elif status == 404:
+        outcomes.record_failure(domain, provider, "404")
+    elif status == 200:
+        outcomes.record_failure(domain, provider, "invalid image")
+
+
+async def lookup_domain(client, domain, quota, gate, use_logodev=True, use_clearbit=True, outcomes=None):
+    print(f"🔍 Looking for logo for: {domain}")
+
+    async def no_result():
+        return None, None
+
+    # Both providers at once; Logo.dev wins when both have a logo
+    async with gate:
+        (dev_url, dev_status), (clearbit_url, clearbit_status) = await asyncio.gather(
+            get_logo_logodev(client, domain, quota) if use_logodev else no_result(),
+            get_logo_clearbit(client, domain) if use_clearbit else no_result(),
+        )
+    if use_logodev:
+        record_outcome(outcomes, domain, "logodev", dev_url, dev_status)
+    if use_clearbit:
+        record_outcome(outcomes, domain, "clearbit", clearbit_url, clearbit_status)
+    if dev_url or clearbit_url:
+        return dev_url or clearbit_url
+    if dev_status != 202:
+        return None
+
+    # Only this domain waits for Logo.dev; the rest of the batch carries on
+    delay = POLL_INITIAL_DELAY
+    deadline = time.monotonic() + POLL_DEADLINE
+    while time.monotonic() + delay <= deadline:
+        await asyncio.sleep(delay)
+        async with gate:
+            dev_url, dev_status = await get_logo_logodev(client, domain, quota)
+        if dev_status != 202:
+            record_outcome(outcomes, domain, "logodev", dev_url, dev_status)
+            if dev_url:
+                print(f"✅ Logo now available for {domain}")
+            return dev_url
+        delay = min(delay * 2, POLL_MAX_DELAY)
+    print(f"⌛ Logo.dev still processing {domain}, giving up")
+    return None
+
+
+async def fetch_logos_async(domains, use_logodev=True, use_clearbit=True, quota=None,
+                            concurrency=LOGO_API_CONCURRENCY, outcomes=None):
+    quota = quota or DailyQuota()
+    # Providers that recently had nothing for a domain are not asked again until their retry window ends
+    skip_logodev = outcomes.blocked(domains, ["logodev"]) if outcomes else set()
+    skip_clearbit = outcomes.blocked(domains, ["clearbit"]) if outcomes else set()
+    if use_logodev and LOGODEV_API_KEY:
+        print(f"📊 Logo.dev quota left today: {quota.remaining()}/{quota.limit}")
+    gate = asyncio.Semaphore(concurrency)
+    async with httpx.AsyncClient(timeout=LOGO_API_TIMEOUT, follow_redirects=True) as client:
+        urls = await asyncio.gather(*(
+            lookup_domain(client, domain, quota, gate, use_logodev and domain not in skip_logodev,
+                          use_clearbit and domain not in skip_clearbit, outcomes)
+            for domain in domains
+        ))
+    # Same shape as the scraped logo paths; "NO_LOGO_FOUND" if nothing was found
+    return [{"domain": domain, "logo_url": url or 'NO_LOGO_FOUND'} for domain, url in zip(domains, urls)]
+
+
+def fetch_logos_for_domains(domains, use_logodev=True, use_clearbit=True, outcomes=None):
+    return asyncio.run(fetch_logos_async(domains, use_logodev, use_clearbit, outcomes=outcomes))
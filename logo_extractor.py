@@ -1,13 +1,41 @@
 import os
 import re
+import itertools
+import multiprocessing
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+from html.parser import HTMLParser
 from urllib.parse import urljoin, urlparse
-from bs4 import BeautifulSoup
 import tldextract
 
+# bs4 is only needed by the reference extractor (find_logos_in_html_bs4) and lxml only by the
+# "lxml" parser mode; both are imported where they're used.
+
 BOOST_KEYWORDS = ["logo"]
 PENALTY_KEYWORDS = ["icon", "favicon", "payment", "visa", "mastercard", "amex", "badge", "banner", "ads", "social", "heritage"]
 EXT_PRIORITY = ['.svg', '.png', '.jpg', '.jpeg', '.ico']
 
+# "html.parser" ranks exactly like the bs4 reference; "lxml" is faster but builds its tree
+# differently on malformed markup, so rankings can differ on some pages
+HTML_PARSER = os.getenv("LOGO_HTML_PARSER", "html.parser")
+# "head" stops parsing once the <head>, the header/nav region and HEAD_BYTE_BUDGET bytes have been
+# seen and a strong candidate (score <= STRONG_CANDIDATE_SCORE) was found; otherwise it parses the rest
+PARSE_MODE = os.getenv("LOGO_PARSE_MODE", "full")
+HEAD_BYTE_BUDGET = int(os.getenv("LOGO_HEAD_BYTE_BUDGET", "65536"))
+STRONG_CANDIDATE_SCORE = int(os.getenv("LOGO_STRONG_SCORE", "60"))
+PARSE_CHUNK_SIZE = 16384
+# Processes used to parse cached pages in parallel
+EXTRACT_WORKERS = int(os.getenv("EXTRACT_WORKERS", str(os.cpu_count() or 1)))
+
+# Tags html.parser/bs4 treat as self-closing
+VOID_TAGS = {
+    "area", "base", "basefont", "bgsound", "br", "col", "command", "embed", "frame", "hr", "image", "img",
+    "input", "isindex", "keygen", "link", "menuitem", "meta", "nextid", "param", "source", "spacer", "track", "wbr",
+}
+# Tags whose strings bs4 stores as Script/Stylesheet/TemplateString/Ruby*String, which get_text() leaves out
+STRING_CONTAINERS = ("script", "style", "template", "rt", "rp")
+TOKEN_RE = re.compile(r"\S+")
+
 def extract_brand_name(domain_name):
     extracted = tldextract.extract(domain_name)
     return extracted.domain.lower()
@@ -32,46 +60,54 @@ def is_in_preferred_section(tag):
             return True
     return False
 
+def is_logo_wrapper(attrs):
+    if not attrs:
+        return False
+    classes = attrs.get("class", [])
+    id_attr = attrs.get("id", "")
+    combined = " ".join(classes + [id_attr]).lower()
+    return "logo" in combined or "brand" in combined
+
 def is_in_logo_wrapper(tag):
     for parent in tag.parents:
-        if not parent or not getattr(parent, "attrs", None):
-            continue
-        classes = parent.get("class", [])
-        id_attr = parent.get("id", "")
-        combined = " ".join(classes + [id_attr]).lower()
-        if "logo" in combined or "brand" in combined:
+        if parent and is_logo_wrapper(getattr(parent, "attrs", None)):
             return True
     return False
 
-def extract_background_image(tag, base_url):
-    style = tag.get("style", "")
+def extract_background_image(attrs, base_url):
+    style = attrs.get("style", "")
     match = re.search(r'background-image:\s*url\(["\']?(.*?)["\']?\)', style)
     if match:
         return normalize_url(base_url, match.group(1))
     return None
 
 def candidate_score(tag, base_url, brand_name):
+    return score_candidate(tag.attrs, lambda: is_in_preferred_section(tag), lambda: is_in_logo_wrapper(tag), base_url, brand_name)
+
+def score_candidate(attrs, in_preferred_section, in_logo_wrapper, base_url, brand_name):
+    # attrs as bs4 stores them (class is a token list); the two section checks are callables so
+    # the bs4 reference only walks the parents when there is a candidate URL
     score = 100
     candidate_url = None
 
     src = (
-        tag.get("src") or
-        tag.get("data-src") or
-        tag.get("data-srcset") or
-        tag.get("srcset")
+        attrs.get("src") or
+        attrs.get("data-src") or
+        attrs.get("data-srcset") or
+        attrs.get("srcset")
     )
 
     if not src:
-        src = tag.get("href") or tag.get("content")
+        src = attrs.get("href") or attrs.get("content")
     if not src:
-        candidate_url = extract_background_image(tag, base_url)
+        candidate_url = extract_background_image(attrs, base_url)
         if not candidate_url:
             return None, score
     else:
         candidate_url = normalize_url(base_url, src)
 
     lower_url = candidate_url.lower()
-    attr_text = " ".join([str(tag.get(attr, "")) for attr in ["src", "alt", "title", "class", "id"]]).lower()
+    attr_text = " ".join([str(attrs.get(attr, "")) for attr in ["src", "alt", "title", "class", "id"]]).lower()
 
     for word in BOOST_KEYWORDS:
         if word in attr_text or word in lower_url:
@@ -79,9 +115,9 @@ def candidate_score(tag, base_url, brand_name):
     for word in PENALTY_KEYWORDS:
         if word in attr_text or word in lower_url:
             score += 30
-    if is_in_preferred_section(tag):
+    if in_preferred_section():
         score -= 20
-    if is_in_logo_wrapper(tag):  # ✅ new logic
+    if in_logo_wrapper():  # ✅ new logic
         score -= 40
     if brand_name in lower_url:
         score -= 10
@@ -101,15 +137,24 @@ def has_inline_logo_svg(soup, brand_name):
             return True
 
         for parent in svg.parents:
-            if not parent or not getattr(parent, "attrs", None):
-                continue
-            class_id = " ".join(parent.get("class", []) + [parent.get("id", "")]).lower()
-            if "logo" in class_id or "brand" in class_id:
+            if parent and is_logo_wrapper(getattr(parent, "attrs", None)):
                 return True
 
     return False
 
-def find_logos_in_html(html, base_url):
+def rank_candidates(candidates):
+    best = {}
+    for url, score in candidates:
+        if url not in best or score < best[url]:
+            best[url] = score
+
+    sorted_candidates = sorted(best.items(), key=lambda x: x[1])
+    return [url for url, score in sorted_candidates]
+
+def find_logos_in_html_bs4(html, base_url):
+    # Reference implementation; find_logos_in_html must rank exactly like this
+    from bs4 import BeautifulSoup
+
     soup = BeautifulSoup(html, "html.parser")
     brand_name = extract_brand_name(urlparse(base_url).netloc)
 
@@ -130,13 +175,230 @@ def find_logos_in_html(html, base_url):
         if candidate_url:
             candidates.append((candidate_url, score))
 
-    best = {}
-    for url, score in candidates:
-        if url not in best or score < best[url]:
-            best[url] = score
+    return rank_candidates(candidates)
 
-    sorted_candidates = sorted(best.items(), key=lambda x: x[1])
-    return [url for url, score in sorted_candidates]
+class InlineSvgLogo(Exception):
+    # Raised to stop parsing as soon as the page is known to draw its logo inline
+    pass
+
+def detach(frames, frame):
+    # Frames are lists, so list.remove() would match any equal-looking frame: remove this one, if still there
+    for i, other in enumerate(frames):
+        if other is frame:
+            del frames[i]
+            return True
+    return False
+
+class CandidateScanner:
+    # Single pass over start/end/data events that rebuilds only what the scorer needs: for each open
+    # element, whether it or an ancestor is header/nav or a logo/brand wrapper. The stack follows
+    # bs4's html.parser tree building, so every tag sees the same parents it would in the soup.
+    def __init__(self, base_url, brand_name):
+        self.base_url = base_url
+        self.brand_name = brand_name
+        self.stack = []  # [name, in_section, in_wrapper, svgs_titled_by_this, title_text]
+        self.open_counts = Counter()
+        self.closed_voids = []
+        self.untitled_svgs = []
+        self.title_frames = []
+        # Same order as the bs4 find_all passes: img/source, icon links, og:image, background divs
+        self.buckets = ([], [], [], [])
+        self.head_done = False
+        self.section_seen = False
+
+    def start(self, name, attrs, handle_void=True):
+        parent = self.stack[-1] if self.stack else None
+        in_section = parent[1] if parent else False
+        in_wrapper = parent[2] if parent else False
+
+        if name == "svg":
+            class_attr = " ".join(attrs.get("class", [])).lower()
+            if "logo" in class_attr or in_wrapper or not self.brand_name:
+                raise InlineSvgLogo()
+
+        bucket = None
+        if name == "img" or name == "source":
+            bucket = 0
+        elif name == "link":
+            rel = attrs.get("rel")
+            if rel and "icon" in " ".join(rel).lower():
+                bucket = 1
+        elif name == "meta":
+            if attrs.get("property") == "og:image":
+                bucket = 2
+        elif name == "div":
+            style = attrs.get("style")
+            if style and "background-image" in style.lower():
+                bucket = 3
+        if bucket is not None:
+            candidate_url, score = score_candidate(
+                attrs, lambda: in_section, lambda: in_wrapper, self.base_url, self.brand_name
+            )
+            if candidate_url:
+                self.buckets[bucket].append((candidate_url, score))
+
+        if name == "body":
+            self.head_done = True
+
+        if handle_void and name in VOID_TAGS:
+            self.closed_voids.append(name)
+            return
+
+        frame = [name, in_section or name in ("header", "nav"), in_wrapper or is_logo_wrapper(attrs), None, None]
+        if name == "svg":
+            self.untitled_svgs.append(frame)
+        elif name == "title" and self.untitled_svgs:
+            # First <title> anywhere under each open svg that doesn't have one yet
+            frame[3] = self.untitled_svgs
+            frame[4] = []
+            self.untitled_svgs = []
+            self.title_frames.append(frame)
+        self.stack.append(frame)
+        self.open_counts[name] += 1
+
+    def end(self, name, check_closed_voids=True):
+        if check_closed_voids and name in self.closed_voids:
+            self.closed_voids.remove(name)
+            return
+        # Like bs4: pop up to the most recent open tag with this name, ignore stray end tags
+        while self.open_counts[name]:
+            if self.pop()[0] == name:
+                break
+
+    def pop(self):
+        frame = self.stack.pop()
+        self.open_counts[frame[0]] -= 1
+        if frame[0] == "head":
+            self.head_done = True
+        elif frame[0] in ("header", "nav"):
+            self.section_seen = True
+        if frame[0] == "svg":
+            detach(self.untitled_svgs, frame)
+        elif frame[3] is not None and detach(self.title_frames, frame):
+            if self.brand_name in "".join(frame[4]).lower():
+                raise InlineSvgLogo()
+        return frame
+
+    def data(self, text, cdata=False):
+        # Like the svg <title>'s get_text(): skip strings inside string containers, but CDATA sections always count
+        if not self.title_frames:
+            return
+        if not cdata and any(self.open_counts[name] for name in STRING_CONTAINERS):
+            return
+        for frame in self.title_frames:
+            frame[4].append(text)
+
+    def close(self):
+        while self.stack:
+            self.pop()
+
+    def in_section(self):
+        return bool(self.stack) and self.stack[-1][1]
+
+    def best_score(self):
+        return min((score for bucket in self.buckets for _, score in bucket), default=None)
+
+    def ranked(self):
+        return rank_candidates([c for bucket in self.buckets for c in bucket])
+
+def bs4_attrs(name, attrs):
+    # Attribute dict as bs4 builds it: last duplicate wins, bare attributes are "", class/rel are token lists
+    attr_dict = {}
+    for key, value in attrs:
+        attr_dict[key] = "" if value is None else value
+    if "class" in attr_dict:
+        attr_dict["class"] = TOKEN_RE.findall(attr_dict["class"])
+    if "rel" in attr_dict and name in ("link", "a", "area"):
+        attr_dict["rel"] = TOKEN_RE.findall(attr_dict["rel"])
+    return attr_dict
+
+class ScannerHTMLParser(HTMLParser):
+    def __init__(self, scanner):
+        super().__init__(convert_charrefs=True)
+        self.scanner = scanner
+
+    def handle_starttag(self, tag, attrs):
+        self.scanner.start(tag, bs4_attrs(tag, attrs))
+
+    def handle_startendtag(self, tag, attrs):
+        self.scanner.start(tag, bs4_attrs(tag, attrs), handle_void=False)
+        self.scanner.end(tag, check_closed_voids=False)
+
+    def handle_endtag(self, tag):
+        self.scanner.end(tag)
+
+    def handle_data(self, data):
+        self.scanner.data(data)
+
+    def unknown_decl(self, data):
+        # bs4 keeps <![CDATA[...]]> as text, even inside script/style
+        if data.upper().startswith("CDATA["):
+            self.scanner.data(data[len("CDATA["):], cdata=True)
+
+class ScannerLxmlTarget:
+    def __init__(self, scanner):
+        self.scanner = scanner
+
+    def start(self, tag, attrib):
+        self.scanner.start(tag, bs4_attrs(tag, attrib.items()), handle_void=False)
+
+    def end(self, tag):
+        self.scanner.end(tag, check_closed_voids=False)
+
+    def data(self, data):
+        self.scanner.data(data)
+
+    def close(self):
+        pass
+
+def scan_html(html, scanner, parser=HTML_PARSER, stop=None):
+    # Feeds the page in chunks; returns False if `stop(bytes_fed)` ended the scan before the end
+    if parser == "lxml":
+        from lxml import etree
+        feeder = etree.HTMLParser(target=ScannerLxmlTarget(scanner))
+        errors = (etree.LxmlError,)
+    else:
+        feeder = ScannerHTMLParser(scanner)
+        errors = ()
+    try:
+        for start in range(0, len(html), PARSE_CHUNK_SIZE):
+            feeder.feed(html[start:start + PARSE_CHUNK_SIZE])
+            fed = start + PARSE_CHUNK_SIZE
+            if stop and fed < len(html) and stop(fed):
+                return False
+        feeder.close()
+    except errors:
+        # Empty or unparseable documents keep whatever was scanned so far
+        pass
+    scanner.close()
+    return True
+
+def head_region_stop(scanner, byte_budget=HEAD_BYTE_BUDGET, strong_score=STRONG_CANDIDATE_SCORE):
+    # Decides once, when head + header/nav region (or the byte budget) are behind us: stop if the best
+    # candidate so far is strong, otherwise keep parsing to the end
+    decided = False
+
+    def stop(fed):
+        nonlocal decided
+        if decided or not scanner.head_done or scanner.in_section():
+            return False
+        if not scanner.section_seen and fed < byte_budget:
+            return False
+        decided = True
+        best = scanner.best_score()
+        return best is not None and best <= strong_score
+
+    return stop
+
+def find_logos_in_html(html, base_url, parser=HTML_PARSER, mode=PARSE_MODE):
+    brand_name = extract_brand_name(urlparse(base_url).netloc)
+    scanner = CandidateScanner(base_url, brand_name)
+    stop = head_region_stop(scanner) if mode == "head" else None
+    try:
+        scan_html(html, scanner, parser, stop)
+    except InlineSvgLogo:
+        return []
+    return scanner.ranked()
 
 def is_valid_logo(logo_url, domain_name):
     test_url = logo_url.strip().lower()
@@ -148,27 +410,67 @@ def is_valid_logo(logo_url, domain_name):
     else:
         return "NO_LOGO_FOUND"
 
-def extract_logo_url_from_html(folder_path, domains):
-    domains = set(d.strip().lower() for d in domains)
-    logo_data = []
-
+def extract_logo_entry(domain, html):
+    # One unparseable page must not end the whole stream
+    try:
+        candidates = find_logos_in_html(html, f"https://{domain}")
+    except Exception as e:
+        print(f"❌ Logo extraction failed for {domain}: {e}")
+        candidates = []
+    if candidates:
+        return {"domain": domain, "logo_url": is_valid_logo(candidates[0], domain)}
+    return {"domain": domain, "logo_url": "NO_LOGO_FOUND"}
+
+def extract_logo_urls_from_pages(pages):
+    # pages: iterable of (domain, html)
+    return [extract_logo_entry(domain, html) for domain, html in pages]
+
+# Each pool worker opens its own handle on the page cache and reads + parses pages itself,
+# so only domain names and small result dicts cross the process boundary
+_worker_cache = None
+
+def _init_cache_worker(cache_root):
+    global _worker_cache
+    from page_cache import PageCache
+    _worker_cache = PageCache(cache_root)
+
+def _extract_cached_page(domain):
+    html = _worker_cache.get_html(domain)
+    return None if html is None else extract_logo_entry(domain, html)
+
+def iter_cached_logo_urls(cache, domains, workers=EXTRACT_WORKERS, prefetch=4):
+    # Yields one {"domain", "logo_url"} per cached page as soon as it is parsed (completion order)
+    cached = sorted(cache.cached_domains(domains, fresh_only=False))
+    if workers <= 1 or len(cached) < 2:
+        for domain, html in cache.iter_pages(cached):
+            yield extract_logo_entry(domain, html)
+        return
+
+    pending = set()
+    todo = iter(cached)
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=workers, mp_context=context, initializer=_init_cache_worker, initargs=(cache.root,)) as executor:
+        # Keep a bounded number of pages in flight so results start flowing immediately
+        for domain in itertools.islice(todo, workers * prefetch):
+            pending.add(executor.submit(_extract_cached_page, domain))
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                entry = future.result()
+                if entry is not None:
+                    yield entry
+                for domain in itertools.islice(todo, 1):
+                    pending.add(executor.submit(_extract_cached_page, domain))
+
+def iter_html_folder(folder_path, domains):
     for file in os.listdir(folder_path):
         if file.endswith(".html"):
             domain = file.replace(".html", "").lower()
             if domain not in domains:
                 continue
+            with open(os.path.join(folder_path, file), "r", encoding="utf-8") as f:
+                yield domain, f.read()
 
-            path = os.path.join(folder_path, file)
-
-            with open(path, "r", encoding="utf-8") as f:
-                html = f.read()
-                candidates = find_logos_in_html(html, f"https://{domain}")
-                if candidates:
-                    logo_url = candidates[0]
-                    logo_url = is_valid_logo(logo_url, domain)
-                    logo_data.append({"domain": domain, "logo_url": logo_url})
-                else:
-                    logo_data.append({"domain": domain, "logo_url": "NO_LOGO_FOUND"})
-
-    return logo_data
-
+def extract_logo_url_from_html(folder_path, domains):
+    domains = set(d.strip().lower() for d in domains)
+    return extract_logo_urls_from_pages(iter_html_folder(folder_path, domains))
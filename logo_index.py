@@ -0,0 +1,195 @@
+import os
+import json
+import numpy as np
+import hnswlib
+from filelock import FileLock
+from concurrency import ReadWriteLock
+from workspace import atomic_path, atomic_output
+
+INDEX_PATH = "hnsw_index.bin"
+
+
+def sidecar_path(index_path):
+    return os.path.splitext(index_path)[0] + "_domains.json"
+
+
+def file_lock(index_path):
+    # Held while the index and its domain map are written or read, so every process sees a matching pair
+    return FileLock(index_path + ".lock")
+
+
+class LogoIndex:
+    # hnswlib index whose integer labels are stable per-domain IDs, with the ID -> domain map saved next to it
+    def __init__(self, index, space, dim, domain_ids=None, deleted=None, next_id=0):
+        self.index = index
+        self.space = space
+        self.dim = dim
+        self.domain_ids = dict(domain_ids or {})
+        self.deleted = set(deleted or ())
+        self.next_id = next_id
+        self.lock = ReadWriteLock()
+        self.id_domains = {i: d for d, i in self.domain_ids.items()}
+
+    @classmethod
+    def create(cls, dim, space="l2", max_elements=1024, ef=100, ef_construction=200, M=64):
+        index = hnswlib.Index(space=space, dim=dim)
+        index.init_index(max_elements=max_elements, ef_construction=ef_construction, M=M)
+        index.set_ef(ef)
+        return cls(index, space, dim)
+
+    @classmethod
+    def load(cls, path=INDEX_PATH, ef=100):
+        with file_lock(path):
+            with open(sidecar_path(path), "r", encoding="utf-8") as f:
+                meta = json.load(f)
+            index = hnswlib.Index(space=meta["space"], dim=meta["dim"])
+            index.load_index(path, max_elements=meta.get("max_elements", 0))
+        index.set_ef(ef)
+        return cls(index, meta["space"], meta["dim"], meta["domains"], meta.get("deleted", []), meta["next_id"])
+
+    @classmethod
+    def load_or_create(cls, path=INDEX_PATH, dim=None, space="l2", ef=100, **create_kwargs):
+        if path and os.path.exists(path) and os.path.exists(sidecar_path(path)):
+            try:
+                logo_index = cls.load(path, ef=ef)
+                if (dim is None or logo_index.dim == dim) and logo_index.space == space:
+                    return logo_index
+                print(f"⚠️ {path} was built with dim={logo_index.dim}, space={logo_index.space}; starting a new index")
+            except Exception as e:
+                print(f"⚠️ Could not load {path}: {e}; starting a new index")
+        elif path and os.path.exists(path):
+            print(f"⚠️ {path} has no domain map ({sidecar_path(path)}); starting a new index")
+        if dim is None:
+            raise ValueError("dim is required to create a new index")
+        return cls.create(dim, space=space, ef=ef, **create_kwargs)
+
+    # Queries share the lock and run side by side; upsert()/delete() take it alone, since resize_index()
+    # reallocates the graph under a concurrent query. Methods holding it never call another one that takes it.
+    def _len(self):
+        return len(self.domain_ids) - len(self.deleted)
+
+    def __len__(self):
+        with self.lock.read():
+            return self._len()
+
+    def __contains__(self, domain):
+        with self.lock.read():
+            domain_id = self.domain_ids.get(domain)
+            return domain_id is not None and domain_id not in self.deleted
+
+    def domains(self):
+        with self.lock.read():
+            return [d for d, i in self.domain_ids.items() if i not in self.deleted]
+
+    def domain_for(self, domain_id):
+        with self.lock.read():
+            return self.id_domains.get(int(domain_id))
+
+    def _ensure_capacity(self, extra):
+        needed = self.index.element_count + extra
+        capacity = self.index.get_max_elements()
+        if needed > capacity:
+            self.index.resize_index(max(needed, capacity * 2))
+
+    def upsert(self, domains, embeddings):
+        embeddings = np.asarray(embeddings, dtype=np.float32)
+        with self.lock.write():
+            ids = []
+            new = 0
+            for domain in domains:
+                domain_id = self.domain_ids.get(domain)
+                if domain_id is None:
+                    domain_id = self.next_id
+                    self.next_id += 1
+                    self.domain_ids[domain] = domain_id
+                    self.id_domains[domain_id] = domain
+                    new += 1
+                elif domain_id in self.deleted:
+                    self.index.unmark_deleted(domain_id)
+                    self.deleted.discard(domain_id)
+                ids.append(domain_id)
+            self._ensure_capacity(new)
+            # Existing labels are updated in place by hnswlib
+            if ids:
+                self.index.add_items(embeddings, np.asarray(ids, dtype=np.int64))
+            return ids
+
+    def delete(self, domains):
+        with self.lock.write():
+            removed = 0
+            for domain in domains:
+                domain_id = self.domain_ids.get(domain)
+                if domain_id is None or domain_id in self.deleted:
+                    continue
+                self.index.mark_deleted(domain_id)
+                self.deleted.add(domain_id)
+                removed += 1
+            return removed
+
+    def get_embeddings(self, domains):
+        with self.lock.read():
+            ids = [self.domain_ids[d] for d in domains]
+            if not ids:
+                return np.empty((0, self.dim), dtype=np.float32)
+            return np.asarray(self.index.get_items(ids), dtype=np.float32)
+
+    def empty_result(self, embeddings):
+        queries = np.asarray(embeddings, dtype=np.float32).reshape(-1, self.dim)
+        return np.empty((len(queries), 0), dtype=np.uint64), np.empty((len(queries), 0), dtype=np.float32)
+
+    def _knn_query(self, embeddings, k=10, filter=None):
+        k = min(k, self._len())
+        if k <= 0:
+            return self.empty_result(embeddings)
+        if filter is None:
+            return self.index.knn_query(embeddings, k=k)
+        return self.index.knn_query(embeddings, k=k, num_threads=1, filter=filter)
+
+    def knn_query(self, embeddings, k=10, filter=None):
+        with self.lock.read():
+            return self._knn_query(embeddings, k=k, filter=filter)
+
+    def knn_positions(self, embeddings, domains, k=10):
+        # Neighbours restricted to `domains`, returned as positions into that list
+        with self.lock.read():
+            ids = np.asarray([self.domain_ids[d] for d in domains], dtype=np.int64)
+            wanted = set(ids.tolist())
+            k = min(k, len(wanted))
+            if k <= 0:
+                return self.empty_result(embeddings)
+            if len(wanted) == self._len():
+                labels, distances = self._knn_query(embeddings, k=k)
+            else:
+                # A slow filtered walk, but it only holds back upserts, never other queries
+                labels, distances = self._knn_query(embeddings, k=k, filter=lambda label: label in wanted)
+        order = np.argsort(ids)
+        positions = order[np.searchsorted(ids, labels, sorter=order)]
+        return positions, distances
+
+    def similar(self, embedding, k=10, exclude=None):
+        query = np.asarray(embedding, dtype=np.float32).reshape(1, -1)
+        with self.lock.read():
+            labels, distances = self._knn_query(query, k=k + (1 if exclude else 0))
+            domains = [self.id_domains.get(int(label)) for label in labels[0]]
+        results = []
+        for domain, distance in zip(domains, distances[0]):
+            if domain is None or domain == exclude:
+                continue
+            results.append({"domain": domain, "score": float(1 - distance)})
+        return results[:k]
+
+    def save(self, path=INDEX_PATH):
+        # Several API workers save to the same path: unique temp files, and the pair replaced under a file lock
+        with self.lock.read(), file_lock(path):
+            meta = {
+                "space": self.space,
+                "dim": self.dim,
+                "max_elements": self.index.get_max_elements(),
+                "next_id": self.next_id,
+                "domains": self.domain_ids,
+                "deleted": sorted(self.deleted),
+            }
+            with atomic_path(path) as tmp_path:
+                self.index.save_index(tmp_path)
+            with atomic_output(sidecar_path(path), "w") as f:
+                json.dump(meta, f)
@@ -1,63 +1,252 @@
-from fastapi import FastAPI
+import os
+import asyncio
+import threading
+import importlib
+from contextlib import asynccontextmanager
+from typing import List
+from fastapi import FastAPI, HTTPException, File, Query, UploadFile
 from fastapi import BackgroundTasks
+from fastapi.responses import JSONResponse
 from pydantic import BaseModel
-from typing import List
-import os
 from dotenv import load_dotenv
-import torch
-from transformers import AutoProcessor, AutoModel
 
-from clustering import clustering
-from web_scraping import get_logos
+from jobs import JobManager, QueueFullError
+
+# torch, transformers and the clustering/scraping stacks are imported lazily so the
+# server can bind its port immediately; the model is loaded in the lifespan hook.
 
 
 load_dotenv()
 LOGODEV_API_KEY = os.getenv("LOGODEV_API_KEY")
+SIMILARITY_METRIC = os.getenv("SIMILARITY_METRIC", "l2")
+DEDUPE_LOGOS = os.getenv("DEDUPE_LOGOS", "0") == "1"
+EMBEDDING_BACKEND = os.getenv("EMBEDDING_BACKEND", "torch")
+# Each pipeline run works in its own workspace, so several can run side by side
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "2"))
+JOB_QUEUE_LIMIT = int(os.getenv("JOB_QUEUE_LIMIT", "20"))
+
+
+def sync_index_with_store(state):
+    # Every API worker holds its own index, but they all share the embedding store. Domains another worker
+    # (or its clustering runs) stored that this index doesn't have yet are inserted before answering.
+    revision = state.embeddings.revision()
+    if revision == state.index_revision:
+        return 0
+    with state.sync_lock:
+        if revision == state.index_revision:
+            return 0
+        from clustering import normalize_embeddings
+        missing = sorted(set(state.embeddings.keys()) - set(state.logo_index.domains()))
+        if missing:
+            vectors, domains = state.embeddings.get_many(missing)
+            if SIMILARITY_METRIC == "cosine":
+                vectors = normalize_embeddings(vectors)
+            state.logo_index.upsert(domains, vectors)
+        state.index_revision = revision
+        return len(missing)
+
+
+def load_models(state):
+    import torch
+    from transformers import AutoProcessor, AutoModel
+    from clustering import METRIC_SPACES, open_embedding_store
+    from embedding_backends import get_backend
+    from logo_index import LogoIndex, INDEX_PATH
+
+    device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
+    processor = AutoProcessor.from_pretrained("facebook/dinov2-base")
+    # torch, torch-int8, onnx or onnx-int8 (see embedding_backends.py)
+    model = get_backend(EMBEDDING_BACKEND, AutoModel.from_pretrained("facebook/dinov2-base").eval().to(device), device)
+
+    # Lock processor to 224x224 resolution, disable cropping
+    processor.size = {"height": 224, "width": 224}
+    processor.do_center_crop = False
+
+    # Vectors on disk, memory-mapped (and so shared) by every worker; clustering runs append to it
+    state.embeddings = open_embedding_store(processor, model, model.config.hidden_size)
+
+    # Persistent domain-addressable index, updated incrementally by each clustering run
+    state.logo_index = LogoIndex.load_or_create(INDEX_PATH, dim=model.config.hidden_size, space=METRIC_SPACES[SIMILARITY_METRIC])
+    state.index_revision = None
+    state.sync_lock = threading.Lock()
+    # Index missing, built for another metric or saved by another worker before its last run: catch up from
+    # the stored vectors instead of re-embedding
+    added = sync_index_with_store(state)
+    if added:
+        state.logo_index.save(INDEX_PATH)
+        print(f"♻️ Added {added} stored embeddings to the index")
+    state.device = device
+    state.processor = processor
+    state.model = model
+    state.ready = True
+    print("✅ Model and index loaded, API is ready")
+
+
+async def load_models_in_background(state):
+    try:
+        await asyncio.to_thread(load_models, state)
+    except Exception as e:
+        state.load_error = str(e)
+        print(f"❌ Model loading failed: {e}")
+
+
+async def start_crawler(state):
+    try:
+        # crawl4ai is slow to import, keep it off the event loop
+        scraper_crawl = await asyncio.to_thread(importlib.import_module, "scraper_crawl")
+        crawler = scraper_crawl.CrawlerService()
+        await crawler.start()
+        state.crawler = crawler
+    except Exception as e:
+        print(f"⚠️ Shared crawler unavailable, each run will start its own: {e}")
+
+
+async def start_downloader(state):
+    try:
+        # playwright is slow to import too
+        logo_download = await asyncio.to_thread(importlib.import_module, "flaresolverr_logo_download")
+        downloader = logo_download.DownloadService()
+        await downloader.start()
+        state.downloader = downloader
+    except Exception as e:
+        print(f"⚠️ Shared download pool unavailable, each run will start its own: {e}")
+
+
+@asynccontextmanager
+async def lifespan(app):
+    app.state.ready = False
+    app.state.load_error = None
+    app.state.crawler = None
+    app.state.downloader = None
+    app.state.jobs = JobManager(max_workers=JOB_WORKERS, max_queued=JOB_QUEUE_LIMIT)
+    loader = asyncio.create_task(load_models_in_background(app.state))
+    crawler_starter = asyncio.create_task(start_crawler(app.state))
+    downloader_starter = asyncio.create_task(start_downloader(app.state))
+    yield
+    for task in (loader, crawler_starter, downloader_starter):
+        if not task.done():
+            task.cancel()
+    app.state.jobs.shutdown()
+    if app.state.crawler is not None:
+        await app.state.crawler.close()
+    if app.state.downloader is not None:
+        await app.state.downloader.close()
+
+
+app = FastAPI(lifespan=lifespan)
+
+
+def require_ready():
+    if app.state.load_error:
+        raise HTTPException(status_code=503, detail=f"Model failed to load: {app.state.load_error}")
+    if not app.state.ready:
+        raise HTTPException(status_code=503, detail="Model is still loading, retry shortly")
+    return app.state
 
-app = FastAPI()
 
-device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
-processor = AutoProcessor.from_pretrained("facebook/dinov2-base")
-model = AutoModel.from_pretrained("facebook/dinov2-base").eval().to(device)
+class DomainList(BaseModel):
+    domains: List[str]
 
-# Lock processor to 224x224 resolution, disable cropping
-processor.size = {"height": 224, "width": 224}
-processor.do_center_crop = False
 
+@app.get("/health")
+def health():
+    return {"status": "ok"}
 
-class DomainList(BaseModel):
-    domains: List[str]
 
+@app.get("/ready")
+def ready():
+    if app.state.load_error:
+        return JSONResponse(status_code=503, content={"status": "failed", "error": app.state.load_error})
+    if not app.state.ready:
+        return JSONResponse(status_code=503, content={"status": "loading"})
+    return {"status": "ready"}
 
-@app.post("/extract-logos")
-def process_logos(data: DomainList):
-    domains = data.domains
-    with open("domains.txt", "w") as f:
-        for domain in domains:
-            f.write(domain + "\n")
+
+def run_pipeline(domains, progress):
+    from clustering import clustering
+    from web_scraping import get_logos
+
+    state = app.state
 
     ## Download Logos
-    get_logos(domains)
+    get_logos(domains, progress=progress, crawler=state.crawler, downloader=state.downloader)
 
     if not os.listdir("logos"):
-        return {"error": "No logos downloaded. Clustering aborted."}
+        raise RuntimeError("No logos downloaded. Clustering aborted.")
 
     ## Cluster Logos
-    clusters = clustering(device, processor, model, domains)
+    progress("cluster")
+    clusters = clustering(state.device, state.processor, state.model, domains, index=state.logo_index,
+                          metric=SIMILARITY_METRIC, dedupe=DEDUPE_LOGOS, embedding_store=state.embeddings)
+    progress("cluster", "done", clusters=len(clusters))
 
     return clusters
 
 
+@app.post("/extract-logos", status_code=202)
+def process_logos(data: DomainList):
+    require_ready()
+    try:
+        job_id = app.state.jobs.submit(run_pipeline, data.domains)
+    except QueueFullError as e:
+        raise HTTPException(status_code=429, detail=f"Too many pending jobs ({e}), retry later")
+    return {"job_id": job_id, "status_url": f"/jobs/{job_id}", "result_url": f"/jobs/{job_id}/result"}
+
+
+@app.get("/jobs/{job_id}")
+def job_status(job_id: str):
+    status = app.state.jobs.status(job_id)
+    if status is None:
+        raise HTTPException(status_code=404, detail="Unknown job")
+    return status
+
+
+@app.get("/jobs/{job_id}/result")
+def job_result(job_id: str):
+    job = app.state.jobs.result(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Unknown job")
+    if job["status"] == "failed":
+        return JSONResponse(status_code=500, content={"status": "failed", "error": job["error"]})
+    if job["status"] != "done":
+        return JSONResponse(status_code=202, content={"status": job["status"]})
+    return job["result"]
+
+
+@app.get("/similar")
+def similar_to_domain(domain: str, k: int = Query(10, ge=1, le=100)):
+    state = require_ready()
+    sync_index_with_store(state)
+    if domain not in state.logo_index:
+        raise HTTPException(status_code=404, detail=f"{domain} is not in the index")
+    # Shared memory map first; index entries written before the store existed fall back to hnswlib
+    embedding = state.embeddings.get(domain)
+    if embedding is None:
+        embedding = state.logo_index.get_embeddings([domain])[0]
+    elif SIMILARITY_METRIC == "cosine":
+        from clustering import normalize_embeddings
+        embedding = normalize_embeddings(embedding[None])[0]
+    return {"domain": domain, "results": state.logo_index.similar(embedding, k=k, exclude=domain)}
+
+
+@app.post("/similar")
+def similar_to_image(file: UploadFile = File(...), k: int = Query(10, ge=1, le=100)):
+    state = require_ready()
+    from clustering import embed_image_bytes
+
+    embedding = embed_image_bytes(file.file.read(), file.filename, state.device, state.processor, state.model, metric=SIMILARITY_METRIC)
+    if embedding is None:
+        raise HTTPException(status_code=400, detail="Could not decode the uploaded image")
+    sync_index_with_store(state)
+    return {"results": state.logo_index.similar(embedding, k=k)}
+
+
 @app.post("/run-scraper")
 def run_scraper_endpoint(data: DomainList, background_tasks: BackgroundTasks):
-    # Save domains to file
-    with open("domains.txt", "w", encoding="utf-8") as f:
-        for domain in data.domains:
-            f.write(domain + "\n")
-
-    # Trigger the scraper in background
+    # Trigger the scraper in background, on the shared crawler when it is up
     def run_scraper():
-        os.system("python scraper_crawl.py")
+        from web_scraping import run_scraper
+        run_scraper(data.domains, crawler=app.state.crawler)
 
     background_tasks.add_task(run_scraper)
 
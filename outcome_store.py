@@ -0,0 +1,134 @@
+import os
+import sys
+import time
+import sqlite3
+import threading
+
+OUTCOME_DB = os.getenv("OUTCOME_DB", "outcomes.sqlite")
+# A failed (domain, provider) is skipped for base * 2^(failures-1), capped at max
+OUTCOME_RETRY_BASE = float(os.getenv("OUTCOME_RETRY_BASE", str(24 * 3600)))
+OUTCOME_RETRY_MAX = float(os.getenv("OUTCOME_RETRY_MAX", str(30 * 24 * 3600)))
+
+# crawl: no page, extract: page without a logo, download: every way of fetching the logo failed,
+# logodev / clearbit: the API has no (usable) logo
+PROVIDERS = ["crawl", "extract", "download", "logodev", "clearbit"]
+
+
+class OutcomeStore:
+    # Definitive failures per domain and provider, so reruns skip known-dead domains until their retry window ends.
+    # Transient errors (timeouts, 5xx, 202) are not recorded; a success clears the provider's row.
+    def __init__(self, path=OUTCOME_DB, retry_base=OUTCOME_RETRY_BASE, retry_max=OUTCOME_RETRY_MAX):
+        self.path = path
+        self.retry_base = retry_base
+        self.retry_max = retry_max
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS outcomes ("
+            " domain TEXT NOT NULL, provider TEXT NOT NULL, reason TEXT, failures INTEGER NOT NULL,"
+            " first_failed_at REAL NOT NULL, last_failed_at REAL NOT NULL, retry_at REAL NOT NULL,"
+            " PRIMARY KEY (domain, provider))"
+        )
+        self.db.commit()
+
+    def retry_window(self, failures):
+        return min(self.retry_base * 2 ** (failures - 1), self.retry_max)
+
+    def record_many(self, provider, results, now=None):
+        # results: {domain: None for success, reason string for failure}, written in one transaction
+        now = now or time.time()
+        with self.lock:
+            for domain, reason in results.items():
+                domain = domain.strip().lower()
+                if reason is None:
+                    self.db.execute("DELETE FROM outcomes WHERE domain = ? AND provider = ?", (domain, provider))
+                    continue
+                row = self.db.execute(
+                    "SELECT failures, first_failed_at FROM outcomes WHERE domain = ? AND provider = ?",
+                    (domain, provider),
+                ).fetchone()
+                failures, first_failed_at = (row[0] + 1, row[1]) if row else (1, now)
+                self.db.execute(
+                    "INSERT OR REPLACE INTO outcomes (domain, provider, reason, failures, first_failed_at, last_failed_at, retry_at)"
+                    " VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    (domain, provider, reason, failures, first_failed_at, now, now + self.retry_window(failures)),
+                )
+            self.db.commit()
+
+    def record_failure(self, domain, provider, reason):
+        self.record_many(provider, {domain: reason})
+
+    def record_success(self, domain, provider):
+        self.record_many(provider, {domain: None})
+
+    def entry(self, domain, provider):
+        with self.lock:
+            row = self.db.execute(
+                "SELECT domain, provider, reason, failures, first_failed_at, last_failed_at, retry_at"
+                " FROM outcomes WHERE domain = ? AND provider = ?",
+                (domain.strip().lower(), provider),
+            ).fetchone()
+        if row is None:
+            return None
+        keys = ["domain", "provider", "reason", "failures", "first_failed_at", "last_failed_at", "retry_at"]
+        return dict(zip(keys, row))
+
+    def blocked(self, domains, providers, now=None):
+        # The given domains (as passed in) still inside a retry window for any of `providers`
+        by_key = {}
+        for domain in domains:
+            by_key.setdefault(domain.strip().lower(), []).append(domain)
+        keys = list(by_key)
+        now = now or time.time()
+        found = set()
+        with self.lock:
+            for i in range(0, len(keys), 500):
+                chunk = keys[i:i + 500]
+                rows = self.db.execute(
+                    f"SELECT DISTINCT domain FROM outcomes WHERE retry_at > ?"
+                    f" AND provider IN ({','.join('?' * len(providers))})"
+                    f" AND domain IN ({','.join('?' * len(chunk))})",
+                    [now, *providers, *chunk],
+                )
+                for row in rows:
+                    found.update(by_key[row[0]])
+        return found
+
+    def is_blocked(self, domain, provider):
+        return bool(self.blocked([domain], [provider]))
+
+    def stats(self, now=None):
+        now = now or time.time()
+        with self.lock:
+            rows = self.db.execute(
+                "SELECT provider, COUNT(*), SUM(retry_at > ?) FROM outcomes GROUP BY provider ORDER BY provider", (now,)
+            ).fetchall()
+        return {provider: {"failed": failed, "blocked": blocked} for provider, failed, blocked in rows}
+
+    def forget(self, domain, provider=None):
+        with self.lock:
+            if provider:
+                self.db.execute("DELETE FROM outcomes WHERE domain = ? AND provider = ?", (domain.strip().lower(), provider))
+            else:
+                self.db.execute("DELETE FROM outcomes WHERE domain = ?", (domain.strip().lower(),))
+            self.db.commit()
+
+    def close(self):
+        with self.lock:
+            self.db.close()
+
+
+# python outcome_store.py              -> failures per provider
+# python outcome_store.py forget <domain>...  -> retry these domains on the next run
+if __name__ == "__main__":
+    store = OutcomeStore()
+    if len(sys.argv) > 2 and sys.argv[1] == "forget":
+        for domain in sys.argv[2:]:
+            store.forget(domain)
+        print(f"🧹 Forgot {len(sys.argv) - 2} domain(s)")
+    else:
+        for provider, counts in store.stats().items():
+            print(f"📊 {provider}: {counts['failed']} failed, {counts['blocked']} waiting for retry")
+    store.close()
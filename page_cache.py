@@ -0,0 +1,157 @@
+import os
+import sys
+import time
+import hashlib
+import sqlite3
+import threading
+import cramjam
+from workspace import atomic_write_bytes
+
+PAGE_CACHE_DIR = os.getenv("PAGE_CACHE_DIR", "page_cache")
+# Pages older than this are re-validated (conditional request) or re-crawled
+PAGE_CACHE_TTL = float(os.getenv("PAGE_CACHE_TTL", str(7 * 24 * 3600)))
+ZSTD_LEVEL = 9
+LEGACY_HTML_DIR = "scraped_domains_html"
+
+
+def normalize_domain(domain):
+    domain = domain.strip().lower()
+    return domain[4:] if domain.startswith("www.") else domain
+
+
+class PageCache:
+    # zstd-compressed HTML snapshots sharded by hash, with an sqlite index of fetch time and validators
+    def __init__(self, root=PAGE_CACHE_DIR, ttl=PAGE_CACHE_TTL):
+        self.root = root
+        self.ttl = ttl
+        os.makedirs(root, exist_ok=True)
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(os.path.join(root, "index.sqlite"), check_same_thread=False)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS pages ("
+            " domain TEXT PRIMARY KEY, path TEXT NOT NULL, url TEXT, fetched_at REAL NOT NULL,"
+            " etag TEXT, last_modified TEXT, size INTEGER, raw_size INTEGER)"
+        )
+        self.db.commit()
+
+    def _blob_path(self, domain):
+        digest = hashlib.sha1(domain.encode("utf-8")).hexdigest()
+        return os.path.join(digest[:2], digest + ".html.zst")
+
+    def __len__(self):
+        with self.lock:
+            return self.db.execute("SELECT COUNT(*) FROM pages").fetchone()[0]
+
+    def domains(self):
+        with self.lock:
+            return [row[0] for row in self.db.execute("SELECT domain FROM pages ORDER BY domain")]
+
+    def entry(self, domain):
+        with self.lock:
+            row = self.db.execute(
+                "SELECT domain, path, url, fetched_at, etag, last_modified, size, raw_size FROM pages WHERE domain = ?",
+                (normalize_domain(domain),),
+            ).fetchone()
+        if row is None:
+            return None
+        keys = ["domain", "path", "url", "fetched_at", "etag", "last_modified", "size", "raw_size"]
+        return dict(zip(keys, row))
+
+    def is_fresh(self, entry, now=None):
+        return entry is not None and (now or time.time()) - entry["fetched_at"] < self.ttl
+
+    def cached_domains(self, domains, fresh_only=True):
+        # One indexed lookup per chunk instead of listing a directory
+        wanted = list({normalize_domain(d) for d in domains})
+        cutoff = time.time() - self.ttl if fresh_only else float("-inf")
+        found = set()
+        with self.lock:
+            for i in range(0, len(wanted), 500):
+                chunk = wanted[i:i + 500]
+                rows = self.db.execute(
+                    f"SELECT domain FROM pages WHERE fetched_at >= ? AND domain IN ({','.join('?' * len(chunk))})",
+                    [cutoff, *chunk],
+                )
+                found.update(row[0] for row in rows)
+        return found
+
+    def conditional_headers(self, entry):
+        headers = {}
+        if entry and entry.get("etag"):
+            headers["If-None-Match"] = entry["etag"]
+        if entry and entry.get("last_modified"):
+            headers["If-Modified-Since"] = entry["last_modified"]
+        return headers
+
+    def put(self, domain, html, url=None, etag=None, last_modified=None, fetched_at=None):
+        domain = normalize_domain(domain)
+        raw = html.encode("utf-8")
+        data = bytes(cramjam.zstd.compress(raw, level=ZSTD_LEVEL))
+        path = self._blob_path(domain)
+        atomic_write_bytes(os.path.join(self.root, path), data)
+        with self.lock:
+            self.db.execute(
+                "INSERT OR REPLACE INTO pages (domain, path, url, fetched_at, etag, last_modified, size, raw_size)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (domain, path, url, fetched_at or time.time(), etag, last_modified, len(data), len(raw)),
+            )
+            self.db.commit()
+
+    def touch(self, domain, etag=None, last_modified=None):
+        # Server answered 304: keep the snapshot, restart its TTL
+        with self.lock:
+            self.db.execute(
+                "UPDATE pages SET fetched_at = ?, etag = COALESCE(?, etag), last_modified = COALESCE(?, last_modified)"
+                " WHERE domain = ?",
+                (time.time(), etag, last_modified, normalize_domain(domain)),
+            )
+            self.db.commit()
+
+    def get_html(self, domain):
+        entry = self.entry(domain)
+        if entry is None:
+            return None
+        try:
+            with open(os.path.join(self.root, entry["path"]), "rb") as f:
+                return bytes(cramjam.zstd.decompress(f.read())).decode("utf-8")
+        except (OSError, cramjam.DecompressionError) as e:
+            print(f"⚠️ Unreadable cached page for {domain}: {e}")
+            return None
+
+    def iter_pages(self, domains):
+        # (domain, html) for every requested domain with a snapshot, fresh or not
+        for domain in sorted(self.cached_domains(domains, fresh_only=False)):
+            html = self.get_html(domain)
+            if html is not None:
+                yield domain, html
+
+    def import_directory(self, folder=LEGACY_HTML_DIR):
+        # One-off migration of the old flat scraped_domains_html/ folder; file mtime becomes the fetch time
+        imported = 0
+        for file in os.listdir(folder):
+            if not file.endswith(".html"):
+                continue
+            path = os.path.join(folder, file)
+            with open(path, "r", encoding="utf-8", errors="replace") as f:
+                html = f.read()
+            self.put(file[:-len(".html")], html, fetched_at=os.path.getmtime(path))
+            imported += 1
+        print(f"✅ Imported {imported} pages from {folder} into {self.root}")
+        return imported
+
+    def close(self):
+        with self.lock:
+            self.db.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+# python page_cache.py [legacy_html_dir]
+if __name__ == "__main__":
+    with PageCache() as cache:
+        cache.import_directory(sys.argv[1] if len(sys.argv) > 1 else LEGACY_HTML_DIR)
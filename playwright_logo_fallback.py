@@ -1,5 +1,4 @@
 import os
-import mimetypes
 import asyncio
 from pathlib import Path
 from urllib.parse import urlparse
@@ -7,11 +6,19 @@ from playwright.async_api import async_playwright
 import random
 import requests
 import json
-import time
+from contextlib import asynccontextmanager
+from functools import lru_cache
+from image_ingest import save_logo
 
-# Load proxy pool
-with open('proxies.json') as f:
-    PROXY_POOL = json.load(f)
+PLAYWRIGHT_BROWSERS = int(os.getenv("PLAYWRIGHT_BROWSERS", "1"))
+CONTEXTS_PER_BROWSER = int(os.getenv("PLAYWRIGHT_CONTEXTS_PER_BROWSER", "2"))
+FALLBACK_QUEUE_LIMIT = int(os.getenv("FALLBACK_QUEUE_LIMIT", "100"))
+
+# Load proxy pool (on first use, so importing this module doesn't need proxies.json)
+@lru_cache(maxsize=1)
+def load_proxy_pool(path="proxies.json"):
+    with open(path) as f:
+        return json.load(f)
 
 # Rotating user agents
 USER_AGENTS = [
@@ -40,10 +47,10 @@ def get_country_from_domain(domain: str) -> str:
     return parts[-1].upper() if len(parts) >= 2 else "US"
 
 def get_proxy_by_country(country_code: str):
-    return [p for p in PROXY_POOL if p["country"].upper() == country_code.upper()]
+    return [p for p in load_proxy_pool() if p["country"].upper() == country_code.upper()]
 
 def get_backup_proxies(exclude_country: str):
-    return [p for p in PROXY_POOL if p["country"].upper() != exclude_country.upper()]
+    return [p for p in load_proxy_pool() if p["country"].upper() != exclude_country.upper()]
 
 def download_direct_image(url: str, domain: str, output_dir: str) -> bool:
     try:
@@ -63,107 +70,209 @@ def download_direct_image(url: str, domain: str, output_dir: str) -> bool:
             return False
 
         if resp.status_code == 200:
-            file_path = os.path.join(output_dir, f"{domain}.png")
-            os.makedirs(output_dir, exist_ok=True)
-            with open(file_path, "wb") as f:
-                f.write(first_chunk)
-                for chunk in resp.iter_content(1024):
-                    f.write(chunk)
-            print(f"✅ Saved directly: {file_path}")
-            return True
+            file_path = save_logo(first_chunk + b"".join(resp.iter_content(1024)), domain, output_dir)
+            if file_path:
+                print(f"✅ Saved directly: {file_path}")
+                return True
     except Exception as e:
         print(f"❌ Direct download error: {e}")
     return False
 
-async def playwright_image_download(url: str, domain: str, output_dir: str, proxies: list) -> bool:
+@asynccontextmanager
+async def open_context(browser, proxy, user_agent):
+    context = await browser.new_context(
+        user_agent=user_agent,
+        proxy={
+            "server": proxy["server"],
+            "username": proxy["username"],
+            "password": proxy["password"]
+        }
+    )
+    try:
+        yield context
+    finally:
+        await context.close()
+
+class BrowserPool:
+    # Long-lived Chromium instances; each download gets its own isolated context with its own proxy.
+    # Browsers are launched on first use and relaunched if they crash.
+    def __init__(self, size=PLAYWRIGHT_BROWSERS, contexts_per_browser=CONTEXTS_PER_BROWSER):
+        self.size = size
+        self.contexts_per_browser = contexts_per_browser
+        self.playwright = None
+        self.browsers = []
+        self.slots = None
+        self.lock = asyncio.Lock()
+
+    @property
+    def capacity(self):
+        return self.size * self.contexts_per_browser
+
+    async def _launch(self):
+        # Per-context proxies need a placeholder proxy at launch on some platforms
+        return await self.playwright.chromium.launch(headless=True, proxy={"server": "http://per-context"})
+
+    async def start(self):
+        async with self.lock:
+            if self.playwright is not None:
+                return
+            self.playwright = await async_playwright().start()
+            self.browsers = [await self._launch() for _ in range(self.size)]
+            self.slots = asyncio.Queue()
+            for i in range(self.size):
+                for _ in range(self.contexts_per_browser):
+                    self.slots.put_nowait(i)
+            print(f"🚀 Browser pool started: {self.size} browser(s) x {self.contexts_per_browser} contexts")
+
+    async def _browser(self, i):
+        async with self.lock:
+            if not self.browsers[i].is_connected():
+                print("♻️ Relaunching crashed browser")
+                self.browsers[i] = await self._launch()
+            return self.browsers[i]
+
+    @asynccontextmanager
+    async def context(self, proxy, user_agent):
+        await self.start()
+        i = await self.slots.get()
+        try:
+            async with open_context(await self._browser(i), proxy, user_agent) as context:
+                yield context
+        finally:
+            self.slots.put_nowait(i)
+
+    async def close(self):
+        async with self.lock:
+            for browser in self.browsers:
+                try:
+                    await browser.close()
+                except Exception:
+                    pass
+            self.browsers = []
+            if self.playwright is not None:
+                await self.playwright.stop()
+                self.playwright = None
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.close()
+
+async def try_proxy(pool, url, domain, output_dir, proxy):
+    async with pool.context(proxy, random.choice(USER_AGENTS)) as context:
+        await context.add_init_script("Object.defineProperty(navigator, 'webdriver', {get: () => false});")
+        page = await context.new_page()
+        response = await page.goto(url, timeout=15000, wait_until="load")
+
+        if not response:
+            print("❌ No response from page.")
+            return False
+
+        final_url = page.url
+        content_type = response.headers.get("content-type", "")
+
+        print("🔍 Status:", response.status)
+        print("🔍 Content-Type:", content_type)
+
+        if final_url != url:
+            print(f"⚠️ Redirected to {final_url}, skipping.")
+            return False
+
+        body = await response.body()
+
+        if b"<html" in body.lower() or b"<!doctype" in body.lower():
+            print("⚠️ HTML content detected.")
+            return False
+
+        if response.status == 200:
+            # The bytes decide whether this is an image and what it is saved as
+            file_path = await asyncio.to_thread(save_logo, body, domain, output_dir)
+            if file_path:
+                print(f"✅ Playwright saved: {file_path}")
+                return True
+
+        print("❌ Not an image response.")
+        return False
+
+async def playwright_image_download(url: str, domain: str, output_dir: str, proxies: list, pool: BrowserPool):
+    # True if saved, False if a page answered without a usable image, None if no proxy/browser got an answer
     random.shuffle(proxies)
     max_retries = min(2, len(proxies))
     tried = 0
+    answered = False
 
-    async with async_playwright() as p:
-        browser = await p.chromium.launch(headless=True)
+    for proxy in proxies:
+        if tried >= max_retries:
+            print("🔁 Max retries reached.")
+            break
 
-        for proxy in proxies:
-            if tried >= max_retries:
-                print("🔁 Max retries reached.")
-                break
+        print(f"🌍 Trying proxy {proxy['server']} ({proxy['country']})")
+        try:
+            if await try_proxy(pool, url, domain, output_dir, proxy):
+                return True
+            answered = True
+        except Exception as e:
+            print(f"❌ Proxy failed: {e}")
 
-            print(f"🌍 Trying proxy {proxy['server']} ({proxy['country']})")
+        tried += 1
+        if tried < max_retries:
+            await asyncio.sleep(2 ** tried)  # Exponential backoff, without blocking the event loop
 
-            try:
-                context = await browser.new_context(
-                    user_agent=random.choice(USER_AGENTS),
-                    proxy={
-                        "server": proxy["server"],
-                        "username": proxy["username"],
-                        "password": proxy["password"]
-                    }
-                )
-                await context.add_init_script("Object.defineProperty(navigator, 'webdriver', {get: () => false});")
-                page = await context.new_page()
-                response = await page.goto(url, timeout=15000, wait_until="load")
-
-                if not response:
-                    print("❌ No response from page.")
-                    await context.close()
-                    tried += 1
-                    time.sleep(2 ** tried)  # Exponential backoff
-                    continue
-
-                final_url = page.url
-                content_type = response.headers.get("content-type", "")
-
-                print("🔍 Status:", response.status)
-                print("🔍 Content-Type:", content_type)
-
-                ext = os.path.splitext(urlparse(url).path)[-1].lower()
-                image_like = ext in [".png", ".jpg", ".jpeg", ".svg", ".gif", ".webp", ".bmp"]
-
-                if final_url != url:
-                    print(f"⚠️ Redirected to {final_url}, skipping.")
-                    await context.close()
-                    tried += 1
-                    time.sleep(2 ** tried)
-                    continue
-
-                body = await response.body()
-
-                if b"<html" in body.lower() or b"<!doctype" in body.lower():
-                    print("⚠️ HTML content detected.")
-                    await context.close()
-                    tried += 1
-                    time.sleep(2 ** tried)
-                    continue
-
-                if response.status == 200 and (content_type.startswith("image/") or image_like):
-                    ext = mimetypes.guess_extension(content_type.split(";")[0]) or ext or ".img"
-                    file_path = os.path.join(output_dir, f"{domain}{ext}")
-                    os.makedirs(output_dir, exist_ok=True)
-                    with open(file_path, "wb") as f:
-                        f.write(body)
-                    print(f"✅ Playwright saved: {file_path}")
-                    await context.close()
-                    await browser.close()
-                    return True
+    print("🚫 All proxies failed.")
+    return False if answered else None
 
-                print("❌ Not an image response.")
-                await context.close()
-                tried += 1
-                time.sleep(2 ** tried)
+class FallbackQueue:
+    # Bounded queue of Playwright fallback jobs served by a fixed set of workers sharing one pool;
+    # submit() waits while the queue is full so callers can't pile up unbounded work
+    def __init__(self, pool, maxsize=FALLBACK_QUEUE_LIMIT):
+        self.pool = pool
+        self.queue = asyncio.Queue(maxsize=maxsize)
+        self.workers = []
 
+    async def _worker(self):
+        while (job := await self.queue.get()) is not None:
+            (url, domain, output_dir, country), future = job
+            try:
+                proxies = get_proxy_by_country(country) + get_backup_proxies(country)
+                result = await playwright_image_download(url, domain, output_dir, proxies, self.pool)
             except Exception as e:
-                print(f"❌ Proxy failed: {e}")
-                tried += 1
-                time.sleep(2 ** tried)
+                print(f"❌ Playwright fallback failed for {url}: {e}")
+                result = None
+            if not future.cancelled():
+                future.set_result(result)
 
-        await browser.close()
+    def start(self):
+        if not self.workers:
+            # Twice the pool capacity so contexts stay busy while other jobs sit in backoff
+            self.workers = [asyncio.create_task(self._worker()) for _ in range(self.pool.capacity * 2)]
 
-    print("🚫 All proxies failed.")
-    return False
+    async def submit(self, url: str, domain: str, output_dir: str, country_code: str = "US"):
+        # Same result as playwright_image_download: True, False, or None when Playwright couldn't run
+        self.start()
+        future = asyncio.get_running_loop().create_future()
+        await self.queue.put(((url, domain, output_dir, country_code), future))
+        return await future
+
+    async def close(self):
+        for _ in self.workers:
+            await self.queue.put(None)
+        await asyncio.gather(*self.workers)
+        self.workers = []
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.close()
 
 def download_playwright_fallback(url: str, domain: str, output_dir: str, country_code: str = "US") -> bool:
-    proxies = get_proxy_by_country(country_code) + get_backup_proxies(country_code)
-    return asyncio.run(playwright_image_download(url, domain, output_dir, proxies))
+    # One-off synchronous use; long-running callers should share a BrowserPool/FallbackQueue
+    async def run():
+        async with BrowserPool(size=1, contexts_per_browser=1) as pool:
+            proxies = get_proxy_by_country(country_code) + get_backup_proxies(country_code)
+            return bool(await playwright_image_download(url, domain, output_dir, proxies, pool))
+    return asyncio.run(run())
 
 # # Example usage for testing
 # if __name__ == "__main__":
@@ -1,26 +1,32 @@
 import os
+import sys
+import socket
 import asyncio
+from contextlib import nullcontext
 from crawl4ai import AsyncWebCrawler, CrawlerRunConfig, CacheMode
-import random
+import httpx
 from urllib.parse import urlparse
+from page_cache import PageCache, normalize_domain
+from concurrency import AsyncHostScheduler
+
+# Adaptive crawl window: starts at INITIAL, grows toward MAX while pages load fast, halves on errors/timeouts
+INITIAL_CONCURRENT_CRAWLS = int(os.getenv("INITIAL_CONCURRENT_CRAWLS", "5"))
+MAX_CONCURRENT_CRAWLS = int(os.getenv("MAX_CONCURRENT_CRAWLS", "10"))
+CRAWL_TARGET_LATENCY = 10
+PAGE_TIMEOUT_MS = 15000
+PROBE_TIMEOUT = 5
+# Domains probed at once (4 variants each); the probe client gets exactly that many connections, so a probe
+# never queues for one behind a large batch and times out before it was even sent
+MAX_CONCURRENT_PROBES = int(os.getenv("MAX_CONCURRENT_PROBES", "25"))
+PROBE_POOL_TIMEOUT = 60
+PROBE_HEADERS = {
+    "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/122.0.0.0 Safari/537.36"
+}
 
 # ✅ Input URLs
-with open("domains.txt", "r", encoding="utf-8") as f:
-    urls = [line.strip() for line in f if line.strip()]
-
-# ✅ Clean filename
-def sanitize_filename(url):
-    return url.replace("https://", "").replace("http://", "").replace("/", "_")
-
-# ✅ Load already scraped domains
-def load_scraped_domains():
-    scraped = set()
-    if os.path.exists("scraped_domains_html"):
-        for file in os.listdir("scraped_domains_html"):
-            if file.endswith(".html"):
-                domain = file.replace(".html", "").replace("www.", "")
-                scraped.add(domain)
-    return scraped
+def read_domains(path="domains.txt"):
+    with open(path, "r", encoding="utf-8") as f:
+        return [line.strip() for line in f if line.strip()]
 
 # ✅ Generate variants
 def generate_url_variants(domain):
@@ -31,76 +37,185 @@ def generate_url_variants(domain):
         f"http://www.{domain}",
     ]
 
-# ✅ Crawl one domain
-async def crawl_url_variants(domain, crawler, scraped_domains, sem):
-    sanitized = sanitize_filename(domain)
-    if sanitized in scraped_domains:
-        print(f"⚡ Skipping {domain} — already scraped!")
-        return True
-
+# ✅ Lightweight pre-flight: does anything answer on this URL? (any HTTP status counts)
+async def probe_url(client, url, headers=None):
+    # The response, or the httpx error if nothing answered
+    try:
+        response = await client.head(url, headers=headers)
+        if response.status_code in (405, 501):
+            response = await client.get(url, headers=headers)
+        return response
+    except httpx.HTTPError as e:
+        return e
+
+# ✅ Probe all variants at once and return the preferred one that answered
+async def resolve_reachable_url(domain, client, headers=None):
+    # (variant, response), or (None, errors) when no variant answered
     variants = generate_url_variants(domain)
+    probes = [asyncio.create_task(probe_url(client, variant, headers)) for variant in variants]
+    try:
+        errors = []
+        for variant, probe in zip(variants, probes):
+            response = await probe
+            if isinstance(response, httpx.Response):
+                return variant, response
+            errors.append(response)
+        return None, errors
+    finally:
+        for probe in probes:
+            probe.cancel()
+
+def is_unknown_host(error):
+    # The resolver says the name doesn't exist (NXDOMAIN); a resolver timeout (EAI_AGAIN) is transient
+    while error is not None:
+        if isinstance(error, socket.gaierror):
+            return error.errno in (socket.EAI_NONAME, getattr(socket, "EAI_NODATA", socket.EAI_NONAME))
+        error = error.__cause__ or error.__context__
+    return False
 
-    async with sem:
-        for variant in variants:
-            try:
-                print(f"🌐 Crawling: {variant}")
-                result = await crawler.arun(
-                    url=variant,
-                    config=CrawlerRunConfig(
-                        cache_mode=CacheMode.BYPASS,
-                        session_id="html_batch_session",
-                        wait_until="load",
-                        page_timeout=15000
-                    )
+def definitive_http_failure(status_code):
+    # 4xx means the site answered and has nothing for us; 408/429 and 5xx are worth retrying
+    return status_code is not None and 400 <= status_code < 500 and status_code not in (408, 429)
+
+# ✅ Crawl one domain: (ok, reason), where reason is set only for definitive failures (unknown host, 4xx)
+async def crawl_url_variants(domain, crawler, cache, fresh_domains, scheduler, client, probe_gate=None):
+    if normalize_domain(domain) in fresh_domains:
+        print(f"⚡ Skipping {domain} — cached page is fresh!")
+        return True, None
+
+    # A stale snapshot with validators is re-validated by the probe itself
+    entry = cache.entry(domain)
+    async with probe_gate or nullcontext():
+        variant, response = await resolve_reachable_url(domain, client, cache.conditional_headers(entry))
+    if variant is None:
+        print(f"🔌 No reachable variant for {domain}")
+        return False, "unknown host" if all(map(is_unknown_host, response)) else None
+    if response.status_code == 304 and entry is not None:
+        cache.touch(domain)
+        print(f"♻️ Not modified: {domain}")
+        return True, None
+
+    target_url = str(response.url)
+    async with scheduler.slot(urlparse(target_url).netloc) as slot:
+        try:
+            print(f"🌐 Crawling: {target_url}")
+            result = await crawler.arun(
+                url=target_url,
+                config=CrawlerRunConfig(
+                    cache_mode=CacheMode.BYPASS,
+                    session_id="html_batch_session",
+                    wait_until="load",
+                    page_timeout=PAGE_TIMEOUT_MS
                 )
-                html = result.html
-                if not html.strip():
-                    print(f"⚠️ No HTML returned for {variant}")
-                    await asyncio.sleep(random.uniform(1, 2))
-                    continue
-
-                base_domain = urlparse(variant).netloc.replace("www.", "")
-                filename = sanitize_filename(base_domain) + ".html"
-
-                path = os.path.join("scraped_domains_html", filename)
-                os.makedirs("scraped_domains_html", exist_ok=True)
-
-                with open(path, "w", encoding="utf-8") as f:
-                    f.write(html)
-                print(f"✅ Saved: {path}")
-
-                await asyncio.sleep(random.uniform(0.5, 1.5))
-                return True
-
-            except Exception as e:
-                print(f"❌ Error scraping {variant}: {e}")
-                await asyncio.sleep(random.uniform(2, 4))
-                continue
+            )
+            html = result.html
+            if not html.strip():
+                print(f"⚠️ No HTML returned for {target_url}")
+                slot.failed()
+                status_code = getattr(result, "status_code", None) or response.status_code
+                return False, f"HTTP {status_code}" if definitive_http_failure(status_code) else None
+
+            # Keyed by the requested domain, not wherever it redirected to
+            headers = {k.lower(): v for k, v in (getattr(result, "response_headers", None) or response.headers).items()}
+            cache.put(domain, html, url=target_url, etag=headers.get("etag"), last_modified=headers.get("last-modified"))
+            print(f"✅ Cached: {domain}")
+            return True, None
+
+        except Exception as e:
+            print(f"❌ Error scraping {target_url}: {e}")
+            slot.failed()
 
     print(f"🔍 No valid result for {domain}")
-    return False
+    return False, None
 
 # ✅ Run all crawls in parallel
-async def run_all():
-    scraped = load_scraped_domains()
-    sem = asyncio.Semaphore(5)  # Max 10 concurrent crawls
-
-    failed_domains = []
-
-    async with AsyncWebCrawler() as crawler:
+async def run_all(urls, crawler, scheduler, cache, outcomes=None):
+    fresh = cache.cached_domains(urls)
+
+    probe_gate = asyncio.Semaphore(MAX_CONCURRENT_PROBES)
+    connections = MAX_CONCURRENT_PROBES * len(generate_url_variants(""))
+    async with httpx.AsyncClient(timeout=httpx.Timeout(PROBE_TIMEOUT, pool=PROBE_POOL_TIMEOUT), headers=PROBE_HEADERS,
+                                 limits=httpx.Limits(max_connections=connections, max_keepalive_connections=connections),
+                                 follow_redirects=True, verify=False) as client:
         print("🚀 Running initial crawl...")
-        tasks = [crawl_url_variants(url, crawler, scraped, sem) for url in urls]
-        results = await asyncio.gather(*tasks)
-
-        for url, success in zip(urls, results):
-            if not success:
-                failed_domains.append(url)
+        tasks = [crawl_url_variants(url, crawler, cache, fresh, scheduler, client, probe_gate) for url in urls]
+        attempts = dict(zip(urls, await asyncio.gather(*tasks)))
+        failed_domains = [url for url, (success, _) in attempts.items() if not success]
 
         # Retry pass
         if failed_domains:
             print(f"\n🔁 Retrying {len(failed_domains)} failed domains...\n")
-            retry_tasks = [crawl_url_variants(domain, crawler, scraped, sem) for domain in failed_domains]
-            await asyncio.gather(*retry_tasks)
-
-# ✅ Go!
-asyncio.run(run_all())
+            retry_tasks = [crawl_url_variants(domain, crawler, cache, fresh, scheduler, client, probe_gate) for domain in failed_domains]
+            attempts.update(zip(failed_domains, await asyncio.gather(*retry_tasks)))
+
+    # Successes and definitive failures only, once per run; timeouts and 5xx are simply tried again next run
+    if outcomes is not None:
+        outcomes.record_many("crawl", {url: reason for url, (success, reason) in attempts.items() if success or reason})
+    print(f"📊 Crawl scheduler: {scheduler.stats()}")
+    return {url: success for url, (success, _) in attempts.items()}
+
+def make_crawl_scheduler():
+    return AsyncHostScheduler(
+        initial_window=min(INITIAL_CONCURRENT_CRAWLS, MAX_CONCURRENT_CRAWLS),
+        max_window=MAX_CONCURRENT_CRAWLS,
+        target_latency=CRAWL_TARGET_LATENCY,
+        per_host_limit=1,
+    )
+
+# ✅ Crawl a domain list with a fresh crawler, or with a caller-owned one
+async def crawl_domains(domains, crawler=None, scheduler=None, cache=None, outcomes=None):
+    scheduler = scheduler or make_crawl_scheduler()
+    own_cache = cache is None
+    cache = PageCache() if own_cache else cache
+    try:
+        if crawler is not None:
+            return await run_all(domains, crawler, scheduler, cache, outcomes)
+        async with AsyncWebCrawler() as crawler:
+            return await run_all(domains, crawler, scheduler, cache, outcomes)
+    finally:
+        if own_cache:
+            cache.close()
+
+# ✅ One warm crawler/browser shared by every request of a long-running process
+class CrawlerService:
+    def __init__(self):
+        self.crawler = None
+        self.loop = None
+        self.scheduler = None
+        self.cache = None
+
+    @property
+    def running(self):
+        return self.crawler is not None
+
+    async def start(self):
+        crawler = AsyncWebCrawler()
+        await crawler.start()
+        self.loop = asyncio.get_running_loop()
+        self.scheduler = make_crawl_scheduler()
+        self.cache = PageCache()
+        self.crawler = crawler
+        print("🚀 Shared crawler started")
+
+    async def close(self):
+        if self.crawler is not None:
+            crawler, self.crawler = self.crawler, None
+            await crawler.close()
+        if self.cache is not None:
+            self.cache.close()
+
+    async def crawl(self, domains, outcomes=None):
+        return await crawl_domains(domains, crawler=self.crawler, scheduler=self.scheduler, cache=self.cache, outcomes=outcomes)
+
+    def crawl_from_thread(self, domains, outcomes=None):
+        # For synchronous callers running outside the service's event loop
+        return asyncio.run_coroutine_threadsafe(self.crawl(domains, outcomes), self.loop).result()
+
+def crawl_domains_sync(domains, service=None, outcomes=None):
+    if service is not None and service.running:
+        return service.crawl_from_thread(domains, outcomes)
+    return asyncio.run(crawl_domains(domains, outcomes=outcomes))
+
+# ✅ Go! (python scraper_crawl.py [domains_file])
+if __name__ == "__main__":
+    asyncio.run(crawl_domains(read_domains(sys.argv[1] if len(sys.argv) > 1 else "domains.txt")))
@@ -0,0 +1,55 @@
+import os
+import sys
+import json
+import time
+import statistics
+import subprocess
+
+# Wall-clock budget (seconds) for a fresh interpreter to import the API module
+IMPORT_TIME_BUDGET = float(os.getenv("IMPORT_TIME_BUDGET", "1.5"))
+API_MODULE = "logo_similarity_api"
+
+# Nothing on this list may be imported before the lifespan hook runs
+HEAVY_MODULES = [
+    "torch", "transformers", "networkx", "community", "leidenalg", "igraph",
+    "cairosvg", "pillow_avif", "crawl4ai", "playwright", "bs4", "onnxruntime",
+]
+
+
+def measure_import_time(module=API_MODULE, runs=5):
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, "-c", f"import {module}"], check=True)
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings)
+
+
+def eagerly_imported(module=API_MODULE, heavy_modules=HEAVY_MODULES):
+    code = (
+        "import sys, json\n"
+        f"import {module}\n"
+        f"print(json.dumps([m for m in {heavy_modules!r} if m in sys.modules]))\n"
+    )
+    out = subprocess.run([sys.executable, "-c", code], check=True, capture_output=True, text=True).stdout
+    return json.loads(out.strip().splitlines()[-1])
+
+
+def main():
+    elapsed = measure_import_time()
+    leaked = eagerly_imported()
+    print(f"⏱️ import {API_MODULE}: {elapsed:.3f}s (budget {IMPORT_TIME_BUDGET:.3f}s)")
+    ok = True
+    if elapsed > IMPORT_TIME_BUDGET:
+        print("❌ Import time is over budget")
+        ok = False
+    if leaked:
+        print(f"❌ Heavy modules imported at startup: {', '.join(leaked)}")
+        ok = False
+    if ok:
+        print("✅ Startup is within budget")
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,134 @@
+import multiprocessing
+import numpy as np
+import pytest
+from array_store import ArrayStore
+
+SHAPE = (3,)
+WRITERS = 3
+KEYS_PER_WRITER = 40
+ROUNDS = 15
+
+
+def open_store(path):
+    return ArrayStore(path, SHAPE, np.int64)
+
+
+def row(writer, key, version):
+    return [writer, key, version]
+
+
+def test_put_get_overwrite_delete_compact(tmp_path):
+    store = open_store(str(tmp_path / "rows"))
+    store.put_many(["a", "b", "a"], [row(0, 0, 1), row(0, 1, 1), row(0, 0, 2)])
+    store.put("b", row(0, 1, 3))
+    assert store.get("a").tolist() == row(0, 0, 2) and store.get("b").tolist() == row(0, 1, 3)
+    assert store.garbage() == 1
+    store.delete(["a"])
+    assert store.get("a") is None and store.compact() == 2 and store.garbage() == 0
+    keys, rows = store.snapshot()
+    assert keys == ["b"] and rows.tolist() == [row(0, 1, 3)]
+    store.close()
+    readonly = ArrayStore.open(str(tmp_path / "rows"))
+    assert readonly.get("b").tolist() == row(0, 1, 3)
+    with pytest.raises(PermissionError):
+        readonly.put("c", row(0, 2, 1))
+    readonly.close()
+
+
+def test_snapshot_is_a_shared_memory_map(tmp_path):
+    # Without garbage every handle maps the same file instead of holding its own copy
+    path = str(tmp_path / "rows")
+    writer, reader = open_store(path), open_store(path)
+    writer.put_many(["a", "b"], [row(0, 0, 1), row(0, 1, 1)])
+    _, rows = reader.snapshot()
+    assert isinstance(rows, np.memmap) and rows.filename == f"{path}.0.bin"
+    writer.close()
+    reader.close()
+
+
+def test_read_retries_when_two_compactions_delete_its_generation(tmp_path, monkeypatch):
+    path = str(tmp_path / "rows")
+    writer, reader = open_store(path), open_store(path)
+    writer.put_many(["a", "b"], [row(0, 0, 1), row(0, 1, 1)])
+    state = reader._state
+    compacted = []
+
+    def state_then_compact_twice():
+        # Another process compacts twice between the reader's transaction and its memory map
+        result = state()
+        if not compacted:
+            for version in (2, 3):
+                writer.put("a", row(0, 0, version))
+                writer.compact()
+            compacted.append(True)
+        return result
+
+    monkeypatch.setattr(reader, "_state", state_then_compact_twice)
+    rows, found = reader.get_many(["a", "b"])
+    assert found == ["a", "b"] and rows.tolist() == [row(0, 0, 3), row(0, 1, 1)]
+    writer.close()
+    reader.close()
+
+
+def write(path, writer_id):
+    store = open_store(path)
+    for version in range(ROUNDS):
+        keys = [f"w{writer_id}-{i}" for i in range(KEYS_PER_WRITER)]
+        store.put_many(keys, [row(writer_id, i, version) for i in range(KEYS_PER_WRITER)])
+    store.close()
+
+
+def compact(path, stop):
+    store = open_store(path)
+    while not stop.is_set():
+        store.compact()
+    store.close()
+
+
+def read(path, stop, errors):
+    store = open_store(path)
+    keys = [f"w{w}-{i}" for w in range(WRITERS) for i in range(KEYS_PER_WRITER)]
+    try:
+        while not stop.is_set():
+            rows, found = store.get_many(keys)
+            for key, (writer_id, i, _) in zip(found, rows.tolist()):
+                if key != f"w{writer_id}-{i}":
+                    errors.put(f"{key} holds the row of w{writer_id}-{i}")
+            snapshot_keys, snapshot_rows = store.snapshot()
+            for key, (writer_id, i, _) in zip(snapshot_keys, np.asarray(snapshot_rows).tolist()):
+                if key != f"w{writer_id}-{i}":
+                    errors.put(f"snapshot: {key} holds the row of w{writer_id}-{i}")
+    except Exception as e:
+        errors.put(repr(e))
+    finally:
+        store.close()
+
+
+def test_concurrent_put_compact_get_many_across_processes(tmp_path):
+    path = str(tmp_path / "rows")
+    open_store(path).close()
+    context = multiprocessing.get_context("spawn")
+    stop, errors = context.Event(), context.Queue()
+    writers = [context.Process(target=write, args=(path, w)) for w in range(WRITERS)]
+    others = [context.Process(target=compact, args=(path, stop))] + \
+             [context.Process(target=read, args=(path, stop, errors)) for _ in range(2)]
+    for process in others + writers:
+        process.start()
+    for process in writers:
+        process.join(120)
+    stop.set()
+    for process in others:
+        process.join(120)
+    assert all(process.exitcode == 0 for process in writers + others)
+    problems = []
+    while not errors.empty():
+        problems.append(errors.get())
+    assert problems == []
+
+    store = open_store(path)
+    rows, found = store.get_many([f"w{w}-{i}" for w in range(WRITERS) for i in range(KEYS_PER_WRITER)])
+    assert len(found) == WRITERS * KEYS_PER_WRITER
+    assert all(version == ROUNDS - 1 for _, _, version in rows.tolist())
+    store.compact()
+    assert store.garbage() == 0 and len(store) == WRITERS * KEYS_PER_WRITER
+    store.close()
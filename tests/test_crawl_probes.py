@@ -0,0 +1,68 @@
+import socket
+import asyncio
+import pytest
+from test_outcomes import FakeCrawler
+
+scraper_crawl = pytest.importorskip("scraper_crawl")
+
+DOMAINS = 300
+RESPONSE_DELAY = 0.3
+
+
+class MemoryCache:
+    def __init__(self):
+        self.pages = {}
+
+    def cached_domains(self, domains):
+        return set()
+
+    def entry(self, domain):
+        return None
+
+    def conditional_headers(self, entry):
+        return {}
+
+    def put(self, domain, html, **kwargs):
+        self.pages[domain] = html
+
+
+async def slow_http_server():
+    # Plain HTTP after a short delay; TLS handshakes (the https:// variants) are dropped at once
+    async def handle(reader, writer):
+        try:
+            if not (await reader.readexactly(1)).isalpha():
+                return
+            while await reader.readline() not in (b"\r\n", b""):
+                pass
+            await asyncio.sleep(RESPONSE_DELAY)
+            writer.write(b"HTTP/1.1 200 OK\r\nContent-Length: 0\r\nConnection: close\r\n\r\n")
+            await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+    return await asyncio.start_server(handle, "127.0.0.1", 0, backlog=4096)
+
+
+def test_a_batch_larger_than_the_connection_pool_is_fully_probed(monkeypatch):
+    # Every *.test host resolves to the local server, so the real httpx pool is exercised
+    getaddrinfo = socket.getaddrinfo
+
+    def resolve(host, *args, **kwargs):
+        name = host.decode() if isinstance(host, bytes) else host
+        return getaddrinfo("127.0.0.1" if name and name.endswith(".test") else host, *args, **kwargs)
+
+    monkeypatch.setattr(socket, "getaddrinfo", resolve)
+    monkeypatch.setattr(scraper_crawl, "PROBE_TIMEOUT", 1)
+    monkeypatch.setattr(scraper_crawl, "MAX_CONCURRENT_PROBES", 25)
+    cache = MemoryCache()
+
+    async def run():
+        server = await slow_http_server()
+        port = server.sockets[0].getsockname()[1]
+        domains = [f"site{i}.test:{port}" for i in range(DOMAINS)]
+        async with server:
+            return await scraper_crawl.run_all(domains, FakeCrawler("<html></html>"), scraper_crawl.make_crawl_scheduler(), cache)
+
+    results = asyncio.run(run())
+    assert sum(results.values()) == DOMAINS and len(cache.pages) == DOMAINS
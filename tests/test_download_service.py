@@ -0,0 +1,88 @@
+import asyncio
+import threading
+import pytest
+
+downloader = pytest.importorskip("flaresolverr_logo_download")
+import playwright_logo_fallback
+
+
+@pytest.fixture
+def playwright_runs(tmp_path, monkeypatch):
+    # Every entry goes straight to the Playwright fallback, which records the pool it was served from
+    monkeypatch.setattr(downloader, "output_dir", str(tmp_path))
+    pools, closed = [], []
+
+    async def process_entry(client, entry, already_downloaded, gates, outcomes):
+        return await gates["playwright"].submit(entry["logo_url"], entry["domain"], str(tmp_path))
+
+    async def playwright_image_download(url, domain, output_dir, proxies, pool):
+        pools.append(pool)
+        return True
+
+    async def close(pool):
+        closed.append(pool)
+
+    monkeypatch.setattr(downloader, "process_entry", process_entry)
+    monkeypatch.setattr(playwright_logo_fallback, "playwright_image_download", playwright_image_download)
+    monkeypatch.setattr(playwright_logo_fallback, "get_proxy_by_country", lambda country: [])
+    monkeypatch.setattr(playwright_logo_fallback, "get_backup_proxies", lambda country: [])
+    monkeypatch.setattr(playwright_logo_fallback.BrowserPool, "close", close)
+    return pools, closed
+
+
+def entries(n):
+    return [{"domain": f"site{i}.com", "logo_url": f"site{i}.com/logo.png"} for i in range(n)]
+
+
+def test_runs_without_a_service_get_their_own_pool(playwright_runs):
+    pools, closed = playwright_runs
+    assert downloader.download_entries(entries(2)) == 2
+    assert downloader.download_entries(entries(2)) == 2
+    assert len(set(map(id, pools))) == 2 and closed == list({id(p): p for p in pools}.values())
+
+
+def test_service_pool_outlives_runs_until_close(playwright_runs):
+    pools, closed = playwright_runs
+    loop = asyncio.new_event_loop()
+    thread = threading.Thread(target=loop.run_forever, daemon=True)
+    thread.start()
+    service = downloader.DownloadService()
+    asyncio.run_coroutine_threadsafe(service.start(), loop).result()
+    try:
+        # Job threads call in while the API loop owns the pool
+        assert downloader.download_entries(entries(3), service=service) == 3
+        assert downloader.download_entries(entries(3), service=service) == 3
+        assert set(map(id, pools)) == {id(service.pool)} and closed == []
+    finally:
+        asyncio.run_coroutine_threadsafe(service.close(), loop).result()
+        loop.call_soon_threadsafe(loop.stop)
+        thread.join()
+        loop.close()
+    assert closed == [service.pool] and not service.running
+
+
+def test_runs_in_separate_threads_each_get_their_own_scheduler(tmp_path, monkeypatch):
+    # Two jobs without a DownloadService, each on its own asyncio.run() loop
+    import io
+    import httpx
+    from PIL import Image
+
+    buffer = io.BytesIO()
+    Image.new("RGB", (8, 8), "red").save(buffer, "PNG")
+    png = buffer.getvalue()
+    monkeypatch.setattr(downloader, "output_dir", str(tmp_path))
+    monkeypatch.setattr(downloader, "make_client", lambda: httpx.AsyncClient(
+        transport=httpx.MockTransport(lambda request: httpx.Response(200, content=png))))
+    schedulers = []
+    make_scheduler = downloader.make_download_scheduler
+    monkeypatch.setattr(downloader, "make_download_scheduler", lambda: schedulers.append(make_scheduler()) or schedulers[-1])
+
+    counts = []
+    jobs = [threading.Thread(target=lambda job=job: counts.append(downloader.download_entries(
+        [{"domain": f"job{job}-{i}.com", "logo_url": f"job{job}-{i}.com/logo.png"} for i in range(20)])))
+        for job in range(2)]
+    for job in jobs:
+        job.start()
+    for job in jobs:
+        job.join(60)
+    assert counts == [20, 20] and len({id(s) for s in schedulers}) == 2
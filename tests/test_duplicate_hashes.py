@@ -0,0 +1,50 @@
+import numpy as np
+import pytest
+from PIL import Image
+import clustering
+from array_store import ArrayStore
+
+
+def save(path, color, size=64):
+    img = Image.new("RGB", (size, size), "white")
+    img.paste(Image.new("RGB", (size // 2, size // 2), color), (size // 4, size // 4))
+    img.save(path)
+    return str(path)
+
+
+@pytest.fixture
+def logos(tmp_path):
+    paths = [
+        save(tmp_path / "a.png", "red"),
+        save(tmp_path / "a-copy.png", "red"),
+        save(tmp_path / "a.bmp", "red"),
+        save(tmp_path / "b.png", (0, 0, 255)),
+    ]
+    (tmp_path / "broken.png").write_bytes(b"not an image")
+    return paths + [str(tmp_path / "broken.png")], ["a.com", "a-copy.com", "a-bmp.com", "b.com", "broken.com"]
+
+
+def test_hashes_are_cached_by_content(tmp_path, logos, monkeypatch):
+    paths, domains = logos
+    store = ArrayStore(str(tmp_path / "hashes"), (2,), np.uint64)
+    first = clustering.group_duplicate_logos(paths, domains, num_workers=2, store=store)
+    assert first[2]["a.com"] == ["a.com", "a-copy.com", "a-bmp.com"]
+    # The identical copy is hashed once, the broken file isn't stored
+    assert len(store) == 3
+
+    decoded = []
+    load_image = clustering.load_image
+    monkeypatch.setattr(clustering, "load_image", lambda path: decoded.append(path) or load_image(path))
+    store.close()
+    store = ArrayStore(str(tmp_path / "hashes"), (2,), np.uint64)
+    assert clustering.group_duplicate_logos(paths, domains, num_workers=2, store=store) == first
+    assert decoded == [paths[-1]]
+    store.close()
+
+
+def test_cached_hashes_match_fresh_ones(tmp_path, logos):
+    paths, _ = logos
+    store = ArrayStore(str(tmp_path / "hashes"), (2,), np.uint64)
+    clustering.load_hashes(paths, store=store)
+    assert clustering.load_hashes(paths, store=store) == [clustering.hash_logo(p) for p in paths]
+    store.close()
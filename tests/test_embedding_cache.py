@@ -0,0 +1,36 @@
+import multiprocessing
+import numpy as np
+from clustering import load_embedding_cache, save_embedding_cache
+
+PROCESSES = 4
+SAVES = 10
+
+
+def test_stale_save_keeps_entries_written_since_load(tmp_path):
+    path = str(tmp_path / "embedding_cache.npz")
+    first, second = load_embedding_cache(path), load_embedding_cache(path)
+    first["a"] = np.ones(4, dtype=np.float32)
+    save_embedding_cache(first, path)
+    second["b"] = np.zeros(4, dtype=np.float32)
+    save_embedding_cache(second, path)
+    cache = load_embedding_cache(path)
+    assert sorted(cache) == ["a", "b"] and cache["a"].tolist() == [1.0] * 4
+
+
+def add_entries(path, worker):
+    for i in range(SAVES):
+        cache = load_embedding_cache(path)
+        cache[f"{worker}-{i}"] = np.full(4, worker, dtype=np.float32)
+        save_embedding_cache(cache, path)
+
+
+def test_concurrent_jobs_lose_no_entries(tmp_path):
+    path = str(tmp_path / "embedding_cache.npz")
+    context = multiprocessing.get_context("spawn")
+    processes = [context.Process(target=add_entries, args=(path, w)) for w in range(PROCESSES)]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join(120)
+    assert all(process.exitcode == 0 for process in processes)
+    assert sorted(load_embedding_cache(path)) == sorted(f"{w}-{i}" for w in range(PROCESSES) for i in range(SAVES))
@@ -0,0 +1,60 @@
+import numpy as np
+import pytest
+from embedding_compaction import CompactIndex, evaluate, exact_knn
+
+pytest.importorskip("leidenalg")
+
+
+def clustered_vectors(n=800, dim=96, centers=40, seed=0):
+    rng = np.random.default_rng(seed)
+    means = rng.standard_normal((centers, dim)).astype(np.float32)
+    return (means[rng.integers(0, centers, n)] + 0.3 * rng.standard_normal((n, dim))).astype(np.float32)
+
+
+@pytest.fixture(scope="module")
+def data():
+    vectors = clustered_vectors()
+    return vectors, [f"d{i}.com" for i in range(len(vectors))]
+
+
+def test_identity_projection_costs_nothing(data):
+    vectors, domains = data
+    index = CompactIndex.build(vectors, domains, method="none", dtype="int8")
+    assert index.projection.components is None
+    # One byte per dimension, plus the quantizer's per-dimension scale and offset
+    assert index.memory_bytes() == len(vectors) * vectors.shape[1] + 2 * 4 * vectors.shape[1]
+
+
+@pytest.mark.parametrize("metric", ["l2", "cosine"])
+def test_rerank_never_hurts_and_uncompressed_is_exact(data, metric):
+    vectors, domains = data
+    report = {row["config"]: row for row in evaluate(
+        vectors, domains, ["none-float32", "none-int8", "pca32-int8", "random32-float16", "pca32-hnsw8"],
+        metric=metric, k=10, queries=200)}
+    assert report["none-float32"]["recall"] == report["none-float32"]["recall_rerank"] == 1.0
+    assert report["none-float32"]["cluster_agreement"]["f1"] == 1.0
+    for row in report.values():
+        assert row["recall_rerank"] >= row["recall"], row
+    assert report["pca32-int8"]["bytes_per_logo"] < report["none-int8"]["bytes_per_logo"] < report["none-float32"]["bytes_per_logo"]
+
+
+def test_similar_matches_exact_search(data):
+    vectors, domains = data
+    index = CompactIndex.build(vectors, domains, dim=32, dtype="int8")
+    labels, _ = exact_knn(vectors[:1], vectors, 6)
+    expected = [domains[i] for i in labels[0] if domains[i] != "d0.com"][:5]
+    assert [r["domain"] for r in index.similar(vectors[0], k=5, exclude="d0.com")] == expected
+
+
+def test_cosine_rerank_reads_the_full_vectors_in_place(data, tmp_path):
+    # Only candidate rows are normalized at re-rank time; the store's memory map is never copied
+    vectors, domains = data
+    stored = np.memmap(tmp_path / "vectors.bin", dtype=np.float32, mode="w+", shape=vectors.shape)
+    stored[:] = vectors
+    index = CompactIndex.build(stored, domains, metric="cosine", method="pca", dim=32, dtype="int8")
+    assert index.full is stored
+    assert index.memory_bytes() == index.codes.nbytes + index.projection.nbytes + index.quantizer.nbytes
+    unit = vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+    labels, _ = index.knn(vectors[:20], k=5)
+    exact, _ = exact_knn(unit[:20], unit, 5, "cosine")
+    assert np.mean([len(set(a) & set(b)) / 5 for a, b in zip(labels, exact)]) >= 0.9
@@ -0,0 +1,57 @@
+import io
+import sys
+import numpy as np
+import pytest
+from PIL import Image
+from array_store import ArrayStore
+from image_ingest import MissingDecoder, PIXEL_SIZE, decode_image, save_logo, sniff_format
+
+
+def png_bytes(size=(40, 20), color=(200, 30, 30)):
+    out = io.BytesIO()
+    Image.new("RGB", size, color).save(out, "PNG")
+    return out.getvalue()
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = ArrayStore(str(tmp_path / "pixels"), (PIXEL_SIZE, PIXEL_SIZE, 3), np.uint8)
+    yield store
+    store.close()
+
+
+def test_sniff_format_ignores_extension_and_headers():
+    assert sniff_format(png_bytes()) == "png"
+    assert sniff_format(b"\xff\xd8\xff\xe0rest") == "jpeg"
+    assert sniff_format(b'<?xml version="1.0"?><svg xmlns="http://www.w3.org/2000/svg"></svg>') == "svg"
+    assert sniff_format(b"<!DOCTYPE html><html><body>blocked</body></html>") is None
+
+
+def test_save_logo_fixes_extension_and_stores_pixels(tmp_path, store):
+    (tmp_path / "acme.com.jpg").write_bytes(b"stale")
+    path = save_logo(png_bytes(), "acme.com", str(tmp_path), store)
+    assert path == str(tmp_path / "acme.com.png")
+    assert not (tmp_path / "acme.com.jpg").exists()
+    assert len(store) == 1
+
+
+def test_save_logo_rejects_corrupt_images(tmp_path, store):
+    assert save_logo(png_bytes()[:40], "acme.com", str(tmp_path), store) is None
+    assert save_logo(b"<html>captcha</html>", "acme.com", str(tmp_path), store) is None
+    assert list(tmp_path.glob("acme.com.*")) == [] and len(store) == 0
+
+
+def test_avif_without_a_decoder_is_a_missing_decoder(tmp_path, store, monkeypatch):
+    # Neither pillow-avif-plugin nor a Pillow built with AVIF support
+    monkeypatch.setitem(sys.modules, "pillow_avif", None)
+    monkeypatch.delitem(Image.OPEN, "AVIF", raising=False)
+    monkeypatch.setattr(Image, "init", lambda: None)
+    avif = b"\x00\x00\x00\x1cftypavif\x00\x00\x00\x00avifmif1miaf" + b"\x00" * 64
+    with pytest.raises(MissingDecoder):
+        decode_image(avif)
+    # Clustering skips the file instead of failing the whole run
+    from clustering import decode_logo
+    assert decode_logo(avif, "acme.com.avif") is None
+    # Kept (it may be a fine logo), just without pixels
+    assert save_logo(avif, "acme.com", str(tmp_path), store) == str(tmp_path / "acme.com.avif")
+    assert len(store) == 0
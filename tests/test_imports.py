@@ -0,0 +1,45 @@
+import os
+import importlib
+import pytest
+from conftest import REPO_ROOT
+
+MODULES = sorted(f[:-3] for f in os.listdir(REPO_ROOT) if f.endswith(".py"))
+
+
+@pytest.mark.parametrize("module", MODULES)
+def test_module_imports(module):
+    # A missing optional third-party package skips; a name missing from one of our own modules fails
+    try:
+        importlib.import_module(module)
+    except ModuleNotFoundError as e:
+        if e.name.split(".")[0] in MODULES:
+            raise
+        pytest.skip(f"{module} needs {e.name}")
+
+
+def test_web_scraping_extractor_api():
+    import logo_extractor
+    for name in ("is_valid_logo", "extract_logo_entry", "extract_logo_urls_from_pages",
+                 "iter_cached_logo_urls", "iter_html_folder", "extract_logo_url_from_html"):
+        assert callable(getattr(logo_extractor, name))
+    entry = logo_extractor.extract_logo_entry(
+        "acme.com", '<html><header><img src="/img/acme-logo.png"></header></html>')
+    assert entry == {"domain": "acme.com", "logo_url": "https://acme.com/img/acme-logo.png"}
+
+
+@pytest.mark.parametrize("workers", [1, 2])
+def test_iter_cached_logo_urls(tmp_path, workers):
+    from logo_extractor import iter_cached_logo_urls
+    from page_cache import PageCache
+    cache = PageCache(str(tmp_path / "pages"))
+    try:
+        cache.put("acme.com", '<header><img src="/acme-logo.svg"></header>')
+        cache.put("blank.com", "<p>nothing here</p>")
+        entries = sorted(iter_cached_logo_urls(cache, ["acme.com", "blank.com", "missing.com"], workers=workers),
+                         key=lambda e: e["domain"])
+    finally:
+        cache.close()
+    assert entries == [
+        {"domain": "acme.com", "logo_url": "https://acme.com/acme-logo.svg"},
+        {"domain": "blank.com", "logo_url": "NO_LOGO_FOUND"},
+    ]
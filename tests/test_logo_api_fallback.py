@@ -0,0 +1,42 @@
+import json
+import multiprocessing
+from logo_api_fallback import DailyQuota
+
+PROCESSES = 4
+ATTEMPTS = 15
+LIMIT = 40
+
+
+def test_jobs_with_their_own_quota_share_one_budget(tmp_path):
+    path = str(tmp_path / "quota.json")
+    first, second = DailyQuota(path, limit=5), DailyQuota(path, limit=5)
+    granted = [quota.acquire() for _ in range(4) for quota in (first, second)]
+    assert granted.count(True) == 5 and first.remaining() == second.remaining() == 0
+
+
+def test_exhaust_is_seen_by_every_instance(tmp_path):
+    path = str(tmp_path / "quota.json")
+    first, second = DailyQuota(path, limit=5), DailyQuota(path, limit=5)
+    assert second.acquire()
+    first.exhaust()
+    assert not second.acquire()
+
+
+def spend(path, results):
+    quota = DailyQuota(path, limit=LIMIT)
+    results.put(sum(quota.acquire() for _ in range(ATTEMPTS)))
+
+
+def test_api_workers_never_overspend(tmp_path):
+    path = str(tmp_path / "quota.json")
+    context = multiprocessing.get_context("spawn")
+    results = context.Queue()
+    processes = [context.Process(target=spend, args=(path, results)) for _ in range(PROCESSES)]
+    for process in processes:
+        process.start()
+    granted = sum(results.get(timeout=120) for _ in processes)
+    for process in processes:
+        process.join(120)
+    assert granted == LIMIT
+    with open(path, "r", encoding="utf-8") as f:
+        assert json.load(f)["used"] == LIMIT
@@ -0,0 +1,76 @@
+import random
+import pytest
+from extractor_benchmark import parity_check, top_choice_agreement
+import logo_extractor
+from logo_extractor import find_logos_in_html, extract_logo_entry, iter_cached_logo_urls
+from page_cache import PageCache
+
+pytest.importorskip("bs4")
+
+FRAGMENTS = [
+    "<svg>", "</svg>", "<title>", "</title>", "<script>", "</script>", "<style>", "</style>",
+    "<template>", "</template>", "<rt>", "</rt>", "<rp>", "</rp>", "<textarea>", "</textarea>",
+    "<b>", "</b>", "<p>", "</p>", "<br>", "<header>", "</header>", "<nav>", "</nav>",
+    '<div class="site-logo">', '<div id="brand">', "<div>", "</div>", "<head>", "</head>", "<body>",
+    "acme", "x", "<!--acme-->", "<![CDATA[acme]]>", '<svg class="logo">',
+    '<img src="/acme-logo.png">', '<img src="/img/banner.jpg" alt="acme">', '<img data-src="logo.svg">',
+    '<source srcset="/logo@2x.webp 2x">', '<link rel="icon" href="/favicon.ico">',
+    '<link rel="apple-touch-icon" href="/touch.png">', '<meta property="og:image" content="/og-logo.png">',
+    '<div style="background-image: url(/bg-logo.png)">',
+]
+INLINE_SVG_TITLES = [
+    "<svg><title>a<script>acme</script>b</title></svg>",
+    "<svg><title>a<style>acme</style>b</title></svg>",
+    "<svg><title>a<template><b>acme</b></template>b</title></svg>",
+    "<svg><title>a<rt>acme</rt>b</title></svg>",
+    "<svg><title><![CDATA[acme]]></title></svg>",
+    "<svg><title><!--acme--></title></svg>",
+    "<template><svg><title>acme</title></svg></template>",
+    "<svg><title>Acme Inc</title></svg>",
+    # Two nested titles that look alike: closing the inner one must not detach the outer one
+    "<svg><title><svg><title></svg> text ",
+]
+
+
+def fuzz_pages(count, seed=0):
+    rng = random.Random(seed)
+    return [("https://acme.com", "".join(rng.choice(FRAGMENTS) for _ in range(rng.randint(3, 16)))
+             + '<img src="/img/acme-logo.png">') for _ in range(count)]
+
+
+@pytest.mark.parametrize("html", INLINE_SVG_TITLES)
+def test_svg_title_text_matches_bs4(html):
+    page = [("https://acme.com", html + '<img src="/img/acme-logo.png">')]
+    assert parity_check(page, "html.parser") == []
+
+
+def test_nested_svg_titles_left_open_do_not_crash():
+    assert find_logos_in_html("<svg><title><svg><title></svg> text ", "https://acme.com") == []
+
+
+def test_a_page_that_fails_to_parse_is_recorded_as_no_logo(tmp_path, monkeypatch):
+    def find_logos(html, base_url):
+        if "broken" in html:
+            raise ValueError("bad markup")
+        return ["https://globex.com/logo.png"]
+
+    monkeypatch.setattr(logo_extractor, "find_logos_in_html", find_logos)
+    assert extract_logo_entry("acme.com", "broken") == {"domain": "acme.com", "logo_url": "NO_LOGO_FOUND"}
+    with PageCache(str(tmp_path / "pages")) as cache:
+        cache.put("acme.com", "broken")
+        cache.put("globex.com", "<img>")
+        entries = sorted(iter_cached_logo_urls(cache, ["acme.com", "globex.com"], workers=1), key=lambda e: e["domain"])
+    assert [entry["logo_url"] for entry in entries] == ["NO_LOGO_FOUND", "https://globex.com/logo.png"]
+
+
+def test_scanner_ranks_like_bs4():
+    assert parity_check(fuzz_pages(3000), "html.parser") == []
+
+
+def test_head_mode_keeps_a_strong_top_candidate():
+    filler = "<script>" + "var x = 1;" * 20000 + "</script>"
+    html = ('<html><head><link rel="icon" href="/favicon.ico"></head><body>'
+            '<header><a class="logo"><img src="/img/acme-logo.svg"></a></header>' + filler +
+            '<footer><img src="/partners/visa.png"></footer></body></html>')
+    assert find_logos_in_html(html, "https://acme.com", mode="head")[:1] == ["https://acme.com/img/acme-logo.svg"]
+    assert top_choice_agreement([("https://acme.com", html)], "html.parser", "head") == 1
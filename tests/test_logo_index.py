@@ -0,0 +1,129 @@
+import os
+import threading
+import multiprocessing
+import numpy as np
+from logo_index import LogoIndex
+
+
+def vectors(n, dim=16, seed=0):
+    return np.random.default_rng(seed).standard_normal((n, dim)).astype(np.float32)
+
+
+def test_empty_index_returns_empty_results():
+    index = LogoIndex.create(16, max_elements=4)
+    labels, distances = index.knn_query(vectors(3), k=5)
+    assert labels.shape == (3, 0) and distances.shape == (3, 0)
+    positions, _ = index.knn_positions(vectors(2), [], k=3)
+    assert positions.shape == (2, 0)
+    assert index.similar(vectors(1)[0], k=5) == []
+    assert index.get_embeddings([]).shape == (0, 16)
+
+
+def test_upsert_is_addressable_by_domain(tmp_path):
+    index = LogoIndex.create(16, max_elements=4)
+    data = vectors(10)
+    index.upsert([f"d{i}.com" for i in range(10)], data)
+    assert index.similar(data[3], k=1)[0]["domain"] == "d3.com"
+    assert all(r["domain"] != "d3.com" for r in index.similar(data[3], k=3, exclude="d3.com"))
+    index.save(str(tmp_path / "index.bin"))
+    loaded = LogoIndex.load(str(tmp_path / "index.bin"))
+    np.testing.assert_allclose(loaded.get_embeddings(["d7.com"]), data[7:8])
+
+
+def test_queries_during_upserts_that_resize():
+    # Every upsert grows past capacity, so resize_index() runs while other threads query
+    index = LogoIndex.create(16, max_elements=2)
+    index.upsert(["seed.com"], vectors(1, seed=99))
+    errors = []
+    done = threading.Event()
+
+    def writer():
+        try:
+            for batch in range(40):
+                index.upsert([f"w{batch}-{i}.com" for i in range(8)], vectors(8, seed=batch))
+        except Exception as e:
+            errors.append(e)
+        finally:
+            done.set()
+
+    def reader():
+        query = vectors(4, seed=123)
+        try:
+            while not done.is_set():
+                labels, _ = index.knn_query(query, k=5)
+                assert labels.shape[0] == 4
+                index.similar(query[0], k=3)
+                index.get_embeddings(["seed.com"])
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=writer)] + [threading.Thread(target=reader) for _ in range(3)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert errors == []
+    assert len(index) == 1 + 40 * 8
+
+
+def test_a_slow_filtered_query_blocks_upserts_but_not_other_queries():
+    index = LogoIndex.create(16, max_elements=64)
+    data = vectors(20)
+    index.upsert([f"d{i}.com" for i in range(20)], data)
+    walking, release = threading.Event(), threading.Event()
+
+    def slow_filter(label):
+        # Stands in for a long filtered walk over a large index
+        walking.set()
+        release.wait(10)
+        return True
+
+    slow = threading.Thread(target=index.knn_query, args=(data[:1],), kwargs={"k": 1, "filter": slow_filter})
+    slow.start()
+    assert walking.wait(5)
+    results = []
+    query = threading.Thread(target=lambda: results.append(index.similar(data[3], k=1)))
+    upsert = threading.Thread(target=index.upsert, args=(["new.com"], vectors(1, seed=7)))
+    query.start()
+    query.join(5)
+    answered = not query.is_alive()
+    upsert.start()
+    upsert.join(0.5)
+    blocked = upsert.is_alive()
+    release.set()
+    for thread in (slow, query, upsert):
+        thread.join(10)
+    assert results == [[{"domain": "d3.com", "score": results[0][0]["score"]}]]
+    assert answered and blocked and "new.com" in index
+
+
+def save_repeatedly(path, worker):
+    index = LogoIndex.create(16, max_elements=8)
+    for batch in range(10):
+        index.upsert([f"w{worker}-{batch}-{i}.com" for i in range(4)], vectors(4, seed=worker * 100 + batch))
+        index.save(path)
+
+
+def load_repeatedly(path, stop):
+    while not stop.is_set():
+        # Whatever worker saved last, the index and its domain map must belong together
+        index = LogoIndex.load(path)
+        index.get_embeddings(index.domains())
+
+
+def test_workers_saving_to_one_path_never_mix_files(tmp_path):
+    path = str(tmp_path / "index.bin")
+    LogoIndex.create(16).save(path)
+    context = multiprocessing.get_context("spawn")
+    stop = context.Event()
+    savers = [context.Process(target=save_repeatedly, args=(path, w)) for w in range(3)]
+    loader = context.Process(target=load_repeatedly, args=(path, stop))
+    for process in savers + [loader]:
+        process.start()
+    for process in savers:
+        process.join(120)
+    stop.set()
+    loader.join(120)
+    assert [process.exitcode for process in savers + [loader]] == [0, 0, 0, 0]
+    assert len(LogoIndex.load(path)) == 40
+    assert not [name for name in os.listdir(tmp_path) if name.endswith(".tmp")]
@@ -0,0 +1,128 @@
+import socket
+import asyncio
+import httpx
+import pytest
+from outcome_store import OutcomeStore
+
+
+@pytest.fixture
+def outcomes(tmp_path):
+    store = OutcomeStore(str(tmp_path / "outcomes.sqlite"), retry_base=100, retry_max=1000)
+    yield store
+    store.close()
+
+
+def test_retry_window_doubles_and_success_clears(outcomes):
+    outcomes.record_many("crawl", {"dead.com": "unknown host"}, now=0)
+    outcomes.record_many("crawl", {"dead.com": "unknown host"}, now=10)
+    assert outcomes.entry("dead.com", "crawl")["retry_at"] == 10 + 200
+    assert outcomes.blocked(["dead.com", "ok.com"], ["crawl"], now=50) == {"dead.com"}
+    outcomes.record_success("dead.com", "crawl")
+    assert outcomes.entry("dead.com", "crawl") is None
+
+
+def unknown_host_error():
+    try:
+        try:
+            raise socket.gaierror(socket.EAI_NONAME, "Name or service not known")
+        except socket.gaierror as e:
+            raise httpx.ConnectError("[Errno -2] Name or service not known") from e
+    except httpx.ConnectError as e:
+        return e
+
+
+class FakeCrawler:
+    def __init__(self, html="", status_code=200, error=None):
+        self.html, self.status_code, self.error = html, status_code, error
+
+    async def arun(self, url, config=None):
+        if self.error:
+            raise self.error
+        return type("Result", (), {"html": self.html, "status_code": self.status_code, "response_headers": {}})()
+
+
+class FakeCache:
+    def entry(self, domain):
+        return None
+
+    def conditional_headers(self, entry):
+        return {}
+
+    def put(self, *args, **kwargs):
+        pass
+
+
+def crawl(handler, crawler):
+    scraper_crawl = pytest.importorskip("scraper_crawl")
+
+    async def run():
+        async with httpx.AsyncClient(transport=httpx.MockTransport(handler)) as client:
+            return await scraper_crawl.crawl_url_variants(
+                "acme.com", crawler, FakeCache(), set(), scraper_crawl.make_crawl_scheduler(), client)
+    return asyncio.run(run())
+
+
+def raise_error(error):
+    def handler(request):
+        raise error
+    return handler
+
+
+@pytest.mark.parametrize("handler, crawler, expected", [
+    (lambda r: httpx.Response(200), FakeCrawler("<html></html>"), (True, None)),
+    (raise_error(unknown_host_error()), FakeCrawler(), (False, "unknown host")),
+    (raise_error(httpx.ConnectTimeout("timed out")), FakeCrawler(), (False, None)),
+    (lambda r: httpx.Response(404), FakeCrawler("", status_code=404), (False, "HTTP 404")),
+    (lambda r: httpx.Response(503), FakeCrawler("", status_code=503), (False, None)),
+    (lambda r: httpx.Response(429), FakeCrawler("", status_code=429), (False, None)),
+    (lambda r: httpx.Response(200), FakeCrawler(error=TimeoutError("page timeout")), (False, None)),
+])
+def test_crawl_failures_are_definitive_only_for_unknown_hosts_and_4xx(handler, crawler, expected):
+    assert crawl(handler, crawler) == expected
+
+
+class FakeFallback:
+    def __init__(self, result):
+        self.result = result
+
+    async def submit(self, *args):
+        return self.result
+
+
+def download(outcomes, tmp_path, monkeypatch, direct_status, flaresolverr, playwright_result):
+    downloader = pytest.importorskip("flaresolverr_logo_download")
+    monkeypatch.setattr(downloader, "output_dir", str(tmp_path))
+
+    def handler(request):
+        if request.url.host == "localhost":
+            return flaresolverr(request)
+        return httpx.Response(direct_status, content=b"<html>not an image</html>")
+
+    async def run():
+        async with httpx.AsyncClient(transport=httpx.MockTransport(handler)) as client:
+            gates = {"direct": downloader.make_download_scheduler(), "flaresolverr": asyncio.Semaphore(1),
+                     "playwright": FakeFallback(playwright_result)}
+            entry = {"domain": "acme.com", "logo_url": "acme.com/logo.png"}
+            return await downloader.process_entry(client, entry, set(), gates, outcomes)
+    assert asyncio.run(run()) is False
+    return outcomes.entry("acme.com", "download")
+
+
+def flaresolverr_answers(status):
+    return lambda request: httpx.Response(200, json={"status": "ok", "solution": {"status": status, "response": ""}})
+
+
+def test_download_failure_recorded_when_every_attempt_is_definitive(outcomes, tmp_path, monkeypatch):
+    entry = download(outcomes, tmp_path, monkeypatch, 404, flaresolverr_answers(404), False)
+    assert entry is not None and "HTTP 404" in entry["reason"]
+
+
+@pytest.mark.parametrize("direct_status, flaresolverr, playwright_result", [
+    (404, raise_error(httpx.ConnectError("connection refused")), False),  # FlareSolverr isn't running
+    (404, flaresolverr_answers(404), None),  # no proxy or browser could run
+    (503, flaresolverr_answers(404), False),
+    (404, flaresolverr_answers(502), False),
+])
+def test_download_failure_not_recorded_when_anything_was_transient(outcomes, tmp_path, monkeypatch, direct_status,
+                                                                   flaresolverr, playwright_result):
+    assert download(outcomes, tmp_path, monkeypatch, direct_status, flaresolverr, playwright_result) is None
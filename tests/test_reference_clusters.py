@@ -0,0 +1,64 @@
+import os
+import numpy as np
+import pytest
+import clustering
+from array_store import ArrayStore
+from conftest import REPO_ROOT
+
+# Pairwise F1 against clusters.csv below which a change to embedding, graph or threshold is a regression
+MIN_REFERENCE_F1 = 0.8
+# How far the default threshold may be from the best one the sweep finds
+THRESHOLD_F1_SLACK = 0.02
+
+
+@pytest.fixture(scope="module")
+def dinov2():
+    torch = pytest.importorskip("torch")
+    transformers = pytest.importorskip("transformers")
+    # Only weights already in the Hugging Face cache (e.g. from running the API once); never downloads
+    try:
+        processor = transformers.AutoProcessor.from_pretrained("facebook/dinov2-base", local_files_only=True)
+        model = transformers.AutoModel.from_pretrained("facebook/dinov2-base", local_files_only=True).eval()
+    except OSError:
+        pytest.skip("facebook/dinov2-base is not in the local Hugging Face cache")
+    processor.size = {"height": 224, "width": 224}
+    processor.do_center_crop = False
+    return torch.device("cpu"), processor, model
+
+
+@pytest.fixture(scope="module")
+def committed_logos(dinov2, tmp_path_factory):
+    # Every committed logo, embedded once for all metrics (the cache file is shared by the tests below)
+    os.chdir(REPO_ROOT)
+    device, processor, model = dinov2
+    cache_path = str(tmp_path_factory.mktemp("embeddings") / "embedding_cache.npz")
+    domains = sorted({os.path.splitext(f)[0] for f in os.listdir("logos")})
+    paths, domains = clustering.get_logo_paths("logos", domains)
+    embeddings, domains = clustering.extract_features_cached(paths, domains, device, processor, model, cache_path=cache_path)
+    return cache_path, domains, np.asarray(embeddings)
+
+
+@pytest.mark.parametrize("metric", sorted(clustering.DEFAULT_THRESHOLDS))
+def test_clusters_agree_with_reference(dinov2, committed_logos, tmp_path, metric):
+    device, processor, model = dinov2
+    cache_path, domains, _ = committed_logos
+    store = ArrayStore(str(tmp_path / "embeddings"), (model.config.hidden_size,), np.float32)
+    try:
+        clusters = clustering.clustering(device, processor, model, domains, cache_path=cache_path,
+                                         index_path=None, metric=metric, embedding_store=store)
+    finally:
+        store.close()
+    agreement = clustering.compare_with_reference(clusters, domains)
+    assert agreement["f1"] >= MIN_REFERENCE_F1, agreement
+
+
+@pytest.mark.parametrize("metric", sorted(clustering.DEFAULT_THRESHOLDS))
+def test_default_threshold_is_calibrated(committed_logos, metric):
+    _, domains, embeddings = committed_logos
+    default = clustering.DEFAULT_THRESHOLDS[metric]
+    sweep = clustering.threshold_sweep(embeddings, domains, metric=metric)
+    f1 = {threshold: agreement["f1"] for threshold, agreement in sweep}
+    if default not in f1:
+        f1[default] = clustering.threshold_sweep(embeddings, domains, metric=metric, thresholds=[default])[0][1]["f1"]
+    best = max(f1, key=f1.get)
+    assert f1[default] >= f1[best] - THRESHOLD_F1_SLACK, f"best {metric} threshold is {best} (f1={f1[best]:.3f}), default {default} has f1={f1[default]:.3f}"
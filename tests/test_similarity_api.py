@@ -0,0 +1,45 @@
+import threading
+import numpy as np
+import pytest
+from array_store import ArrayStore
+from logo_index import LogoIndex
+
+api = pytest.importorskip("logo_similarity_api")
+TestClient = pytest.importorskip("fastapi.testclient").TestClient
+
+
+def vectors(n, seed=0):
+    return np.random.default_rng(seed).standard_normal((n, 16)).astype(np.float32)
+
+
+@pytest.fixture
+def worker(tmp_path, monkeypatch):
+    # One API worker: its own index, the embedding store every worker shares
+    monkeypatch.setattr(api, "SIMILARITY_METRIC", "l2")
+    store = ArrayStore(str(tmp_path / "store"), (16,), np.float32)
+    store.put_many(["a.com", "b.com"], vectors(2))
+    index = LogoIndex.create(16)
+    index.upsert(["a.com"], store.get_many(["a.com"])[0])
+    state = api.app.state
+    state.ready, state.load_error = True, None
+    state.embeddings, state.logo_index = store, index
+    state.index_revision, state.sync_lock = None, threading.Lock()
+    yield state
+    store.close()
+
+
+def test_index_catches_up_with_the_shared_store(worker):
+    assert api.sync_index_with_store(worker) == 1 and "b.com" in worker.logo_index
+    assert api.sync_index_with_store(worker) == 0
+    other_worker = ArrayStore(worker.embeddings.path, (16,), np.float32)
+    other_worker.put("c.com", vectors(1, seed=1)[0])
+    other_worker.close()
+    assert api.sync_index_with_store(worker) == 1 and len(worker.logo_index) == 3
+
+
+def test_similar_finds_domains_another_worker_indexed(worker):
+    client = TestClient(api.app)
+    response = client.get("/similar", params={"domain": "b.com", "k": 1})
+    assert response.status_code == 200
+    assert [r["domain"] for r in response.json()["results"]] == ["a.com"]
+    assert client.get("/similar", params={"domain": "nowhere.com"}).status_code == 404
@@ -0,0 +1,56 @@
+import json
+import pytest
+import web_scraping
+from page_cache import PageCache
+
+PAGES = {
+    "acme.com": '<header><img src="/acme-logo.svg"></header>',
+    "globex.com": '<header><img src="/globex-logo.png"></header>',
+}
+
+
+class TrackedCache(PageCache):
+    opened = []
+
+    def __init__(self, root):
+        super().__init__(root)
+        self.closed = False
+        TrackedCache.opened.append(self)
+
+    def close(self):
+        self.closed = True
+        super().close()
+
+
+@pytest.fixture
+def default_cache(tmp_path, monkeypatch):
+    root = str(tmp_path / "pages")
+    with PageCache(root) as cache:
+        for domain, html in PAGES.items():
+            cache.put(domain, html)
+    TrackedCache.opened = []
+    monkeypatch.setattr(web_scraping, "PageCache", lambda: TrackedCache(root))
+    return TrackedCache.opened
+
+
+def test_stream_logo_paths_closes_the_cache_it_opened(default_cache, tmp_path):
+    output = tmp_path / "logo_paths.jsonl"
+    entries = list(web_scraping.stream_logo_paths(PAGES, str(output), workers=1))
+    assert sorted(e["domain"] for e in entries) == sorted(PAGES)
+    assert [json.loads(line) for line in output.read_text().splitlines()] == entries
+    assert [cache.closed for cache in default_cache] == [True]
+
+
+def test_stream_logo_paths_closes_the_cache_when_stopped_early(default_cache):
+    stream = web_scraping.stream_logo_paths(PAGES, workers=1)
+    next(stream)
+    stream.close()
+    assert [cache.closed for cache in default_cache] == [True]
+
+
+def test_stream_logo_paths_leaves_a_callers_cache_open(default_cache, tmp_path):
+    # Even an empty one, which is falsy, is used rather than replaced
+    cache = TrackedCache(str(tmp_path / "empty"))
+    assert list(web_scraping.stream_logo_paths(PAGES, cache=cache, workers=1)) == []
+    assert default_cache == [cache] and not cache.closed
+    cache.close()
@@ -1,47 +1,48 @@
 import os
 import json
-from logo_extractor import extract_logo_url_from_html
+from logo_extractor import iter_cached_logo_urls, EXTRACT_WORKERS
+from page_cache import PageCache
+from logo_api_fallback import fetch_logos_for_domains
+from outcome_store import OutcomeStore
 from dotenv import load_dotenv
 import requests
-from io import BytesIO
-from PIL import Image
-import time
+from workspace import Workspace
+from image_ingest import save_logo
 
 load_dotenv()
-LOGODEV_API_KEY = os.getenv("LOGODEV_API_KEY")
 
-def run_scraper():
-  os.system('python scraper_crawl.py')
+def run_scraper(domains, crawler=None, outcomes=None):
+  # In-process crawl; `crawler` is a running scraper_crawl.CrawlerService to reuse its warm browser
+  from scraper_crawl import crawl_domains_sync
+  return crawl_domains_sync(domains, service=crawler, outcomes=outcomes)
 
-def extract_logo_paths_from_html(folder_path, domains):
-    # Normalize domain list
+def stream_logo_paths(domains, output_path=None, cache=None, workers=EXTRACT_WORKERS, outcomes=None):
+    # Yields each usable logo path as soon as its page is parsed, appending it to `output_path` (JSON Lines)
     domains = set(d.strip().lower() for d in domains)
-
-    # Rename www-prefixed files
-    for filename in os.listdir(folder_path):
-        if filename.startswith('www.'):
-            new_name = filename.replace('www.', '', 1)
-            old_path = os.path.join(folder_path, filename)
-            new_path = os.path.join(folder_path, new_name)
-            os.rename(old_path, new_path)
-            print(f'Renamed: {filename} -> {new_name}')
-
-    logos = extract_logo_url_from_html(folder_path, domains)
-
-    # Normalize and filter logos
-    filtered_logos = []
-    for entry in logos:
-        logo = entry['logo_url'].replace("https://", "").replace("http://", "")
-        if logo != 'NO_LOGO_FOUND' and entry['domain'] in domains:
+    # A cache we open here is closed with the generator, also when the caller stops early
+    own_cache = cache is None
+    cache = PageCache() if own_cache else cache
+    out = open(output_path, "w", encoding="utf-8") if output_path else None
+    try:
+        for entry in iter_cached_logo_urls(cache, domains, workers=workers):
+            # Normalize and filter logos
+            logo = entry['logo_url'].replace("https://", "").replace("http://", "")
+            if entry['domain'] not in domains:
+                continue
+            if outcomes:
+                outcomes.record_many("extract", {entry['domain']: "no logo on page" if logo == 'NO_LOGO_FOUND' else None})
+            if logo == 'NO_LOGO_FOUND':
+                continue
             entry['logo_url'] = logo
-            filtered_logos.append(entry)
-
-    with open("logos_image_paths.json", "w") as f:
-        json.dump(filtered_logos, f)
-
-
-def download_logos_from_logo_paths():
-  os.system('python flaresolverr_logo_download.py')
+            if out:
+                out.write(json.dumps(entry) + "\n")
+                out.flush()
+            yield entry
+    finally:
+        if out:
+            out.close()
+        if own_cache:
+            cache.close()
 
 def get_failed_domains(domains):
    downloaded_domains = [os.path.splitext(f)[0] for f in os.listdir('logos') if os.path.isfile(os.path.join('logos', f))]
@@ -49,104 +50,6 @@ def get_failed_domains(domains):
    return failed_domains
 
 
-def is_valid_image_url(url, content=None):
-    try:
-        if content is None:
-            response = requests.get(url, timeout=5)
-            if response.status_code != 200:
-                return False
-            content = response.content
-        img = Image.open(BytesIO(content))
-        return img.width > 1 and img.height > 1
-    except Exception as e:
-        print(f"⚠️ Image validation failed for {url}: {e}")
-        return False
-
-def get_logo_logodev(domain):
-    url = f"https://img.logo.dev/{domain}?token={LOGODEV_API_KEY}&fallback=404"
-    try:
-        response = requests.get(url, timeout=10)
-        if response.status_code == 200 and response.headers["Content-Type"].startswith("image"):
-            return url, 200
-        elif response.status_code == 202:
-            print(f"🕒 Logo.dev is processing {domain} (202)")
-            return None, 202
-        elif response.status_code == 404:
-            print(f"🚫 Logo.dev: No logo for {domain} (404)")
-            return None, 404
-        else:
-            print(f"🟥 Logo.dev failed for {domain} (status {response.status_code})")
-            return None, response.status_code
-    except Exception as e:
-        print(f"⚠️ Logo.dev request error for {domain}: {e}")
-        return None, None
-
-def get_logo_clearbit(domain):
-    url = f"https://logo.clearbit.com/{domain}"
-    try:
-        response = requests.get(url, timeout=10)
-        if response.status_code == 200 and response.headers["Content-Type"].startswith("image"):
-            if is_valid_image_url(url, response.content):
-                return url, 200
-            else:
-                print(f"🟥 Clearbit returned invalid image for {domain}")
-                return None, 200
-        else:
-            print(f"🟥 Clearbit failed for {domain} (status {response.status_code})")
-            return None, response.status_code
-    except Exception as e:
-        print(f"⚠️ Clearbit error for {domain}: {e}")
-        return None, None
-
-def fetch_logos_for_domains(domains, use_logodev=True, use_clearbit=True):
-    results = []
-    pending_logos = []
-
-    # Initial lookup
-    for domain in domains:
-        print(f"🔍 Looking for logo for: {domain}")
-        logo_url = None
-
-        # Try Logo.dev
-        if use_logodev:
-            logo_url_dev, status = get_logo_logodev(domain)
-            if logo_url_dev:
-                logo_url = logo_url_dev
-            elif status == 202:
-                print(f"⏳ Logo.dev is processing {domain}")
-                pending_logos.append(domain)
-
-        # Try Clearbit if no logo yet
-        if not logo_url and use_clearbit:
-            logo_url_clearbit, status = get_logo_clearbit(domain)
-            if logo_url_clearbit:
-                logo_url = logo_url_clearbit
-
-        results.append({
-            "domain": domain,
-            "logo_url": logo_url  # might still be None here
-        })
-
-    # Retry pending domains from Logo.dev
-    if pending_logos:
-        print(f"\n🔁 Waiting to recheck {len(pending_logos)} pending logos from Logo.dev...")
-        time.sleep(240)  # wait 4 minutes
-        for domain in pending_logos:
-            logo_url, status = get_logo_logodev(domain)
-            if logo_url:
-                print(f"✅ Logo now available for {domain}")
-                # Update the entry in results
-                for entry in results:
-                    if entry["domain"] == domain and not entry["logo_url"]:
-                        entry["logo_url"] = logo_url
-
-    # Final fallback: set "LOGO_NOT_FOUND" if nothing was found
-    for entry in results:
-        if not entry["logo_url"]:
-            entry["logo_url"] = 'NO_LOGO_FOUND'
-
-    return results
-
 def download_logos(logo_data, save_dir='logos'):
 
     for item in logo_data:
@@ -160,35 +63,60 @@ def download_logos(logo_data, save_dir='logos'):
         try:
             response = requests.get(logo_url, timeout=10)
             if response.status_code == 200:
-                file_path = os.path.join(save_dir, f"{domain}.png")
-                with open(file_path, 'wb') as f:
-                    f.write(response.content)
-                print(f"✅ Saved logo for {domain}")
+                if save_logo(response.content, domain, save_dir):
+                    print(f"✅ Saved logo for {domain}")
             else:
                 print(f"⚠️ Failed to download logo for {domain} (status {response.status_code})")
         except Exception as e:
             print(f"⚠️ Error downloading logo for {domain}: {e}")
 
 
-def get_logos(domains):
-    with open("domains.txt", "w") as f:
-        for domain in domains:
-            f.write(domain + "\n")
-
-    ## Scrape domains using crawl4ai
-    run_scraper()
+def get_logos(domains, progress=None, workspace=None, crawler=None, downloader=None):
+    # progress(stage, status="running", **details) lets callers follow the pipeline
+    progress = progress or (lambda stage, status="running", **details: None)
 
-    ## Extract logo paths from html
-    extract_logo_paths_from_html('scraped_domains_html', domains)
+    # Each run gets its own logo-path list; logos/ and the page cache are shared
+    own_workspace = workspace is None
+    workspace = workspace or Workspace()
 
-    ## Download logos 
-    download_logos_from_logo_paths()
-
-    ## Get failed domains
-    failed_domains = get_failed_domains(domains)
-
-    ## Fallback to Logo.dev and Clearbit for failed domains
-    failed_domains = fetch_logos_for_domains(failed_domains)
- 
-    download_logos(failed_domains)
+    outcomes = OutcomeStore()
 
+    try:
+        ## Domains whose site is known to be dead or logo-less skip straight to the API fallback
+        skipped = outcomes.blocked(domains, ["crawl", "extract"])
+        site_domains = [domain for domain in domains if domain not in skipped]
+
+        ## Scrape domains using crawl4ai
+        progress("scrape")
+        crawl_results = run_scraper(site_domains, crawler=crawler, outcomes=outcomes)
+        progress("scrape", "done", crawled=sum(crawl_results.values()), skipped=len(skipped))
+
+        ## Extract logo paths from html and download them as they are found
+        from flaresolverr_logo_download import download_entries
+        progress("extract")
+        progress("download")
+        found = []
+
+        def extracted_logo_paths():
+            for entry in stream_logo_paths(site_domains, workspace.logo_paths_file, outcomes=outcomes):
+                found.append(entry)
+                yield entry
+            progress("extract", "done", logos_found=len(found))
+
+        # `downloader` is a running DownloadService whose browser pool outlives this run
+        download_entries(extracted_logo_paths(), outcomes=outcomes, service=downloader)
+
+        ## Get failed domains
+        failed_domains = get_failed_domains(domains)
+        progress("download", "done", failed=len(failed_domains))
+
+        ## Fallback to Logo.dev and Clearbit for failed domains
+        progress("fallback", domains=len(failed_domains))
+        failed_domains = fetch_logos_for_domains(failed_domains, outcomes=outcomes)
+
+        download_logos(failed_domains)
+        progress("fallback", "done")
+    finally:
+        outcomes.close()
+        if own_workspace:
+            workspace.cleanup()
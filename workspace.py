@@ -0,0 +1,55 @@
+import os
+import uuid
+import shutil
+import tempfile
+from contextlib import contextmanager
+
+WORKSPACES_DIR = "workspaces"
+
+
+@contextmanager
+def atomic_path(path):
+    # A unique temp file name next to `path`, renamed into place once the caller has written it;
+    # for writers that want a file name rather than a file object (e.g. hnswlib's save_index)
+    directory = os.path.dirname(path) or "."
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=os.path.basename(path) + ".", suffix=".tmp")
+    os.close(fd)
+    try:
+        yield tmp_path
+        os.chmod(tmp_path, 0o644)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+@contextmanager
+def atomic_output(path, mode="wb"):
+    # Write to a unique temp file next to `path`, then rename it into place
+    with atomic_path(path) as tmp_path:
+        with open(tmp_path, mode, **({} if "b" in mode else {"encoding": "utf-8"})) as f:
+            yield f
+
+
+def atomic_write_bytes(path, data):
+    with atomic_output(path, "wb") as f:
+        f.write(data)
+
+
+def atomic_write_text(path, text):
+    with atomic_output(path, "w") as f:
+        f.write(text)
+
+
+class Workspace:
+    # Private scratch area for one pipeline run: its own logo-path list
+    def __init__(self, job_id=None, root=WORKSPACES_DIR):
+        self.job_id = job_id or uuid.uuid4().hex
+        self.path = os.path.join(root, self.job_id)
+        os.makedirs(self.path, exist_ok=True)
+        self.logo_paths_file = os.path.join(self.path, "logos_image_paths.jsonl")
+
+    def cleanup(self):
+        shutil.rmtree(self.path, ignore_errors=True)